@@ -1,9 +1,11 @@
+import asyncio
 import base64
 
 import pandas as pd
 import streamlit as st
 
-from src.aws.nodemanager.nodemanager import Task
+from src.aws.utils import config
+from src.aws.utils.connection import submit
 
 
 def get_table_download_link(df):
@@ -17,20 +19,45 @@ def get_table_download_link(df):
     return f'<a href="data:file/csv;base64,{b64}">Download csv file</a>'
 
 
+def submit_tasks(texts):
+    """Submits the texts as interactive tasks to the node manager
+    in:  list of texts
+    out: list of responses of the node manager
+    """
+    loop = asyncio.new_event_loop()
+    try:
+        return [loop.run_until_complete(submit(config.FRONT_END_NODE_MANAGER, text,
+                                               priority=config.INTERACTIVE_PRIORITY))
+                for text in texts]
+    finally:
+        loop.close()
+
+
 st.sidebar.title("Settings")
 taskType = st.sidebar.selectbox("Data to upload", ['CSV', 'Text'], index=1)
-task = ""
-if taskType is 'CSV':
+texts = []
+if taskType == 'CSV':
     uploaded_data = st.file_uploader("Choose a CSV file", type='csv')
     if uploaded_data:
-        st.markdown()
         inputDataFrame = pd.read_csv(uploaded_data)
-        task = Task(inputDataFrame, Task.CSV)
-    # TaskPool.add_task(task)
+        column = 'Input' if 'Input' in inputDataFrame else inputDataFrame.columns[0]
+        texts = inputDataFrame[column].astype(str).tolist()
 else:
     inputTextSnippet = st.text_area("Text to be classified")
-    task = Task(inputTextSnippet, Task.TEXT)
-    # TaskPool.add_task(task)
+    if inputTextSnippet:
+        texts = [inputTextSnippet]
+
+task = None
+if texts and st.button("Submit"):
+    responses = submit_tasks(texts)
+    # Held tasks are added by the node manager once the rate limit allows it.
+    submitted = [response['task'] for response in responses
+                 if response['command'] in ('submitted', 'held')]
+    st.write("Submitted {} of {} tasks.".format(len(submitted), len(texts)))
+    for response in responses:
+        if response['command'] != 'submitted':
+            st.write("Not submitted: {}".format(dict(response)))
+    task = submitted[0] if submitted else None
 
 # text,labels="OUTPUT FROM WORKER RUN COMES HERE"
 example_output = pd.DataFrame(
@@ -44,7 +71,6 @@ insult = '<mark style="background-color:gray;">Insult</mark>' if False else '<ma
 identity_hate = '<mark style="background-color:gray;">Identity Hate</mark>' if True else '<mark style="background-color:green;">Identity Hate</mark>'
 
 if task:
-    result = task.get_task_data()
     st.markdown(f'<p>{toxic}{severe_toxic}{obscene}{threat}{insult}{identity_hate}</p>',
                 unsafe_allow_html=True)
     st.markdown(get_table_download_link(example_output), unsafe_allow_html=True)
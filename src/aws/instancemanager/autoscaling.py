@@ -0,0 +1,220 @@
+"""
+Module for the autoscaling policies of the Instance Manager.
+"""
+import math
+from abc import ABC, abstractmethod
+
+import aws.utils.config as config
+from aws.utils.clock import time
+from aws.resourcemanager.resourcemanager import log_info, log_metric
+
+
+class ScalingPolicy(ABC):
+    """
+    Decides how many workers should be active. Policies observe the heartbeats of the node managers
+    and the boot latency of workers, and return a target number of workers. The difference with
+    the active workers is turned into a single action.
+    """
+    name = None
+
+    def observe(self, heartbeat):
+        """
+        Observe the heartbeat of a node manager.
+        :param heartbeat: Full heartbeat of a node manager.
+        """
+
+    def observe_boot(self, latency):
+        """
+        Observe the time between starting a worker and its first heartbeat.
+        :param latency: Boot latency in seconds.
+        """
+
+    def remove_node_manager(self, node_manager):
+        """
+        Forget the observations of a node manager that is no longer alive.
+        """
+
+    @abstractmethod
+    def target_workers(self, window, current_workers, max_workers):
+        """
+        Get the number of workers that should be active.
+        :param window: TimeWindow with the aggregated node manager heartbeats.
+        :param current_workers: Workers that are pending or running.
+        :param max_workers: Number of worker instances available.
+        :return: Target number of workers.
+        """
+        raise NotImplementedError("Policy has not implemented target_workers.")
+
+    def get_action(self, window, current_workers: list, max_workers: int):
+        """
+        Get the action to reach the target number of workers.
+        :return: {'create': number of workers}, {'kill': workers with the least tasks} or {}.
+        """
+        target = min(self.target_workers(window, current_workers, max_workers), max_workers)
+        if target != len(current_workers):
+            log_metric({'scaling': {'policy': self.name, 'current': len(current_workers),
+                                    'target': target}})
+        if target > len(current_workers):
+            return {'create': target - len(current_workers)}
+        if target < len(current_workers):
+            allocation = window.worker_allocation
+            by_tasks = sorted(current_workers, key=lambda worker: allocation.get(worker, 0))
+            return {'kill': by_tasks[:len(current_workers) - target]}
+        return {}
+
+
+class ThresholdPolicy(ScalingPolicy):
+    """
+    Adds or removes a single worker when the mean number of tasks per worker in the time window
+    crosses MAX_JOBS_PER_WORKER or MIN_JOBS_PER_WORKER.
+    """
+    name = 'threshold'
+
+    def target_workers(self, window, current_workers, max_workers):
+        current = len(current_workers)
+        number_of_workers = len(window.worker_allocation)
+        if window.mean_total_tasks[-1] > 0 and number_of_workers == 0:
+            log_info("[LB] There was no worker, but there is work to do.")
+            return current + 1  # There was no worker, but there is work to do.
+
+        mean_task_per_worker = window.mean()
+
+        # Check if there are underloaded workers.
+        if config.MIN_JOBS_PER_WORKER > mean_task_per_worker:
+            if current == 0:
+                return current  # There is no worker to kill.
+            if window.mean_total_tasks[-1] > 0 and number_of_workers == 1:
+                return current  # If there is still work and only one worker to do it.
+            if current < number_of_workers:
+                return current  # An instance was already killed, wait for the next HB.
+            log_info("[LB] The instance with the least tasks will be killed.")
+            return current - 1
+
+        # Check if there are overloaded workers or if the node manager rejects tasks.
+        if mean_task_per_worker > config.MAX_JOBS_PER_WORKER or window.overloaded:
+            if current == max_workers:
+                return current  # No new worker can be created, if we already reached the limit.
+            if current > number_of_workers:
+                return current  # An instance was already created, wait for the next HB.
+            log_info("[LB] A new instance is needed for load balancing.")
+            return current + 1
+        return current
+
+
+class HoltForecast:
+    """
+    Double exponential smoothing (Holt) of an irregularly sampled series, with the trend per second.
+    """
+
+    def __init__(self, alpha, beta):
+        self.alpha = alpha
+        self.beta = beta
+        self.level = None
+        self.trend = 0.0
+        self._time = None
+
+    def update(self, value, sample_time):
+        if self.level is None:
+            self.level, self._time = value, sample_time
+            return
+        elapsed = sample_time - self._time
+        if elapsed <= 0:
+            return
+        previous = self.level
+        self.level = self.alpha * value + (1 - self.alpha) * (previous + self.trend * elapsed)
+        self.trend = self.beta * (self.level - previous) / elapsed + (1 - self.beta) * self.trend
+        self._time = sample_time
+
+    def forecast(self, horizon):
+        """
+        Forecast the value a number of seconds after the last sample.
+        """
+        if self.level is None:
+            return 0.0
+        return self.level + self.trend * horizon
+
+
+class PredictivePolicy(ScalingPolicy):
+    """
+    Computes the target number of workers from a queueing model. The arrival rate of tasks is
+    forecast with Holt smoothing one worker boot latency ahead, since that is when new workers
+    become available. The needed workers follow from the offered load (arrival rate times service
+    time) at SCALING_TARGET_UTILIZATION, plus the workers needed to drain the waiting tasks within
+    SCALING_DRAIN_TIME seconds.
+    Workers are only removed after SCALING_SCALE_IN_COOLDOWN seconds without scaling out and while
+    the workers are not busy according to their CPU usage.
+    """
+    name = 'predictive'
+
+    def __init__(self):
+        self.arrival = HoltForecast(config.SCALING_ALPHA, config.SCALING_BETA)  # Tasks/second.
+        self.service_time = None  # EWMA of the run time of tasks in seconds.
+        self.boot_latency = config.SCALING_BOOT_LATENCY  # EWMA of the worker boot latency.
+        self.cpu_usage = 0.0  # Mean CPU usage of the workers.
+        self._arrived = {}  # Node manager: (heartbeat time, tasks arrived).
+        self._rates = {}  # Node manager: arrival rate.
+        self._waiting = {}  # Node manager: tasks waiting.
+        self._last_scale_out = 0
+
+    @staticmethod
+    def _ewma(average, value):
+        if average is None:
+            return value
+        return config.SCALING_ALPHA * value + (1 - config.SCALING_ALPHA) * average
+
+    def observe(self, heartbeat):
+        node_manager, heartbeat_time = heartbeat['instance_id'], heartbeat['time']
+        arrived = heartbeat.get('tasks_arrived', 0)
+        previous = self._arrived.get(node_manager)
+        self._arrived[node_manager] = (heartbeat_time, arrived)
+        if previous and heartbeat_time > previous[0]:
+            # A restarted node manager counts from zero again.
+            self._rates[node_manager] = max(0, arrived - previous[1]) / \
+                (heartbeat_time - previous[0])
+            self.arrival.update(sum(self._rates.values()), heartbeat_time)
+        self._waiting[node_manager] = heartbeat['tasks_waiting']
+        if heartbeat.get('service_time'):
+            self.service_time = self._ewma(self.service_time, heartbeat['service_time'])
+        cpu = [health[2] for health in heartbeat.get('worker_health', {}).values()]
+        if cpu:
+            self.cpu_usage = sum(cpu) / len(cpu)
+
+    def observe_boot(self, latency):
+        self.boot_latency = self._ewma(self.boot_latency, latency)
+
+    def remove_node_manager(self, node_manager):
+        for values in (self._arrived, self._rates, self._waiting):
+            values.pop(node_manager, None)
+
+    def target_workers(self, window, current_workers, max_workers):
+        current = len(current_workers)
+        waiting = sum(self._waiting.values())
+        if self.service_time is None:
+            # No task finished yet, so the load cannot be estimated. Make sure there is a worker.
+            return max(current, 1) if waiting else current
+        arrival_rate = max(0.0, self.arrival.forecast(self.boot_latency))
+        busy_workers = arrival_rate * self.service_time + \
+            waiting * self.service_time / config.SCALING_DRAIN_TIME
+        target = math.ceil(busy_workers / config.SCALING_TARGET_UTILIZATION)
+        if waiting or arrival_rate:
+            target = max(target, 1)
+        if target > current:
+            self._last_scale_out = time()
+        elif target < current and (time() - self._last_scale_out < config.SCALING_SCALE_IN_COOLDOWN
+                                    or self.cpu_usage > config.SCALING_CPU_HIGH):
+            target = current
+        return target
+
+
+POLICIES = {policy.name: policy for policy in (ThresholdPolicy, PredictivePolicy)}
+
+
+def create_policy(name=None):
+    """
+    Create a scaling policy by name.
+    :param name: Name of the policy. If None, SCALING_POLICY is used.
+    """
+    name = name if name else config.SCALING_POLICY
+    if name not in POLICIES:
+        raise ValueError("Unknown scaling policy: {}".format(name))
+    return POLICIES[name]()
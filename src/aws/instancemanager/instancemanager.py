@@ -2,21 +2,31 @@
 Module for the Instance Manager.
 """
 import asyncio
+import os
+import sys
 import time
 import traceback
 from contextlib import suppress
-from time import time
 from collections import deque
 
 import boto3
 from ec2_metadata import ec2_metadata
 
 import aws.utils.config as config
+from aws.utils.clock import time
 import aws.utils.connection as con
 from aws.resourcemanager.resourcemanager import log_metric, log_info, log_warning, log_error, \
     log_exception, ResourceManagerCore
+from aws.instancemanager.autoscaling import create_policy
 from aws.utils.botoutils import BotoInstanceReader
-from aws.utils.packets import Packet, HeartBeatPacket
+from aws.utils.controlplane import ControlPlaneClient
+from aws.utils.deadlines import DeadlineHeap
+from aws.utils.hashring import ConsistentHashRing
+from aws.utils.heartbeat import AdaptiveInterval, heartbeat_timeout
+from aws.utils.localcloud import LocalCloud
+from aws.utils.metrics import REGISTRY
+from aws.utils.packets import Packet, HeartBeatPacket, CommandPacket
+from aws.utils.registry import InstanceRegistry
 from aws.utils.state import InstanceState
 
 
@@ -25,12 +35,16 @@ class Instances:
     # <instance_id>:  <InstanceState>
 
     def __init__(self):
-        self._node_managers = {}
-        self._workers = {}
+        self.registry = InstanceRegistry()  # States of the node managers and workers.
+        self._ring = None  # Cached hash ring of the running node managers.
+        self._ring_version = None
         self._last_heartbeat = {}
+        self._heartbeat_timeout = {}  # Instance id: timeout matching its heartbeat interval.
         self._start_signal = {}
         self.ip_addresses = {}
         self.charge_time = {'instance_manager': time()}
+        self.worker_node_manager = {}  # Worker: node manager the worker is connected to.
+        self.deadlines = DeadlineHeap()  # Instance id: next time its liveness should be checked.
 
     def get_all(self, instance_type, filter_state=None):
         """
@@ -39,31 +53,31 @@ class Instances:
         :param filter_state: State you would like to filter for.
         :return:
         """
-        nodes = self.get_nodes(instance_type)
         if filter_state:
-            if isinstance(filter_state, int):
-                filter_state = [filter_state]
-            nodes = [key for (key, value) in nodes.items() if value.is_any(filter_state)]
-        return nodes
+            return self.registry.get_all(self._role(instance_type), filter_state)
+        return self.get_nodes(instance_type)
+
+    def get_type(self, instance_id):
+        return self.registry.get_role(instance_id) or 'worker'
+
+    @staticmethod
+    def _role(instance_type):
+        return 'node_manager' if instance_type == 'node_manager' else 'worker'
 
     def get_nodes(self, instance_type):
-        if instance_type == 'node_manager':
-            return self._node_managers
-        return self._workers
+        return self.registry.get_nodes(self._role(instance_type))
 
     def is_state(self, instance_id, instance_type: str, state: int):
-        instance: InstanceState = self.get_nodes(instance_type).get(instance_id, None)
-        if not instance:
-            return False
-        return instance.is_state(state)
+        return self.registry.is_state(instance_id, self._role(instance_type), state)
 
     def set_state(self, instance_id, instance_type, state: InstanceState):
-        nodes = self.get_nodes(instance_type)
-        old_state = nodes.get(instance_id, None)
+        old_state = self.registry.get_state(instance_id)
         if not old_state or not state.is_state(old_state):
-            nodes[instance_id] = state
+            self.registry.set_state(instance_id, self._role(instance_type), state)
             log_info(
                 "State of instance {} set from {} to {}.".format(instance_id, old_state, state))
+            if state.is_any([InstanceState.RUNNING, InstanceState.PENDING]):
+                self.deadlines.schedule(instance_id, time())  # Check its liveness right away.
 
     def set_ip(self, instance_id, ip_address):
         log_info("IP address of {} set to {}.".format(instance_id, ip_address))
@@ -79,8 +93,7 @@ class Instances:
         :param filter_state: Check for the specified state in instances.
         :return: Boolean indicating if such an instance is found.
         """
-        return len(
-            self.get_all(instance_type=instance_type, filter_state=filter_state)) > 0
+        return self.registry.has(self._role(instance_type), filter_state)
 
     def has_instance_not_running(self, instance_type):
         """
@@ -103,6 +116,44 @@ class Instances:
                            state=boto_instance.state)
             self.set_ip(instance_id=boto_instance.instance_id, ip_address=boto_instance.public_ip)
 
+    def get_node_manager_ring(self):
+        """
+        Get a consistent hash ring of the running node managers. The ring is only rebuilt when a
+        node manager changed state.
+        """
+        version = self.registry.version('node_manager')
+        if self._ring is None or self._ring_version != version:
+            self._ring = ConsistentHashRing(self.get_all('node_manager', [InstanceState.RUNNING]))
+            self._ring_version = version
+        return self._ring
+
+    def assign_node_manager(self, worker, ring=None):
+        """
+        Get the node manager of a worker. Workers without a node manager are assigned to one
+        through consistent hashing.
+        :param worker: Instance id of the worker.
+        :param ring: Optional hash ring of the running node managers.
+        :return: Instance id of the node manager or None if no node manager is running.
+        """
+        node_manager = self.worker_node_manager.get(worker)
+        if node_manager and self.is_state(node_manager, 'node_manager', InstanceState.RUNNING):
+            return node_manager
+        ring = ring if ring is not None else self.get_node_manager_ring()
+        node_manager = ring.get(worker)
+        if node_manager:
+            self.worker_node_manager[worker] = node_manager
+        return node_manager
+
+    def get_workers_of(self, node_manager, filter_state):
+        """
+        Get the workers of a specific node manager.
+        :param node_manager: Instance id of the node manager.
+        :param filter_state: State you would like to filter for.
+        """
+        ring = self.get_node_manager_ring()
+        return [worker for worker in self.get_all('worker', filter_state=filter_state)
+                if self.assign_node_manager(worker, ring) == node_manager]
+
     def get_worker_split(self):
         """
         Get a tuple of (1) workers PENDING or RUNNING and (2) workers STOPPING or STOPPED.
@@ -120,7 +171,8 @@ class Instances:
     def __str__(self):
         return "All instances:" \
                "  node_managers: {}" \
-               "  workers: {}".format(str(self._node_managers), str(self._workers))
+               "  workers: {}".format(str(self.get_nodes('node_manager')),
+                                      str(self.get_nodes('worker')))
 
     def get_last_heartbeat(self, instance_id):
         return self._last_heartbeat.get(instance_id, None)
@@ -128,12 +180,51 @@ class Instances:
     def set_last_heartbeat(self, heartbeat):
         instance_id = heartbeat['instance_id']
         self._last_heartbeat[instance_id] = heartbeat['time']
+        self._heartbeat_timeout[instance_id] = heartbeat_timeout(heartbeat.get('interval'))
+        self._schedule_heartbeat(instance_id, heartbeat['instance_type'])
+
+    def _schedule_heartbeat(self, instance_id, instance_type):
+        """
+        Schedule the liveness check of an instance at its heartbeat expiry. A pending instance is
+        checked right away, so it is marked as running.
+        """
+        if self.is_state(instance_id, instance_type, InstanceState.RUNNING):
+            self.deadlines.schedule(instance_id, self.heartbeat_deadline(instance_id))
+        else:
+            self.deadlines.schedule(instance_id, time())
+
+    def heartbeat_deadline(self, instance_id):
+        return self._last_heartbeat[instance_id] + self.get_heartbeat_timeout(instance_id)
+
+    def get_heartbeat_timeout(self, instance_id):
+        return self._heartbeat_timeout.get(instance_id, config.HEART_BEAT_TIMEOUT)
+
+    def update_worker_health(self, worker_health, interval=None):
+        """
+        Update the liveness of workers from the summary in a node manager heartbeat.
+        :param worker_health: Dict of workers and their [heartbeat time, program state, cpu usage,
+        mem usage, heartbeat interval] as last seen by the node manager.
+        :param interval: Heartbeat interval of the node manager, which delays the worker health.
+        """
+        for worker, health in worker_health.items():
+            if not (self.is_state(worker, 'worker', InstanceState.RUNNING) or
+                    self.is_state(worker, 'worker', InstanceState.PENDING)):
+                continue  # E.g., a stale entry of a worker that was just stopped.
+            if health[0] <= self._last_heartbeat.get(worker, 0):
+                continue  # No newer heartbeat, e.g., of a node manager that lags behind.
+            self._last_heartbeat[worker] = health[0]
+            worker_interval = health[4] if len(health) > 4 else None
+            self._heartbeat_timeout[worker] = heartbeat_timeout(
+                (worker_interval or config.HEART_BEAT_INTERVAL_WORKER) + (interval or 0))
+            self._schedule_heartbeat(worker, 'worker')
+            if worker not in self.charge_time:
+                self.charge_time[worker] = time()
 
     @staticmethod
-    def heart_beat_timedout(heartbeat_time):
+    def heart_beat_timedout(heartbeat_time, timeout=config.HEART_BEAT_TIMEOUT):
         if not heartbeat_time:
             return True
-        return (time() - heartbeat_time) >= config.HEART_BEAT_TIMEOUT
+        return (time() - heartbeat_time) >= timeout
 
     def start_signal_timedout(self, instance_id):
         signal_time = self._start_signal.get(instance_id, None)
@@ -144,14 +235,19 @@ class Instances:
 
     def set_last_start_signal(self, instance_id):
         """
-
-        :param instance_id:
+        Record that a start command is sent to an instance and check it again once it times out.
+        :param instance_id: Instance id the start command is sent to.
         """
         self._start_signal[instance_id] = time()
+        self.deadlines.schedule(instance_id, self.start_signal_deadline(instance_id))
+
+    def start_signal_deadline(self, instance_id):
+        return self._start_signal.get(instance_id, 0) + config.START_SIGNAL_TIMEOUT
 
     def clear_time(self, instance_id):
         self._last_heartbeat.pop(instance_id, None)
         self._start_signal.pop(instance_id, None)
+        self.deadlines.remove(instance_id)
 
 
 class NodeScheduler:
@@ -159,12 +255,18 @@ class NodeScheduler:
     The main class of the Instance Manager, responsible for the life-time of other instances.
     """
 
-    def __init__(self, debug, git_pull, account_id):
-        self.instance_id = ec2_metadata.instance_id
+    def __init__(self, debug, git_pull, account_id, boto=None, instance_id=None, ipv4=None):
+        """
+        :param boto: BotoInstanceReader to use, by default one reading the AWS account.
+        :param instance_id: Instance id of the IM, by default read from the instance metadata.
+        :param ipv4: Address of the IM, by default read from the instance metadata.
+        """
+        self.instance_id = instance_id if instance_id else ec2_metadata.instance_id
         self.instances = Instances()
-        self.ipv4 = ec2_metadata.public_ipv4
-        self.dns = ec2_metadata.public_hostname
-        self.boto = BotoInstanceReader()
+        self.ipv4 = ipv4 if ipv4 else ec2_metadata.public_ipv4
+        self.dns = ipv4 if ipv4 else ec2_metadata.public_hostname
+        self.boto = boto if boto else BotoInstanceReader()
+        self.control_plane = ControlPlaneClient(self.boto)  # Non-blocking EC2 and SSM calls.
         self.commands = []
         self.cleaned_up = False
         self.debug = debug  # Boolean indicating if the debug mode is enabled.
@@ -173,97 +275,240 @@ class NodeScheduler:
         self.timewindow = TimeWindow()
         self.workers = 0
         self.account_id = account_id
+        self.heartbeat_settings = {}  # Instance type: heartbeat interval settings tuned at runtime.
+        self._boot_started = {}  # Worker: time the worker was started, to measure boot latency.
+        self.warm_pool = set()  # Parked workers, which are booted but get no tasks until activated.
+        self._activations = {}  # Worker: (time the worker should take tasks, 'cold' or 'warm').
         super().__init__()
 
-    def initialize_nodes(self, retry=False):
+    async def initialize_nodes(self, retry=False):
         """
         Initialize all required nodes.
         """
         if not retry:  # If debug is enabled, retries may be done. A sync is then not needed.
-            self.update_instances(check=False)
+            await self.update_instances(check=False)
         if self.debug and not self.node_manager_running:
             log_info("Debugging waiting for node manager to start running.")
             return False
         log_info("Initializing nodes..")
         if self.instances.has_instance_not_running(instance_type='node_manager'):
             log_info("No node manager running. Initializing startup protocol..")
-            self.start_node_manager()  # Start the node manager if not already done.
+            await self.start_node_manager()  # Start the node manager if not already done.
             self.node_manager_running = True
         return True
 
-    def _send_start_command(self, instance_type, instance_id):
+    def _start_command(self, instance_type, instance_id):
+        """
+        Get the shell command that starts the application on an instance. Instances look up their
+        own instance id, so the command is the same for all node managers and for all workers
+        connected to the same node manager.
+        :return: The command or None for a worker if no node manager is running yet.
+        """
+        command = [config.DEFAULT_DIRECTORY,
+                   config.DEFAULT_MAIN_CALL.format(instance_type, self.ipv4,
+                                                   config.OWN_INSTANCE_ID, self.account_id)]
+        if instance_type == 'worker':
+            # Workers are divided over the node managers by consistent hashing.
+            self.instances.worker_node_manager.pop(instance_id, None)
+            node_manager = self.instances.assign_node_manager(instance_id)
+            if node_manager is None:
+                return None
+            command[1] += ' {}'.format(self.instances.get_ip(node_manager))
+        if self.git_pull:
+            command.insert(1, 'git fetch --all')
+            command.insert(2, 'git checkout {}'.format(self.git_pull))
+            command.insert(3, 'git pull')
+        return ' ; '.join(command)
+
+    async def _send_start_commands(self, instance_type, instance_ids):
+        """
+        Send the start command to instances, with a single SSM call per distinct command (of at
+        most SSM_MAX_TARGETS instances).
+        :param instance_type: Type of the instances.
+        :param instance_ids: List of instance ids to start the application on.
+        """
+        commands = {}
+        for instance_id in instance_ids:
+            command = self._start_command(instance_type, instance_id)
+            if command is None:
+                # Workers are only started once they can connect to a running node manager.
+                log_info("No node manager running for {}. Retry later.".format(instance_id))
+                self.instances.deadlines.schedule(instance_id,
+                                                  time() + config.START_SIGNAL_TIMEOUT)
+                continue
+            commands.setdefault(command, []).append(instance_id)
+        calls = [(command, targets[idx:idx + config.SSM_MAX_TARGETS])
+                 for command, targets in commands.items()
+                 for idx in range(0, len(targets), config.SSM_MAX_TARGETS)]
+        await asyncio.gather(*[self._send_command(instance_type, command, targets)
+                               for command, targets in calls])
+
+    async def _send_command(self, instance_type, command, instance_ids):
         try:
-            command = [config.DEFAULT_DIRECTORY,
-                       config.DEFAULT_MAIN_CALL.format(instance_type, self.ipv4, instance_id,
-                                                       self.account_id)]
-            if instance_type == 'worker':
-                node_manager_ids = self.instances.get_all('node_manager', InstanceState.RUNNING)
-                # If there are more node managers, one could use a smarter method to divide workers.
-                command[1] += ' {}'.format(self.instances.get_ip(node_manager_ids[0]))
-            if self.git_pull:
-                command.insert(1, 'git fetch --all')
-                command.insert(2, 'git checkout {}'.format(self.git_pull))
-                command.insert(3, 'git pull')
-            log_info("Sending start command: [{}]: {}.".format(instance_id, command))
-            self.instances.set_last_start_signal(instance_id)
-            response = self.boto.ssm.send_command(
-                InstanceIds=[instance_id],
+            log_info("Sending start command: {}: {}.".format(instance_ids, command))
+            for instance_id in instance_ids:
+                self.instances.set_last_start_signal(instance_id)
+            response = await self.control_plane.send_command(
+                InstanceIds=instance_ids,
                 DocumentName='AWS-RunShellScript',
-                Parameters={'commands': [' ; '.join(command)]}
+                Parameters={'commands': [command]}
             )
             self.commands.append(response['Command']['CommandId'])
         except self.boto.ssm.exceptions.InvalidInstanceId:
-            log_info(
-                "Instance {} [{}] not yet running. Retry later.".format(instance_type, instance_id))
+            if len(instance_ids) > 1:
+                # A single instance that is not running yet fails the whole call.
+                await asyncio.gather(*[self._send_command(instance_type, command, [instance_id])
+                                       for instance_id in instance_ids])
+            else:
+                log_info("Instance {} {} not yet running. Retry later.".format(instance_type,
+                                                                               instance_ids))
         except Exception as exc:
             log_exception("The following exception has occurred while trying"
                           + " to send a command: " + str(exc))
 
-    def start_node_manager(self):
-        if not self.instances.has('node_manager', [InstanceState.RUNNING, InstanceState.PENDING]):
-            nodemanagers = self.instances.get_all(instance_type='node_manager',
-                                                  filter_state=[InstanceState.STOPPED])
-            if not nodemanagers:
-                log_error("No node manager instances available to start.")
-                raise ConnectionError('No node manager instances available to start.')
-            to_start = nodemanagers[0]
-            log_info("Initializing node manager.")
-            self._init_instance(to_start, instance_type='node_manager', wait=True)
-            self._send_start_command('node_manager', to_start)
-
-    def start_worker(self):
-        workers = self.boto.read_ids(self.instance_id, filters=['is_worker', ('is_running', False)])
+    async def start_node_manager(self):
+        """
+        Start node managers until NODE_MANAGERS node managers are running or pending.
+        """
+        active = self.instances.get_all('node_manager',
+                                        [InstanceState.RUNNING, InstanceState.PENDING])
+        missing = config.NODE_MANAGERS - len(active)
+        if missing <= 0:
+            return
+        nodemanagers = self.instances.get_all(instance_type='node_manager',
+                                              filter_state=[InstanceState.STOPPED])
+        if not nodemanagers and not active:
+            log_error("No node manager instances available to start.")
+            raise ConnectionError('No node manager instances available to start.')
+        if len(nodemanagers) < missing:
+            log_warning("Only {} of {} node managers can be started.".format(
+                len(active) + len(nodemanagers), config.NODE_MANAGERS))
+        log_info("Initializing node managers.")
+        started = await self._init_instances(nodemanagers[:missing], instance_type='node_manager',
+                                             wait=True)
+        await self._send_start_commands('node_manager', started)
+
+    async def scale_out(self, count):
+        """
+        Add workers that take tasks. Parked workers of the warm pool are activated first, the
+        remaining workers are started.
+        :param count: Number of workers to add.
+        """
+        activated = self.activate_workers(count)
+        if count > len(activated):
+            await self.start_workers(count - len(activated))
+
+    def activate_workers(self, count):
+        """
+        Let parked workers of the warm pool take tasks, preferring the workers that are running.
+        :param count: Maximum number of workers to activate.
+        :return: List of the activated workers.
+        """
+        parked = [worker for worker in self.instances.get_all(
+            'worker', [InstanceState.RUNNING, InstanceState.PENDING]) if worker in self.warm_pool]
+        activated = parked[:count]
+        for worker in activated:
+            self.warm_pool.discard(worker)
+            self._activations[worker] = (time(), 'warm')
+        if activated:
+            log_info("Activated workers {} of the warm pool.".format(activated))
+            log_metric({'warm_pool': len(self.warm_pool)})
+        return activated
+
+    async def maintain_warm_pool(self):
+        """
+        Start workers until WARM_POOL_SIZE workers are parked.
+        """
+        self.warm_pool = {worker for worker in self.warm_pool if self.instances.is_state(
+            worker, 'worker', InstanceState.RUNNING) or self.instances.is_state(
+            worker, 'worker', InstanceState.PENDING)}
+        missing = config.WARM_POOL_SIZE - len(self.warm_pool)
+        if missing > 0 and self.instances.has('worker', [InstanceState.STOPPED]):
+            await self.start_workers(missing, park=True)
+
+    def record_activations(self, worker_allocation):
+        """
+        Log the latency from the moment a worker should take tasks until a node manager reports
+        tasks for it, split in cold (started) and warm (activated from the warm pool) workers.
+        :param worker_allocation: Workers and their number of tasks reported by a node manager.
+        """
+        for worker in [worker for worker in self._activations if worker in worker_allocation]:
+            activation_time, mode = self._activations.pop(worker)
+            log_metric({'worker_activation': {'instance_id': worker, 'mode': mode,
+                                              'latency': time() - activation_time}})
+
+    async def start_workers(self, count, park=False):
+        """
+        Start stopped workers with a single start_instances call.
+        :param count: Number of workers to start.
+        :param park: Boolean indicating if the workers are added to the warm pool.
+        :return: List of the started workers.
+        """
+        workers = await self.control_plane.read_ids(self.instance_id,
+                                                    filters=['is_worker', 'is_stopped'],
+                                                    cached=True)
+        workers = [worker for worker in workers if self._can_start(worker)][:count]
         if not workers:
             log_info("No more worker instances can be started.")
-            return None
-        log_info("Initializing worker.")
-        self._init_instance(workers[0], instance_type='worker', wait=False)
-        return workers[0]
-
-    def _init_instance(self, instance_id, instance_type: str, wait=False):
-        log_info("Starting {} instance {}".format(instance_type, instance_id))
-        current_state: InstanceState = self.instances.get_nodes('instance_type').get(instance_id, None)
-        if current_state and not current_state.is_state(InstanceState.STOPPED):
-            log_info("Could not init instance {}. Current state is {}. "
-                     "Waiting until STOPPED".format(instance_id, current_state))
-            return
+            return []
+        log_info("Initializing {} workers.".format(len(workers)))
+        started = await self._init_instances(workers, instance_type='worker', wait=False)
+        if park:
+            self.warm_pool.update(started)
+            log_metric({'warm_pool': len(self.warm_pool)})
+        else:
+            for worker in started:
+                self._activations[worker] = (time(), 'cold')
+        return started
+
+    async def start_worker(self):
+        workers = await self.start_workers(1)
+        return workers[0] if workers else None
 
-        self.boto.ec2.start_instances(InstanceIds=[instance_id])
+    def _can_start(self, instance_id):
+        current_state: InstanceState = self.instances.registry.get_state(instance_id)
+        return not current_state or current_state.is_state(InstanceState.STOPPED)
+
+    async def _init_instances(self, instance_ids, instance_type: str, wait=False):
+        """
+        Start instances of a type with a single start_instances call.
+        :param instance_ids: List of instance ids to start.
+        :param instance_type: Type of the instances.
+        :param wait: Boolean indicating if the call returns once the instances are running.
+        :return: List of the instances that are started.
+        """
+        to_start = []
+        for instance_id in instance_ids:
+            if self._can_start(instance_id):
+                to_start.append(instance_id)
+            else:
+                log_info("Could not init instance {}. Current state is {}. Waiting until "
+                         "STOPPED".format(instance_id,
+                                          self.instances.registry.get_state(instance_id)))
+        if not to_start:
+            return []
+        log_info("Starting {} instances {}".format(instance_type, to_start))
+
+        await self.control_plane.start_instances(to_start)
         if wait:
-            waiter = self.boto.ec2.get_waiter('instance_running')
-            waiter.wait(InstanceIds=[instance_id])
-            self.instances.set_state(instance_id, instance_type,
-                                     InstanceState(InstanceState.RUNNING))
-        else:
-            self.instances.set_state(instance_id, instance_type,
-                                     InstanceState(InstanceState.PENDING))
-        self.instances.charge_time[instance_id] = time()
+            await self.control_plane.wait_until_running(to_start)
+        state = InstanceState.RUNNING if wait else InstanceState.PENDING
+        for instance_id in to_start:
+            self.instances.set_state(instance_id, instance_type, InstanceState(state))
+            self.instances.charge_time[instance_id] = time()
+            if instance_type == 'worker':
+                self._boot_started[instance_id] = time()
         log_info("Charge_time: {}".format(self.instances.charge_time))
         if instance_type == 'worker':
-            self.workers += 1
-            log_metric({'workers': self.workers})
+            self.workers += len(to_start)
+            self.log_workers()
+        return to_start
+
+    def log_workers(self):
+        REGISTRY.gauge('workers', "Workers started by the instance manager.").set(self.workers)
+        log_metric({'workers': self.workers})
 
-    def _kill_instance(self, instance_ids, instance_types):
+    async def _kill_instance(self, instance_ids, instance_types):
         """
         Kill a single instance of a list of instances.
         :param instance_ids: List of instance_ids or a single instance_id.
@@ -271,7 +516,7 @@ class NodeScheduler:
         """
         if isinstance(instance_ids, str):
             instance_ids = [instance_ids]  # If not already a list, convert to a single-item list.
-        self.boto.ec2.stop_instances(InstanceIds=instance_ids)
+        await self.control_plane.stop_instances(instance_ids)
         if instance_types:
             if isinstance(instance_types, str):
                 instance_types = instance_types * len(instance_ids)
@@ -290,9 +535,11 @@ class NodeScheduler:
                 del self.instances.charge_time[instance_id]
             else:
                 log_warning("No charge_time available for {}".format(instance_id))
+            self._activations.pop(instance_id, None)
+            self.warm_pool.discard(instance_id)
             if instance_types and instance_types[idx] == 'worker':
                 self.workers -= 1
-                log_metric({'workers': self.workers})
+                self.log_workers()
 
     def running_instances(self):
         """
@@ -304,103 +551,132 @@ class NodeScheduler:
         workers = self.instances.get_all('worker', filter_state=[InstanceState.RUNNING])
         return node_managers + workers
 
-    def update_instances(self, check=True):
+    async def update_instances(self, check=True):
         states = [InstanceState.PENDING, InstanceState.STOPPING]
         if check and not (
                 self.instances.has('worker', states) or self.instances.has('node_manager', states)):
             return
         log_info("Updated instance states from AWS state.")
-        boto_response = self.boto.read(self.instance_id)
+        boto_response = await self.control_plane.read(self.instance_id)
         self.instances.update_instance_all(boto_response=boto_response)
-        log_info(str(self.instances))
+        log_info("{}", self.instances)
 
     async def run(self):
         log_info("Running NodeScheduler..")
         sleep_time = config.SERVER_SLEEP_TIME
         update_counter = config.BOTO_UPDATE_SEC
         try:
-            initialized = self.initialize_nodes()
+            initialized = await self.initialize_nodes()
             while self.debug and not initialized:
                 log_warning(
                     "Debug enabled and no node manager started yet. "
                     "Waiting {} seconds to retry.".format(config.DEBUG_INIT_RETRY))
                 await asyncio.sleep(config.DEBUG_INIT_RETRY)
-                initialized = self.initialize_nodes(retry=True)
+                initialized = await self.initialize_nodes(retry=True)
 
             while True:
                 # Update the Instance states.
                 if update_counter <= 0:
-                    self.update_instances()
+                    await self.update_instances()
                     update_counter = config.BOTO_UPDATE_SEC
 
-                self.check_all_living()
+                await self.check_all_living()
 
                 # Check if some worker is underloaded or overloaded.
-                active_workers = self.instances.get_all('worker',
-                                                            filter_state=[InstanceState.PENDING,
-                                                                          InstanceState.RUNNING])
+                workers = self.instances.get_all('worker', filter_state=[InstanceState.PENDING,
+                                                                         InstanceState.RUNNING])
+                active_workers = [worker for worker in workers if worker not in self.warm_pool]
                 max_workers = len(self.instances.get_nodes('worker'))
                 window_response = self.timewindow.get_action(current_workers=active_workers,
                                                              max_workers=max_workers)
                 if 'create' in window_response:
-                    self.start_worker()
+                    await self.scale_out(window_response['create'])
                 elif 'kill' in window_response:
                     to_kill = window_response['kill']
-                    self._kill_instance(instance_ids=[to_kill],
-                                        instance_types=['worker'])
+                    await self._kill_instance(instance_ids=to_kill,
+                                              instance_types=['worker'] * len(to_kill))
+                await self.maintain_warm_pool()
 
                 update_counter -= sleep_time
                 await asyncio.sleep(sleep_time)
         except KeyboardInterrupt:
-            self.cancel_all()
+            await self.cancel_all()
         except asyncio.CancelledError:
             pass
         except Exception as exc:
             log_error("The following exception {}"
                       " occurred during run: {}".format(exc, traceback.format_exc()))
 
-    def check_all_living(self):
+    async def check_all_living(self):
         """
-        Check for all node managers and all workers if they are still alive.
+        Check if the node managers and workers are still alive. Only the instances of which the
+        heartbeat or start signal deadline passed are checked.
         """
-        for instance_type in ('node_manager', 'worker'):
-            for instance in self.instances.get_nodes(instance_type):
-                self._check_living(instance, instance_type)
+        to_signal, to_restart = {}, {}
+        for instance in self.instances.deadlines.expired(time()):
+            instance_type = self.instances.get_type(instance)
+            action = self._check_living(instance, instance_type)
+            if action == 'start_command':
+                to_signal.setdefault(instance_type, []).append(instance)
+            elif action == 'restart':
+                to_restart.setdefault(instance_type, []).append(instance)
+        # The instances of a type are started and signalled in bulk.
+        for instance_type, instances in to_restart.items():
+            await self._init_instances(instances, instance_type=instance_type)
+            for instance in instances:
+                # Check again later if the instance did not come back.
+                self.instances.deadlines.schedule(
+                    instance, time() + self.instances.get_heartbeat_timeout(instance))
+        for instance_type, instances in to_signal.items():
+            await self._send_start_commands(instance_type, instances)
 
     def _check_living(self, instance, instance_type):
         """
         Check for an instance if it is still alive or if it should receive a new start command.
         :param instance: Instance id that is checked.
         :param instance_type: Type of the instance being checked.
+        :return: 'start_command' if the instance should receive a start command, 'restart' if the
+        instance should be started again or None.
         """
         if not (self.instances.is_state(instance, instance_type, state=InstanceState.RUNNING) or
                 self.instances.is_state(instance, instance_type, state=InstanceState.PENDING)):
-            return  # Instances that are not running, should be started elsewhere.
+            return None  # Instances that are not running, should be started elsewhere.
         heartbeat = self.instances.get_last_heartbeat(instance)
-        heartbeat_timedout = self.instances.heart_beat_timedout(heartbeat)
+        timeout = self.instances.get_heartbeat_timeout(instance)
+        heartbeat_timedout = self.instances.heart_beat_timedout(heartbeat, timeout)
         if heartbeat and not heartbeat_timedout:
+            if instance in self._boot_started:  # First heartbeat of a started worker.
+                self.timewindow.policy.observe_boot(time() - self._boot_started.pop(instance))
             self.instances.set_state(instance_id=instance, instance_type=instance_type,
                                      state=InstanceState(InstanceState.RUNNING))
-            return  # The instance is perfectly fine.
+            self.instances.deadlines.schedule(instance, self.instances.heartbeat_deadline(instance))
+            return None  # The instance is perfectly fine.
         if not heartbeat and self.instances.start_signal_timedout(instance):
             # No start signal is sent, or it takes too long to start.
             log_info("No start/timedout signal sent to {}".format(instance))
-            self._send_start_command(instance_type=instance_type, instance_id=instance)
-        elif heartbeat:
-            # The IM has not received a heartbeat for too long.
-            log_error("No/timedout heartbeat recorded "
-                      "for instance {}: {}".format(instance,
-                                                   self.instances.get_last_heartbeat(instance)))
+            return 'start_command'
+        if not heartbeat:
+            # Still waiting for the first heartbeat after the start signal.
+            self.instances.deadlines.schedule(instance,
+                                              self.instances.start_signal_deadline(instance))
+            return None
+        # The IM has not received a heartbeat for too long.
+        log_error("No/timedout heartbeat recorded "
+                  "for instance {}: {}".format(instance,
+                                               self.instances.get_last_heartbeat(instance)))
+        if instance in self.instances.charge_time:
             log_metric(
                 {'charged_time': {'instance_id': instance,
                                   'charged': time() - self.instances.charge_time[instance]}})
             del self.instances.charge_time[instance]
+            if instance_type == 'node_manager':
+                self.timewindow.remove_node_manager(instance)
             if instance_type == 'worker':
                 self.workers -= 1
-                log_metric({'workers': self.workers})
-            self._init_instance(instance_id=instance, instance_type=instance_type)
+                self.log_workers()
+        return 'restart'
 
-    def cancel_all(self):
+    async def cancel_all(self):
         """
         Cancel all running tasks and kill all instances.
         When the debug mode is enabled, the node manager is not killed.
@@ -411,11 +687,11 @@ class NodeScheduler:
             running_instances = self.running_instances()
         if running_instances:
             log_info("Killing all instances: {}".format(running_instances))
-            self._kill_instance(running_instances, instance_types={})
+            await self._kill_instance(running_instances, instance_types={})
 
         log_info("Cancelling all commands..")
         for command in self.commands:
-            self.boto.ssm.cancel_command(CommandId=command)
+            await self.control_plane.cancel_command(command)
             log_info("Cancelled command: {}".format(command))
         self.cleaned_up = True
 
@@ -430,6 +706,8 @@ class NodeMonitor(con.MultiConnectionServer):
         super().__init__(host, port)
 
     def process_command(self, command, source) -> Packet:
+        if command['command'] == 'heartbeat_interval':
+            return self._tune_heartbeat(command)
         log_warning("IM received a command {} from {}. "
                     "This should not happen!".format(command, source))
         return command  # The IM should not receive commands.
@@ -439,16 +717,29 @@ class NodeMonitor(con.MultiConnectionServer):
             if heartbeat['instance_id'] not in self._ns.instances.charge_time:
                 self._ns.instances.charge_time[heartbeat['instance_id']] = time()
             self._ns.instances.set_last_heartbeat(heartbeat=heartbeat)
+            REGISTRY.counter('heartbeats_received_total', "Heartbeats received by the IM.",
+                             instance_type=heartbeat['instance_type']).inc()
             log_metric({'heartbeat': heartbeat})
             if heartbeat['instance_type'] == 'node_manager':
                 self._ns.node_manager_running = True
                 self._ns.timewindow.update_node_manager(nm_heartbeat=heartbeat)
+                self._ns.record_activations(heartbeat['worker_allocation'])
+                # Workers report their health through the node manager they are connected to.
+                self._ns.instances.update_worker_health(heartbeat.get('worker_health', {}),
+                                                        interval=heartbeat.get('interval'))
                 log_metric({'tasks_waiting': heartbeat['tasks_waiting'],
                             'tasks_running': heartbeat['tasks_running'],
                             'tasks_total': heartbeat['tasks_waiting'] + heartbeat['tasks_running'],
-                            'worker_allocation': heartbeat['worker_allocation']})
-                return self._generate_nm_response()
+                            'worker_allocation': heartbeat['worker_allocation'],
+                            'queue_depth': heartbeat.get('queue_depth', 0)})
+                return self._generate_nm_response(heartbeat['instance_id'])
             if heartbeat['instance_type'] == 'worker':
+                if self._ns.heartbeat_settings:
+                    heartbeat['heartbeat_settings'] = self._ns.heartbeat_settings
+                # A worker of a failed node manager moves to the node manager it is remapped to.
+                node_manager = self._ns.instances.assign_node_manager(heartbeat['instance_id'])
+                if node_manager:
+                    heartbeat['node_manager'] = self._ns.instances.get_ip(node_manager)
                 return heartbeat
             log_warning("Received a heartbeat from an instance type I do not know: {}".format(heartbeat))
             return heartbeat
@@ -456,16 +747,46 @@ class NodeMonitor(con.MultiConnectionServer):
             log_error("Error on process_heartbeat {}: {}".format(exc, traceback.format_exc()))
             raise exc
 
-    def _generate_nm_response(self):
-        workers_running = self._ns.instances.get_all('worker',
-                                                     filter_state=[InstanceState.RUNNING])
-        workers_pending = self._ns.instances.get_all('worker',
-                                                     filter_state=[InstanceState.PENDING])
+    def _tune_heartbeat(self, command):
+        """
+        Change the heartbeat interval settings of the node managers and/or workers at runtime. The
+        settings are shared with the instances in the responses to their heartbeats.
+        :param command: Command with an optional instance_type and the AdaptiveInterval.TUNABLE
+        parameters to change.
+        """
+        settings = {key: command[key] for key in AdaptiveInterval.TUNABLE if key in command}
+        instance_types = [command['instance_type']] if command.get('instance_type') else \
+            ['node_manager', 'worker']
+        for instance_type in instance_types:
+            tuned = dict(self._ns.heartbeat_settings.get(instance_type, {}))
+            tuned.update(settings)
+            self._ns.heartbeat_settings[instance_type] = tuned
+        log_info("Heartbeat settings changed to {}.".format(self._ns.heartbeat_settings))
+        return CommandPacket(command='heartbeat_interval', settings=self._ns.heartbeat_settings)
+
+    def _generate_nm_response(self, node_manager):
+        """
+        Generate the response to a node manager with the workers connected to that node manager
+        and all running node managers, so the node managers can route tasks between them.
+        :param node_manager: Instance id of the node manager.
+        """
+        instances = self._ns.instances
+        # Parked workers of the warm pool are kept from the node managers until activated.
+        workers_running = [worker for worker in
+                           instances.get_workers_of(node_manager, [InstanceState.RUNNING])
+                           if worker not in self._ns.warm_pool]
+        workers_pending = [worker for worker in
+                           instances.get_workers_of(node_manager, [InstanceState.PENDING])
+                           if worker not in self._ns.warm_pool]
+        node_managers = {instance_id: instances.get_ip(instance_id) for instance_id in
+                         instances.get_all('node_manager', [InstanceState.RUNNING])}
         response = HeartBeatPacket(instance_id='instance_manager',
                                    instance_state=InstanceState(InstanceState.RUNNING),
                                    instance_type='instance_manager',
                                    workers_running=workers_running,
-                                   workers_pending=workers_pending)
+                                   workers_pending=workers_pending,
+                                   node_managers=node_managers,
+                                   heartbeat_settings=self._ns.heartbeat_settings)
         log_metric({'heartbeat':
                         HeartBeatPacket(instance_id='instance_manager',
                                         instance_state=InstanceState(InstanceState.RUNNING),
@@ -476,61 +797,59 @@ class NodeMonitor(con.MultiConnectionServer):
 class TimeWindow:
     """
     Time window class for keeping track of metrics for overload and underload of workers.
+    The heartbeats of all node managers are aggregated.
     """
 
     def __init__(self):
         self.mean_total_tasks = deque()
         self.worker_allocation = {}
+        self.overloaded = False
+        self.node_managers = {}  # Node manager: last heartbeat of the node manager.
+        self.policy = create_policy()  # Decides the number of workers.
 
     def update_node_manager(self, nm_heartbeat: HeartBeatPacket):
         """
         Update the state of the node manager in the time window.
         :param nm_heartbeat: The heartbeat from the Node manager.
         """
-        num_workers = len(nm_heartbeat['worker_allocation'])
+        self.node_managers[nm_heartbeat['instance_id']] = nm_heartbeat
+        self.policy.observe(nm_heartbeat)
+        heartbeats = list(self.node_managers.values())
+        worker_allocation = {}
+        for heartbeat in heartbeats:
+            worker_allocation.update(heartbeat['worker_allocation'])
+        total_tasks = sum(heartbeat['tasks_waiting'] + heartbeat['tasks_running']
+                          for heartbeat in heartbeats)
+        num_workers = len(worker_allocation)
         if num_workers > 0:
-            self.mean_total_tasks.append(
-                (nm_heartbeat['tasks_waiting'] + nm_heartbeat['tasks_running']) / num_workers)
+            self.mean_total_tasks.append(total_tasks / num_workers)
         else:
-            self.mean_total_tasks.append(nm_heartbeat['tasks_waiting'] + nm_heartbeat['tasks_running'])
-        self.worker_allocation = nm_heartbeat['worker_allocation']
+            self.mean_total_tasks.append(total_tasks)
+        self.worker_allocation = worker_allocation
+        self.overloaded = any(heartbeat.get('overloaded', False) for heartbeat in heartbeats)
         if len(self.mean_total_tasks) > config.WINDOW_SIZE:
             self.mean_total_tasks.popleft()
 
+    def remove_node_manager(self, node_manager):
+        """
+        Stop aggregating the heartbeats of a node manager that is no longer alive.
+        """
+        self.node_managers.pop(node_manager, None)
+        self.policy.remove_node_manager(node_manager)
+
     def get_action(self, current_workers: list, max_workers: int):
-        number_of_workers = len(self.worker_allocation)
+        """
+        Get the scaling action of the scaling policy.
+        :param current_workers: Workers that are pending or running.
+        :param max_workers: Number of worker instances available.
+        :return: {'create': number of workers}, {'kill': list of workers} or {}.
+        """
         if not self.mean_total_tasks:  # We first need a heartbeat from the Node manager.
             return {}
-        if self.mean_total_tasks[-1] > 0 and number_of_workers == 0:
-            log_info("[LB] There was no worker, but there is work to do.")
-            return {'create': 1}  # There was no worker, but there is work to do.
-
-        mean_task_per_worker = self._mean(self.mean_total_tasks)
-
-        # Check if there are underloaded workers.
-        if config.MIN_JOBS_PER_WORKER > mean_task_per_worker:
-            if len(current_workers) == 0:
-                return {}  # There is no worker to kill.
-            if self.mean_total_tasks[-1] > 0 and number_of_workers == 1:
-                return {}  # If there is still work and only one worker to do it.
-            if len(current_workers) < number_of_workers:
-                return {}  # In an earlier check, an instance was already killed wait for next HB.
-            # Kill the instance with the least tasks.
-            log_info("[LB] The instance with the least tasks will be killed.")
-            if number_of_workers:
-                return {'kill': min(self.worker_allocation, key=self.worker_allocation.get)}
-            return {'kill': current_workers[0]}
-
-        # Check if there are overloaded workers.
-        if mean_task_per_worker > config.MAX_JOBS_PER_WORKER:
-            if len(current_workers) == max_workers:
-                return {}  # No new worker can be created, if we already reached the limit.
-            if len(current_workers) > number_of_workers:
-                return {}  # In an earlier check, an instance was already created wait for next HB.
-            # Create an instance.
-            log_info("[LB] A new instance is needed for load balancing.")
-            return {'create': 1}
-        return {}
+        return self.policy.get_action(self, current_workers, max_workers)
+
+    def mean(self):
+        return self._mean(self.mean_total_tasks)
 
     @staticmethod
     def _mean(values, rounding=2):
@@ -541,17 +860,32 @@ def start_instance(debug=False, git_pull=False):
     """
     Function to start the Node Scheduler, which is the heart of the Instance Manager.
     """
-    client = boto3.client("sts")
-    account_id = client.get_caller_identity()["Account"]
+    if config.LOCAL_CLOUD:  # Run by the local harness, see aws.utils.localcloud.
+        cloud = LocalCloud(config.LOCAL_CLOUD)
+        ec2 = cloud.ec2()
+        account_id = cloud.ACCOUNT_ID
+        # The instances run the application from this directory with this interpreter.
+        config.DEFAULT_DIRECTORY = 'cd {}'.format(os.getcwd())
+        config.DEFAULT_MAIN_CALL = config.DEFAULT_MAIN_CALL.replace('python3', sys.executable, 1)
+        scheduler_args = {'boto': BotoInstanceReader(ec2=ec2, ssm=cloud.ssm(ec2)),
+                          'instance_id': config.LOCAL_INSTANCE_ID, 'ipv4': config.LOCAL_HOST}
+    else:
+        client = boto3.client("sts")
+        account_id = client.get_caller_identity()["Account"]
+        scheduler_args = {}
     resource_manager = ResourceManagerCore(account_id=account_id, instance_id='instance_manager')
     log_info("Starting Node Scheduler..")
-    scheduler = NodeScheduler(debug=debug, git_pull=git_pull, account_id=account_id)
+    scheduler = NodeScheduler(debug=debug, git_pull=git_pull, account_id=account_id,
+                              **scheduler_args)
     monitor = NodeMonitor(scheduler)
 
     loop = asyncio.get_event_loop()
-    server_core = asyncio.start_server(monitor.run, con.HOST, con.PORT_IM, loop=loop)
+    server_core = asyncio.start_server(monitor.run, con.HOST, con.PORT_IM, loop=loop,
+                                       limit=config.MAX_BATCH_SIZE)
 
-    procs = asyncio.wait([server_core, scheduler.run(), resource_manager.period_upload_log()])
+    procs = asyncio.wait([server_core, scheduler.run(), resource_manager.period_upload_log(),
+                          resource_manager.period_flush_metrics(),
+                          resource_manager.serve_metrics('instance_manager')])
 
     try:
         loop.run_until_complete(procs)
@@ -562,7 +896,7 @@ def start_instance(debug=False, git_pull=False):
     finally:
         resource_manager.upload_log(clean=False)  # Make sure everything is logged before shutdown.
         if not scheduler.cleaned_up:
-            scheduler.cancel_all()
+            loop.run_until_complete(scheduler.cancel_all())
         tasks = asyncio.Task.all_tasks(loop=loop)
         with suppress(asyncio.CancelledError):
             for task in tasks:
@@ -573,6 +907,7 @@ def start_instance(debug=False, git_pull=False):
             loop.run_until_complete(group)
         resource_manager.upload_log(clean=True)  # Clean the last logs.
         resource_manager.delete_bucket(resource_manager.files_bucket)
+        scheduler.control_plane.close()
         loop.close()
 
 
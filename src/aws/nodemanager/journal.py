@@ -0,0 +1,174 @@
+"""
+Module for the durable journal of the TaskPool.
+"""
+import asyncio
+import json
+import os
+import traceback
+from collections import OrderedDict
+
+import aws.utils.config as config
+from aws.resourcemanager.resourcemanager import log_info, log_error, log_metric
+
+
+class TaskJournal:
+    """
+    Append-only journal of the task lifecycle events of the TaskPool with periodic snapshots.
+    Events are buffered and written with a single fsync per batch (group commit), so journaling
+    does not throttle the ingestion of tasks. Once enough events are written, a compact snapshot of
+    all tasks that are not yet done replaces the journal.
+
+    Events are JSON lists starting with a sequence number and the event name:
+      - [seq, 'add', task, priority, deadline, source, enqueue_time]
+      - [seq, 'dispatch', task]
+      - [seq, 'requeue', task]
+      - [seq, 'done', task]
+      - [seq, 'hold', task, text, priority, deadline, source, arrival_time]: held by a rate limit.
+      - [seq, 'ingest', None, position]: number of rows of the scenario that are ingested.
+    """
+
+    def __init__(self, directory=config.JOURNAL_DIRECTORY):
+        os.makedirs(directory, exist_ok=True)
+        self.journal_path = os.path.join(directory, 'taskpool.journal')
+        self.snapshot_path = os.path.join(directory, 'taskpool.snapshot')
+        self._buffer = []
+        self._sequence = 0
+        self._file = None
+        self.events_since_snapshot = 0
+        self.held = []  # Recovered held tasks: [task, text, priority, deadline, source, arrival].
+        self.ingested = 0  # Recovered number of ingested rows of the scenario.
+
+    def record(self, event, task, *args):
+        """
+        Add an event to the journal. The event is durable after the next flush.
+        :param event: Name of the event.
+        :param task: Key of the task.
+        :param args: Additional fields of the event.
+        """
+        self._sequence += 1
+        self._buffer.append(json.dumps([self._sequence, event, task] + list(args)))
+        if len(self._buffer) >= config.JOURNAL_BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        """
+        Write all buffered events to the journal with a single fsync.
+        """
+        if not self._buffer:
+            return
+        if not self._file:
+            self._file = open(self.journal_path, 'a')
+        self._file.write('\n'.join(self._buffer) + '\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.events_since_snapshot += len(self._buffer)
+        self._buffer = []
+
+    def snapshot(self, entries, held=(), ingested=0):
+        """
+        Replace the journal by a snapshot of all tasks that are not yet done.
+        :param entries: List of [task, priority, deadline, source, enqueue_time, started].
+        :param held: List of the held tasks as in the 'hold' event.
+        :param ingested: Number of ingested rows of the scenario.
+        """
+        self.flush()
+        temporary_path = self.snapshot_path + '.tmp'
+        with open(temporary_path, 'w') as file:
+            json.dump({'sequence': self._sequence, 'tasks': entries, 'held': list(held),
+                       'ingested': ingested}, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary_path, self.snapshot_path)
+        # Events up to the sequence number are part of the snapshot, so the journal can be cleared.
+        if self._file:
+            self._file.close()
+        self._file = open(self.journal_path, 'w')
+        self.events_since_snapshot = 0
+        log_metric({'journal_snapshot': {'tasks': len(entries), 'sequence': self._sequence}})
+
+    def recover(self):
+        """
+        Rebuild the tasks that were not yet done from the snapshot and the journal. The held tasks
+        and the ingestion position are recovered in held and ingested.
+        :return: List of [task, priority, deadline, source, enqueue_time, started].
+        """
+        tasks = OrderedDict()
+        held = OrderedDict()
+        sequence = 0
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, 'r') as file:
+                snapshot = json.load(file)
+            sequence = snapshot['sequence']
+            for entry in snapshot['tasks']:
+                tasks[entry[0]] = entry
+            for entry in snapshot.get('held', []):
+                held[entry[0]] = entry
+            self.ingested = snapshot.get('ingested', 0)
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, 'r') as file:
+                for line in file:
+                    try:
+                        event = json.loads(line)
+                    except json.JSONDecodeError:
+                        log_error("Skipping torn journal line: {}".format(line))
+                        continue
+                    sequence = self._replay(tasks, held, event, sequence)
+        self._sequence = sequence
+        self.held = list(held.values())
+        log_info("Recovered {} tasks and {} held tasks from the journal.".format(len(tasks),
+                                                                                 len(self.held)))
+        return list(tasks.values())
+
+    def _replay(self, tasks, held, event, sequence):
+        """
+        Apply a journal event to the recovered tasks.
+        :return: The latest sequence number.
+        """
+        event_sequence, name, task = event[0], event[1], event[2]
+        if event_sequence <= sequence:
+            return sequence  # Already part of the snapshot.
+        if name == 'add':
+            held.pop(task, None)  # Released by the rate limit.
+            tasks[task] = [task] + event[3:] + [False]
+        elif name == 'hold':
+            held[task] = [task] + event[3:]
+        elif name == 'ingest':
+            self.ingested = event[3]
+        elif name == 'dispatch' and task in tasks:
+            tasks[task][5] = True
+        elif name == 'requeue' and task in tasks:
+            tasks[task][5] = False
+        elif name == 'done':
+            tasks.pop(task, None)
+        return event_sequence
+
+    async def period_flush(self, snapshot_func):
+        """
+        Periodically flush the journal and replace it by a snapshot once it grows too large.
+        :param snapshot_func: Function returning the keyword arguments of snapshot for the
+        TaskPool.
+        """
+        try:
+            while True:
+                await asyncio.sleep(config.JOURNAL_FLUSH_INTERVAL)
+                self.flush()
+                if self.events_since_snapshot >= config.JOURNAL_SNAPSHOT_EVENTS:
+                    self.snapshot(**snapshot_func())
+        except Exception as exc:
+            log_error("Journal flush failed {}: {}".format(exc, traceback.format_exc()))
+            raise exc
+
+    def close(self, clean=False):
+        """
+        Flush and close the journal.
+        :param clean: True on a clean shutdown, after which the run is over. The journal and the
+        snapshot are then removed, so the next run does not recover the tasks of this run.
+        """
+        self.flush()
+        if self._file:
+            self._file.close()
+            self._file = None
+        if clean:
+            for path in (self.journal_path, self.snapshot_path):
+                if os.path.exists(path):
+                    os.remove(path)
@@ -0,0 +1,189 @@
+"""
+Module for the open-loop load generator of the Node Manager. Tasks are submitted at the times of
+an arrival process, regardless of how fast the system ingests or processes them, so the system can
+be measured at a given offered load.
+"""
+import asyncio
+import math
+import random
+
+import pandas as pd
+
+import aws.utils.config as config
+from aws.nodemanager.taskqueue import ADMITTED, HELD
+from aws.resourcemanager.resourcemanager import log_info, log_metric
+from aws.utils.clock import time
+
+
+def poisson_arrivals(rng, rate):
+    """
+    Arrivals with exponential inter-arrival times.
+    :param rate: Mean number of tasks per second.
+    """
+    arrival = 0.0
+    while True:
+        arrival += rng.expovariate(rate)
+        yield arrival, None, None
+
+
+def bursty_arrivals(rng, rate, burst_rate, mean_normal, mean_burst):
+    """
+    Poisson arrivals of which the rate switches between a normal and a burst rate (a two-state
+    Markov-modulated Poisson process).
+    :param rate: Tasks per second in the normal state.
+    :param burst_rate: Tasks per second during a burst.
+    :param mean_normal: Mean seconds between two bursts.
+    :param mean_burst: Mean seconds of a burst.
+    """
+    arrival = 0.0
+    state_end = rng.expovariate(1 / mean_normal)
+    current_rate, bursting = rate, False
+    while True:
+        arrival += rng.expovariate(current_rate) if current_rate > 0 else math.inf
+        while arrival > state_end:  # The state changes before the arrival, so draw it again.
+            bursting = not bursting
+            current_rate = burst_rate if bursting else rate
+            arrival = state_end + (rng.expovariate(current_rate) if current_rate > 0 else math.inf)
+            state_end += rng.expovariate(1 / (mean_burst if bursting else mean_normal))
+        yield arrival, None, None
+
+
+def diurnal_arrivals(rng, mean_rate, amplitude, period):
+    """
+    Poisson arrivals with a rate that follows a sine, generated by thinning.
+    :param mean_rate: Mean number of tasks per second.
+    :param amplitude: Relative amplitude of the rate, between 0 and 1.
+    :param period: Seconds of a single cycle of the rate, e.g., 86400 for a day.
+    """
+    max_rate = mean_rate * (1 + amplitude)
+    arrival = 0.0
+    while True:
+        arrival += rng.expovariate(max_rate)
+        rate = mean_rate * (1 + amplitude * math.sin(2 * math.pi * arrival / period))
+        if rng.random() * max_rate < rate:
+            yield arrival, None, None
+
+
+def trace_arrivals(rng, path=None):
+    """
+    Arrivals at the times of a scenario CSV (IP, Input, Time), with its texts and sources.
+    :param path: Path of the scenario, by default SCENARIO_FILE.
+    """
+    trace = pd.read_csv(path if path else config.SCENARIO_FILE).sort_values('Time', kind='stable')
+    for row in trace.itertuples():
+        yield float(row.Time), row.Input, row.IP
+
+
+ARRIVALS = {
+    'poisson': poisson_arrivals,
+    'bursty': bursty_arrivals,
+    'diurnal': diurnal_arrivals,
+    'trace': trace_arrivals
+}
+
+
+def parse_arrivals(spec, rng):
+    """
+    Create an arrival process.
+    :param spec: Name of the process and its arguments, as described for LOAD_ARRIVALS.
+    :param rng: Random generator of the arrivals.
+    :return: Iterator of (seconds since the start, text or None, source or None) tuples.
+    """
+    name, _, args = spec.partition(':')
+    if name not in ARRIVALS:
+        raise ValueError("Unknown arrival process: {}. Options: {}".format(spec, list(ARRIVALS)))
+    if name == 'trace':
+        return trace_arrivals(rng, args if args else None)
+    return ARRIVALS[name](rng, *[float(arg) for arg in args.split(',') if arg])
+
+
+class LoadGenerator:
+    """
+    Submits the tasks of an arrival process to a TaskPool. Every task is submitted at its scheduled
+    time, without waiting for earlier submissions, so slow ingestion does not lower the offered
+    load. Arrivals without a text are given a text and source sampled from the input file.
+    """
+
+    def __init__(self, taskpool, arrivals, inputs, compression=1, duration=None, seed=None):
+        """
+        :param taskpool: TaskPool to submit the tasks to.
+        :param arrivals: Specification of the arrival process, see parse_arrivals.
+        :param inputs: DataFrame with the IP and Input columns to sample the tasks from.
+        :param compression: Factor by which the arrivals are sped up.
+        :param duration: Seconds of (uncompressed) arrivals, or None for all arrivals.
+        :param seed: Optional random seed.
+        """
+        self.taskpool = taskpool
+        self.rng = random.Random(seed)
+        self.arrivals = parse_arrivals(arrivals, self.rng)
+        self.inputs = list(zip(inputs['Input'], inputs['IP']))
+        self.compression = compression
+        self.duration = duration
+        self.offered = 0
+        self.accepted = 0
+        self.held = 0  # Tasks held back by the rate limit, which are added once it allows.
+        self.rejected = 0  # Tasks rejected by the admission control of the TaskPool.
+        self.max_lag = 0  # Maximum seconds a submission started after its scheduled time.
+        self._pending = set()
+
+    @classmethod
+    def from_config(cls, taskpool):
+        return cls(taskpool, config.LOAD_ARRIVALS, pd.read_csv(config.LOAD_INPUT_FILE),
+                   compression=config.LOAD_COMPRESSION, duration=config.LOAD_DURATION,
+                   seed=config.LOAD_SEED)
+
+    def schedule(self):
+        """
+        Get the arrivals to submit.
+        :return: Iterator of (seconds since the start, text, source) tuples.
+        """
+        for arrival, task_data, source in self.arrivals:
+            if self.duration is not None and arrival > self.duration:
+                return
+            if task_data is None:
+                task_data, sampled_source = self.rng.choice(self.inputs)
+                source = source if source is not None else sampled_source
+            yield arrival / self.compression, self.taskpool.translate(task_data), source
+
+    async def run(self):
+        """
+        Submit all arrivals, then wait until their submissions are done.
+        """
+        while not self.taskpool.ring:  # Wait until the IM has shared the running node managers.
+            await asyncio.sleep(self.taskpool.heartbeat_interval.current)
+        log_info("Starting the load generator..")
+        start_time = time()
+        report_time = start_time
+        for arrival, task_data, source in self.schedule():
+            delay = start_time + arrival - time()
+            if delay > 0:  # Sleep until the scheduled time, so errors in the sleeps do not add up.
+                await asyncio.sleep(delay)
+            self.max_lag = max(self.max_lag, time() - start_time - arrival)
+            if not self.taskpool.owns(source):
+                continue  # Another node manager ingests the tasks of this source.
+            self.offered += 1
+            submission = asyncio.ensure_future(self.submit(task_data, source))
+            self._pending.add(submission)
+            submission.add_done_callback(self._pending.discard)
+            if time() - report_time >= config.HEART_BEAT_INTERVAL_NODE_MANAGER:
+                self.report()
+                report_time = time()
+        if self._pending:
+            await asyncio.wait(list(self._pending))
+        self.report()
+        log_info("The load generator submitted all tasks.")
+
+    async def submit(self, task_data, source):
+        admission, _ = await self.taskpool.admit_task_async(task_data, source=source)
+        if admission == ADMITTED:
+            self.accepted += 1
+        elif admission == HELD:
+            self.held += 1
+        else:
+            self.rejected += 1
+
+    def report(self):
+        log_metric({'load_generator': {'offered': self.offered, 'accepted': self.accepted,
+                                       'held': self.held, 'rejected': self.rejected,
+                                       'in_flight': len(self._pending),
+                                       'max_lag': round(self.max_lag, 3)}})
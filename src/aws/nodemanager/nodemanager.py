@@ -5,18 +5,28 @@ import asyncio
 import os
 import traceback
 from collections import Counter, deque
-from time import time
 import uuid
 import re
 
 import pandas as pd
 
 import aws.utils.config as config
+from aws.utils.clock import time
 import aws.utils.connection as con
 from aws.resourcemanager.resourcemanager import log_info, log_warning, log_metric, \
     log_error, ResourceManagerCore
+from aws.nodemanager.journal import TaskJournal
+from aws.nodemanager.loadgenerator import LoadGenerator
+from aws.nodemanager.taskqueue import TaskQueue, IngestionLimiter, ADMITTED, HELD, \
+    REJECTED
+from aws.nodemanager.tasktable import TaskTable, NO_DEADLINE
+from aws.nodemanager.tracing import Tracer
+from aws.utils.hashring import ConsistentHashRing
+from aws.utils.metrics import REGISTRY
+from aws.utils.heartbeat import AdaptiveInterval
 from aws.utils.monitor import Listener, Observable
 from aws.utils.packets import HeartBeatPacket, CommandPacket, Packet
+from aws.utils.registry import InstanceRegistry
 from aws.utils.state import InstanceState, TaskState
 
 
@@ -25,26 +35,52 @@ class TaskPool(Observable, con.MultiConnectionServer):
     The TaskPool accepts the tasks from the user.
     """
 
-    def __init__(self, instance_id, host, port, resource_manager):
+    def __init__(self, instance_id, host, port, resource_manager, journal=None, tracer=None):
         Observable.__init__(self)
         con.MultiConnectionServer.__init__(self, host, port)
         self._instance_state = InstanceState(InstanceState.RUNNING)
         self._instance_id = instance_id
         self.resource_manager: ResourceManagerCore = resource_manager
-        self.tasks = deque()  # Available & Unassigned tasks.
+        self.table = TaskTable()  # Timestamps, priority and deadline of tasks not yet done.
+        self.tasks = TaskQueue(table=self.table)  # Available & Unassigned tasks.
+        self.limiter = IngestionLimiter()  # Tasks held back per source due to rate limiting.
+        self.overloaded = False  # True between exceeding the high and reaching the low watermark.
+        self.journal: TaskJournal = journal  # Optional journal to recover the tasks after a restart.
+        self.tracer: Tracer = tracer  # Optional tracer of the latency of the stages of tasks.
+        self.node_managers = {}  # All running node managers and their IP addresses.
+        self.ring = ConsistentHashRing()  # Divides the task sources over the node managers.
+        # Worker: [heartbeat time, program state, cpu usage, mem usage, heartbeat interval].
+        self.worker_health = {}
+        self.heartbeat_interval = AdaptiveInterval('node_manager',
+                                                   config.HEART_BEAT_INTERVAL_NODE_MANAGER)
+        self.heartbeat_settings = {}  # Heartbeat settings of the IM, shared with the workers.
         self.all_assigned_tasks = 0  # Number of tasks which are assigned but not running
         self.task_assignment = {}  # Available & Assigned tasks
         self.task_processing = {}  # Tasks currently being processed
-        self._workers_running = []
-        self._workers_pending = []
-        self.assign_time = {}
+        self.workers = InstanceRegistry()  # Running and pending workers as shared by the IM.
+        self.run_times = deque(maxlen=config.STRAGGLER_WINDOW)  # Recent run_time_task values.
+        self.tasks_arrived = 0  # Tasks accepted since the start, to measure the arrival rate.
+        self.ingested = 0  # Number of rows of the scenario that are ingested.
+        self.uploading = 0  # Tasks admitted by add_task_async of which the upload is not done yet.
+        self.speculated = {}  # Task: workers running a copy of the task.
+        self.cancelled = {}  # Worker: speculative copies that lost and should be cancelled.
+        self.cancel_pending = {}  # Worker: cancelled copies of which the worker is not yet told.
 
     @staticmethod
     def translate(data):
         return re.sub(r'[\n\r\t"\']+', ' ', data)
 
-    def register_task(self, task_data):
-        unique_id_file = str(uuid.uuid4()) + '.txt'
+    @staticmethod
+    def new_task_key():
+        return str(uuid.uuid4()) + '.txt'
+
+    def register_task(self, task_data, key=None):
+        """
+        Upload the text of a task.
+        :param key: Key of the task. If None, a new key is created.
+        :return: Key of the task.
+        """
+        unique_id_file = key if key else self.new_task_key()
         local_path = config.DEFAULT_JOB_LOCAL_DIRECTORY + unique_id_file
         with open(local_path, 'w+') as f:
             f.write(task_data)
@@ -56,20 +92,235 @@ class TaskPool(Observable, con.MultiConnectionServer):
         os.remove(local_path)
         return unique_id_file
 
+    def add_task(self, task_data, priority=None, deadline=None, source=None):
+        """
+        Register a new task and add it to the taskpool. If the source submits more tasks than its
+        rate limit allows, the task is held back until the source has tokens again.
+        :param task_data: Text of the task.
+        :param priority: Priority class of the task. If None, the default priority is used.
+        :param deadline: Optional number of seconds in which the task should be finished.
+        :param source: Optional source (e.g., IP address) that submitted the task.
+        :return: Key of the task or None if the task is held back or rejected due to an overload.
+        """
+        admission, item = self._admit(task_data, priority, deadline, source)
+        if admission != ADMITTED:
+            return None
+        return self._enqueue(*item)
+
+    def _admit(self, task_data, priority, deadline, source):
+        """
+        Decide whether a new task is added to the taskpool now, held back by the rate limit of its
+        source or rejected.
+        :return: Tuple of ADMITTED, HELD or REJECTED and the item of the task to enqueue, of which
+        the last value is the key of the task.
+        """
+        if self.overloaded or self.free_slots() <= 0:
+            return REJECTED, None
+        arrival = time()
+        deadline = arrival + deadline if deadline is not None else None
+        item = (task_data, priority, deadline, source, arrival, self.new_task_key())
+        admission = self.limiter.admit(source, item)
+        if admission == HELD:  # Journaled with its text, as it is not uploaded yet.
+            self._record('hold', item[-1], *item[:-1])
+        return admission, item
+
+    async def add_task_async(self, task_data, priority=None, deadline=None, source=None):
+        """
+        Like add_task, but the task is uploaded in a thread, so the event loop (e.g., the heartbeats
+        and the assignment of tasks) keeps running while tasks are ingested.
+        :return: Key of the task or None if the task is held back or rejected due to an overload.
+        """
+        admission, task = await self.admit_task_async(task_data, priority, deadline, source)
+        return task if admission == ADMITTED else None
+
+    async def admit_task_async(self, task_data, priority=None, deadline=None, source=None):
+        """
+        Like add_task_async, but also tells whether the task is added, held back or rejected.
+        :return: Tuple of ADMITTED, HELD or REJECTED and the key of the task, which is None if the
+        task is rejected.
+        """
+        admission, item = self._admit(task_data, priority, deadline, source)
+        if admission == REJECTED:
+            return admission, None
+        if admission == HELD:
+            return admission, item[-1]
+        upload = time()
+        self.uploading += 1  # Keeps its slot in the table while other tasks are admitted.
+        try:
+            await asyncio.get_event_loop().run_in_executor(None, self.register_task, task_data,
+                                                           item[-1])
+        finally:
+            self.uploading -= 1
+        return admission, self._enqueue(*item, upload=upload)
+
+    def free_slots(self):
+        """
+        Get the number of tasks that can still be admitted, which is the free room in the task
+        table minus the tasks that are being uploaded.
+        """
+        return self.table.free() - self.uploading
+
+    def _enqueue(self, task_data, priority, deadline, source, arrival, task, upload=None):
+        """
+        Add a task to the taskpool.
+        :param arrival: Time the task arrived at the node manager.
+        :param task: Key of the task.
+        :param upload: Time the upload of the task started if it is already registered. If None,
+        the task is registered now.
+        """
+        if upload is None:
+            upload = time()
+            self.register_task(task_data, task)
+        self.tasks.append(task, priority=priority, deadline=deadline, source=source)
+        self.table.set_time(task, 'arrive', arrival)
+        self.table.set_time(task, 'upload', upload)
+        self.tasks_arrived += 1
+        REGISTRY.counter('tasks_arrived_total', "Tasks added to the taskpool.").inc()
+        self._record('add', task, self.tasks.priority(task), deadline, source,
+                     self.table.get_time(task, 'enqueue'))
+        return task
+
+    def _record(self, event, task, *args):
+        if self.journal:
+            self.journal.record(event, task, *args)
+
+    def journal_entries(self):
+        """
+        Get the snapshot of all tasks that are not yet done for the journal.
+        :return: List of [task, priority, deadline, source, enqueue_time, started].
+        """
+        entries = []
+        for task in self.table:
+            deadline = self.table.get_deadline(task)
+            entries.append([task, self.tasks.priority(task),
+                            None if deadline == NO_DEADLINE else deadline,
+                            self.table.get_source(task), self.table.get_time(task, 'enqueue'),
+                            self.table.get_time(task, 'start') is not None])
+        return entries
+
+    def journal_snapshot(self):
+        """
+        Get the snapshot of the TaskPool for the journal: the tasks that are not yet done, the
+        tasks held back by the rate limits and the position of the ingestion of the scenario.
+        :return: Keyword arguments of TaskJournal.snapshot.
+        """
+        held = [[item[-1]] + list(item[:-1])
+                for items in self.limiter.backlog.values() for item in items]
+        return {'entries': self.journal_entries(), 'held': held, 'ingested': self.ingested}
+
+    def recover(self):
+        """
+        Rebuild the taskpool from the journal after a restart. Tasks that were started by a worker
+        are put in front of the taskpool, as the workers are assigned again by the IM. Held tasks
+        return to the backlog of their source, and the ingestion of the scenario resumes after the
+        rows that were already ingested.
+        """
+        if not self.journal:
+            return
+        started = []
+        for task, priority, deadline, source, enqueue, was_started in self.journal.recover():
+            if was_started:
+                started.append((task, priority, deadline, source, enqueue))
+            else:
+                self.tasks.append(task, priority=priority, deadline=deadline, source=source,
+                                  enqueue=enqueue)
+        for task, priority, deadline, source, enqueue in reversed(started):
+            self.tasks.append(task, priority=priority, deadline=deadline, source=source,
+                              enqueue=enqueue, front=True)
+        for task, task_data, priority, deadline, source, arrival in self.journal.held:
+            self.limiter.hold(source, (task_data, priority, deadline, source, arrival, task))
+        self.ingested = self.journal.ingested
+        self.journal.snapshot(**self.journal_snapshot())
+
+    def release_backlog(self):
+        """
+        Add the tasks held back by the rate limits to the taskpool once their sources have tokens.
+        """
+        # Tasks beyond the free room in the table stay in the backlog until tasks are done.
+        for item in self.limiter.release(limit=max(0, self.free_slots())):
+            self._enqueue(*item)
+
+    def set_node_managers(self, node_managers):
+        """
+        Update the running node managers as received from the IM.
+        :param node_managers: Dict of the instance ids and IP addresses of the node managers.
+        """
+        if set(node_managers) != set(self.node_managers):
+            log_info("Node managers changed to {}.".format(node_managers))
+            self.ring = ConsistentHashRing(node_managers)
+        self.node_managers = node_managers
+
+    def owner(self, source):
+        """
+        Get the node manager responsible for the tasks of a source.
+        :param source: Source that submitted the task.
+        :return: Instance id of the node manager. If unknown, this node manager is returned.
+        """
+        return self.ring.get(source) or self._instance_id
+
+    def owns(self, source):
+        """
+        Check whether this node manager ingests the tasks of a source.
+        """
+        return self.owner(source) == self._instance_id
+
+    def tune_heartbeat(self, settings):
+        """
+        Apply the heartbeat settings of the IM and share them with the workers.
+        :param settings: Dict of heartbeat settings per instance type.
+        """
+        self.heartbeat_settings = settings
+        self.heartbeat_interval.tune(settings)
+
+    def queue_depth(self):
+        """
+        Get the number of tasks accepted by the Node Manager that are not yet done.
+        """
+        return len(self.tasks) + self.all_assigned_tasks + \
+            sum(self.limiter.backlog_depth().values())
+
+    def update_overload(self):
+        """
+        Update the overload state based on the high and low watermarks of the queue depth.
+        :return: Boolean indicating if the Node Manager is overloaded.
+        """
+        depth = self.queue_depth()
+        if not self.overloaded and (depth >= config.TASKPOOL_HIGH_WATERMARK or
+                                    self.free_slots() <= 0):
+            self.overloaded = True
+            log_warning("TaskPool overloaded with {} tasks. Rejecting new tasks.".format(depth))
+            log_metric({'overloaded': 1})
+        elif self.overloaded and depth <= config.TASKPOOL_LOW_WATERMARK:
+            self.overloaded = False
+            log_info("TaskPool recovered from overload with {} tasks.".format(depth))
+            log_metric({'overloaded': 0})
+        return self.overloaded
+
     async def create_full_taskpool(self):
         try:
             os.makedirs(config.DEFAULT_JOB_LOCAL_DIRECTORY, exist_ok=True)
 
-            imported_csv = pd.read_csv(os.path.join("src", "data", "all_tasks_scenario.csv"))
-            benchmark_tasks = [(row.Time, self.translate(row.Input)) for _, row in imported_csv.iterrows()]
+            imported_csv = pd.read_csv(config.SCENARIO_FILE)
+            benchmark_tasks = [(row.Time, self.translate(row.Input), row.IP)
+                               for _, row in imported_csv.iterrows()]
             benchmark_tasks = deque(sorted(benchmark_tasks, key=lambda x: x[0]))  # Sort on time.
+            for _ in range(min(self.ingested, len(benchmark_tasks))):
+                benchmark_tasks.popleft()  # Ingested before a restart, so recovered already.
+
+            while not self.ring:  # Wait until the IM has shared the running node managers.
+                await asyncio.sleep(self.heartbeat_interval.current)
 
-            current_time = 0
+            current_time = benchmark_tasks[0][0] if self.ingested and benchmark_tasks else 0
             while benchmark_tasks:  # While there are tasks.
                 while benchmark_tasks and benchmark_tasks[0][0] == current_time:
-                    _, task_data = benchmark_tasks.popleft()
-                    task = self.register_task(task_data)
-                    self.tasks.append(task)  # Append task to the taskpool on given time.
+                    while self.update_overload():  # Slow down ingestion until recovered.
+                        await asyncio.sleep(config.OVERLOAD_RETRY_AFTER)
+                    _, task_data, source = benchmark_tasks.popleft()
+                    if self.owns(source):  # Otherwise another node manager ingests the source.
+                        # Append task to the taskpool on given time.
+                        self.add_task(task_data, source=source)
+                    self.ingested += 1
+                    self._record('ingest', None, self.ingested)
                 current_time += 1
                 await asyncio.sleep(1)
         except Exception as exc:
@@ -82,34 +333,152 @@ class TaskPool(Observable, con.MultiConnectionServer):
         """
         try:
             while True:
-                self.generate_heartbeat()
-
-                while self.tasks:
-                    if not (self._workers_running + self._workers_pending):
-                        log_info("Currently, there are no workers to give work to.")
-                        break  # If there are currently no workers to give work to, wait.
-                    task_per_worker = {key: len(value) for key, value in
-                                       self.task_assignment.items()}
-
-                    task = self.tasks.popleft()
-                    worker = min(task_per_worker, key=task_per_worker.get)
-                    self.task_assignment[worker].append(task)
-                    self.assign_time[task] = time()
-                    self.all_assigned_tasks += 1
-
-                await asyncio.sleep(config.HEART_BEAT_INTERVAL_NODE_MANAGER)
+                self.release_backlog()
+                self.update_overload()
+                if self.heartbeat_interval.due(self.queue_depth()):
+                    self.generate_heartbeat()
+                self.assign_tasks()
+                self.speculate_stragglers()
+                if self.tracer:
+                    self.tracer.flush()
+                await asyncio.sleep(min(config.HEART_BEAT_INTERVAL_NODE_MANAGER,
+                                        self.heartbeat_interval.min_interval))
         except KeyboardInterrupt:
             pass
 
+    def assign_tasks(self):
+        """
+        Assign the tasks in the taskpool to the workers with the least tasks. Workers hold at most
+        MAX_ASSIGNED_PER_WORKER tasks, the remaining tasks wait in the taskpool.
+        """
+        while self.tasks:
+            if not self.workers or not self.task_assignment:
+                log_info("Currently, there are no workers to give work to.")
+                break  # If there are currently no workers to give work to, wait.
+            task_per_worker = {key: len(value) for key, value in
+                               self.task_assignment.items()}
+            worker = min(task_per_worker, key=task_per_worker.get)
+            if task_per_worker[worker] >= config.MAX_ASSIGNED_PER_WORKER:
+                break  # All workers are saturated, keep the tasks in the taskpool.
+
+            task = self.tasks.popleft()
+            self._assign(worker, task)
+            self.table.set_time(task, 'assign', time())
+            self.all_assigned_tasks += 1
+
+    def straggler_threshold(self):
+        """
+        Get the time after which a running task is deemed a straggler.
+        :return: Threshold in seconds or None if there are not enough samples yet.
+        """
+        if len(self.run_times) < config.STRAGGLER_MIN_SAMPLES:
+            return None
+        return self._percentile(self.run_times, config.STRAGGLER_PERCENTILE) * \
+            config.STRAGGLER_FACTOR
+
+    def speculate_stragglers(self):
+        """
+        Duplicate tasks that run far beyond the current run time percentile on idle workers.
+        The first copy reporting done wins, the other copies are cancelled.
+        """
+        threshold = self.straggler_threshold()
+        if threshold is None:
+            return
+        idle_workers = [worker for worker in self.task_assignment
+                        if not self.task_assignment[worker] and not self.task_processing[worker]]
+        current_time = time()
+        for worker, processing in self.task_processing.items():
+            for task in processing:
+                if not idle_workers:
+                    return
+                if task in self.speculated or task in self.cancelled.get(worker, ()):
+                    continue
+                start_time = self.table.get_time(task, 'start') or current_time
+                running_time = current_time - start_time
+                if running_time > threshold:
+                    backup = idle_workers.pop()
+                    self.task_assignment[backup].appendleft(task)
+                    self.speculated[task] = {worker, backup}
+                    log_info("Speculating straggler {} of {} on {}.".format(task, worker, backup))
+                    log_metric({'speculated_task': {'task': task,
+                                                    'running_time': running_time,
+                                                    'threshold': threshold}})
+
+    def _assign(self, worker, task):
+        """
+        Add a task to the assignments of a worker, ordered on the urgency of the tasks.
+        """
+        assignment = self.task_assignment[worker]
+        urgency = self.tasks.urgency(task)
+        for index, other in enumerate(assignment):
+            if self.tasks.urgency(other) > urgency:
+                assignment.insert(index, task)
+                return
+        assignment.append(task)
+
+    def _dispatch(self, worker, task):
+        """
+        Register that a task is sent to a worker for processing.
+        """
+        self.task_processing[worker].append(task)
+        if not self.table.get_time(task, 'start'):  # Speculative copies keep the first start.
+            self.table.set_time(task, 'start', time())
+            self._record('dispatch', task)
+
+    def _resolve_speculation(self, task, winner):
+        """
+        Cancel all copies of a speculated task except the one of the winner.
+        """
+        for worker in self.speculated.pop(task, ()):
+            if worker == winner or worker not in self.task_assignment:
+                continue
+            if task in self.task_assignment[worker]:  # The copy has not started yet.
+                self.task_assignment[worker].remove(task)
+            elif task in self.task_processing[worker]:
+                self.cancelled.setdefault(worker, set()).add(task)
+                self.cancel_pending.setdefault(worker, set()).add(task)
+
+    def _next_task(self, worker, command):
+        """
+        Create the response for a worker that is ready for a new task.
+        :param worker: The worker asking for a new task.
+        :param command: Command to return when there is no task for the worker.
+        :return: Packet to respond to the worker.
+        """
+        packet = CommandPacket(command="task")
+        if len(self.task_assignment[worker]) > 0:
+            # If there are tasks in the taskpool send a new command to the worker
+            packet['task'] = self.task_assignment[worker].popleft()
+        else:
+            stolen_task = self.steal_task(worker)
+            if not stolen_task:
+                return command
+            packet["task"] = stolen_task
+        self._dispatch(worker, packet['task'])
+        if self.tracer and self.tracer.sampled(packet['task']):
+            packet['trace'] = self.tracer.context(packet['task'])
+        return packet
+
+    @staticmethod
+    def _percentile(values, percentile):
+        ordered = sorted(values)
+        index = min(len(ordered) - 1, int(round(percentile / 100 * (len(ordered) - 1))))
+        return ordered[index]
+
     def steal_task(self, worker):
         """
-        Steals a task from the worker with the most number of tasks
+        Steals the most urgent task from the worker with the most number of tasks
         """
         assignments = {key: len(value) for key, value in self.task_assignment.items()}
         victim_worker = max(assignments, key=assignments.get)
         if assignments[victim_worker] >= 2:
-            task = self.task_assignment[victim_worker].pop()
-            self.task_assignment[worker].append(task)
+            # Speculative copies stay on the worker chosen for them.
+            candidates = [task for task in self.task_assignment[victim_worker]
+                          if task not in self.speculated]
+            if not candidates:
+                return None
+            task = min(candidates, key=self.tasks.urgency)
+            self.task_assignment[victim_worker].remove(task)
             return task
         return None
 
@@ -118,15 +487,48 @@ class TaskPool(Observable, con.MultiConnectionServer):
         Based on the new running and pending workers provided by the IM. Finds stopped or
         newly created workers
         """
-        previous_workers = self._workers_running + self._workers_pending
-        total_current = running + pending
-        stopped_workers = [worker for worker in previous_workers if worker not in total_current]
-        new_workers = [worker for worker in total_current if worker not in previous_workers]
-
-        self._workers_running = running
-        self._workers_pending = pending
+        return self.workers.sync('worker', {InstanceState.RUNNING: running,
+                                            InstanceState.PENDING: pending})
 
-        return stopped_workers, new_workers
+    def remove_worker(self, worker):
+        """
+        Remove a stopped worker and put its remaining tasks back into the taskpool.
+        Tasks being processed are put in front, as they were started the earliest.
+        :param worker: The worker that has stopped.
+        """
+        if self.tracer:
+            self.tracer.offsets.remove(worker)
+        processing = self._release_copies(worker, self.task_processing.pop(worker))
+        assigned = self._release_copies(worker, self.task_assignment.pop(worker))
+        self.all_assigned_tasks -= len(processing) + len(assigned)
+        for task in processing:
+            self.table.set_time(task, 'start', 0.0)
+            self._record('requeue', task)
+        self.tasks.extend(assigned)
+        self.tasks.requeue(processing)
+        self.cancelled.pop(worker, None)
+        self.cancel_pending.pop(worker, None)
+        self.worker_health.pop(worker, None)
+
+    def _release_copies(self, worker, tasks):
+        """
+        Filter out the tasks of a worker that should not return to the taskpool, as another
+        worker still runs a copy or a copy has already finished.
+        """
+        remaining = deque()
+        cancelled = self.cancelled.get(worker, ())
+        for task in tasks:
+            if task in cancelled:
+                continue
+            copies = self.speculated.get(task)
+            if copies and worker in copies:
+                copies.discard(worker)
+                if len(copies) <= 1:
+                    del self.speculated[task]
+                if copies:
+                    continue
+            remaining.append(task)
+        return remaining
 
     def generate_heartbeat(self, notify=True):
         """
@@ -140,60 +542,129 @@ class TaskPool(Observable, con.MultiConnectionServer):
                                     instance_state=self._instance_state,
                                     tasks_waiting=self.all_assigned_tasks + len(self.tasks),
                                     tasks_running=len(processing),
-                                    worker_allocation=dict(assignments + processing))
+                                    worker_allocation=dict(assignments + processing),
+                                    queue_depth=self.queue_depth(),
+                                    overloaded=self.overloaded,
+                                    worker_health=self.worker_health,
+                                    tasks_arrived=self.tasks_arrived,
+                                    service_time=sum(self.run_times) / len(self.run_times)
+                                    if self.run_times else None,
+                                    interval=self.heartbeat_interval.current)
+        REGISTRY.gauge('tasks_waiting', "Tasks waiting in the taskpool or assignments.").set(
+            heartbeat['tasks_waiting'])
+        REGISTRY.gauge('tasks_running', "Tasks being processed by workers.").set(
+            heartbeat['tasks_running'])
         log_metric({'tasks_waiting': heartbeat['tasks_waiting'],
                     'tasks_running': heartbeat['tasks_running'],
-                    'tasks_total': heartbeat['tasks_waiting'] + heartbeat['tasks_running']})
+                    'tasks_total': heartbeat['tasks_waiting'] + heartbeat['tasks_running'],
+                    'tasks_queued': self.tasks.depth(),
+                    'source_queued': self.tasks.source_depth(),
+                    'source_backlog': self.limiter.backlog_depth(),
+                    'task_table': {'tasks': len(self.table),
+                                   'bytes': self.table.memory_footprint()}})
 
         if notify:
             self.notify(message=heartbeat)
 
     def process_heartbeat(self, hb, source) -> Packet:
+        self.worker_health[hb['instance_id']] = [hb['time'], hb.get('program_state'),
+                                                 hb['cpu_usage'], hb['mem_usage'],
+                                                 hb.get('interval')]
+        if self.tracer:
+            self.tracer.offsets.observe(hb['instance_id'], hb['time'], time())
+        if self.cancel_pending.get(hb['instance_id']):
+            # Sent once, the worker answers with 'cancelled' or with 'done' if it already finished.
+            return CommandPacket(command="cancel",
+                                 tasks=list(self.cancel_pending.pop(hb['instance_id'])))
         # If the worker has an assigned task, but has not started. Give a task from assigned.
         if not hb['no_hb_task'] and hb['instance_id'] in self.task_assignment:
-            packet = CommandPacket(command="task")
-            assignments = self.task_assignment[hb['instance_id']]
-            if assignments:
-                packet['task'] = assignments.popleft()
-            else:
-                stolen_packet = self.steal_task(hb['instance_id'])
-                if stolen_packet:
-                    packet['task'] = stolen_packet
-                else:
-                    return hb
-            self.task_processing[hb['instance_id']].append(packet['task'])
-            return packet
+            return self._next_task(hb['instance_id'], hb)
 
+        if self.heartbeat_settings:
+            hb['heartbeat_settings'] = self.heartbeat_settings
         return hb
 
     def process_command(self, command: CommandPacket, source):
         if command["command"] == "done":
-            if command["instance_id"] not in (self._workers_running + self._workers_pending):
+            worker = command["instance_id"]
+            if worker not in self.workers:
                 return command
 
-            self.task_processing[command["instance_id"]].popleft()
-            self.all_assigned_tasks -= 1
+            task = command['task']
+            if self.tracer:
+                self.tracer.offsets.observe(worker, command['time'], time())
+            if task in self.task_processing[worker]:
+                self.task_processing[worker].remove(task)
+            if task in self.cancelled.get(worker, ()):
+                # A speculative copy of this task has already finished elsewhere.
+                self.cancelled[worker].discard(task)
+                self.cancel_pending.get(worker, set()).discard(task)
+                log_metric({'speculation_lost': {'task': task,
+                                                 'runtime': command['run_time_task']}})
+                return self._next_task(worker, command)
 
-            response_time = time() - self.assign_time[command['task']]
+            self.all_assigned_tasks -= 1
+            self.run_times.append(command['run_time_task'])
+            self._resolve_speculation(task, winner=worker)
+
+            done_time = time()
+            self.table.set_time(task, 'done', done_time)
+            if self.tracer and command.get('trace'):
+                self.tracer.finish(task, worker, {field: self.table.get_time(task, field)
+                                                  for field in TaskTable.TIMES},
+                                   command['trace'], done_time)
+            assign_time = self.table.get_time(task, 'assign')
+            REGISTRY.counter('tasks_finished_total', "Tasks finished by workers.").inc()
+            REGISTRY.histogram('task_duration_seconds', "Time from dispatch until done.").observe(
+                done_time - command['task_start'])
+            REGISTRY.histogram('task_runtime_seconds', "Processing time on the worker.").observe(
+                command['run_time_task'])
+            if assign_time:
+                REGISTRY.histogram('task_response_seconds',
+                                   "Time from assignment until done.").observe(
+                    done_time - assign_time)
             log_metric({'task_finished': {'start_time': command['task_start'],
-                                          'duration': time() - command['task_start'],
+                                          'duration': done_time - command['task_start'],
                                           'runtime': command['run_time_task'],
                                           'time_to_download': command['time_to_download'],
-                                          'response_time': response_time}})
-
-            packet = CommandPacket(command="task")
-            if len(self.task_assignment[command['instance_id']]) > 0:
-                # If there are tasks in the taskpool send a new command to the worker
-                packet['task'] = self.task_assignment[command['instance_id']].popleft()
-                self.task_processing[command['instance_id']].append(packet['task'])
-            else:
-                stolen_task = self.steal_task(command['instance_id'])
-                if stolen_task:
-                    self.task_processing[command['instance_id']].append(stolen_task)
-                    packet["task"] = stolen_task
-                else:
-                    return command
-            return packet
+                                          'response_time': done_time - assign_time
+                                          if assign_time else None}})
+            self.table.release(task)  # The metrics are emitted, so the metadata can be removed.
+            self._record('done', task)
+            return self._next_task(worker, command)
+        if command["command"] == "submit":
+            if self.update_overload():
+                return CommandPacket(command="overloaded",
+                                     retry_after=config.OVERLOAD_RETRY_AFTER,
+                                     queue_depth=self.queue_depth())
+            task_source = command.get('source', source[0] if source else None)
+            owner = self.owner(task_source)
+            if owner != self._instance_id:
+                return CommandPacket(command="redirect", node_manager=owner,
+                                     ip=self.node_managers.get(owner))
+            priority = command.get('priority', config.INTERACTIVE_PRIORITY)
+            if priority not in self.tasks.weights:
+                return CommandPacket(command="rejected",
+                                     reason="Unknown priority {}".format(priority))
+            admission, item = self._admit(self.translate(command['data']), priority,
+                                          command.get('deadline'), task_source)
+            if admission == ADMITTED:
+                return CommandPacket(command="submitted", task=self._enqueue(*item))
+            if admission == HELD:  # Added later, so the client should not submit it again.
+                return CommandPacket(command="held", task=item[-1])
+            return CommandPacket(command="throttled",
+                                 retry_after=len(self.limiter.backlog.get(task_source, ())) /
+                                 max(self.limiter.rate, 1))
+        if command["command"] == "cancelled":
+            # The worker dropped the cancelled copies, or interrupted the copy it was running.
+            worker = command["instance_id"]
+            for task in command['tasks']:
+                if task in self.task_processing.get(worker, ()):
+                    self.task_processing[worker].remove(task)
+                self.cancelled.get(worker, set()).discard(task)
+            if worker not in self.task_assignment:
+                return CommandPacket(command="done")
+            return self._next_task(worker, CommandPacket(command="done"))
         return command
 
 
@@ -211,23 +682,25 @@ class TaskPoolMonitor(Listener, con.MultiConnectionClient):
         self.send_message(message)
 
     def process_command(self, command):
+        if command['command'] == 'heartbeat_interval':
+            self._tp.tune_heartbeat(command['settings'])
+            return
         log_warning(
             "TaskPoolMonitor received a command {}. "
             "This should not happen!".format(command))
 
     def process_heartbeat(self, heartbeat: HeartBeatPacket):
         if heartbeat['instance_type'] == 'instance_manager':
+            self._tp.set_node_managers(heartbeat.get('node_managers', {}))
+            if heartbeat.get('heartbeat_settings'):
+                self._tp.tune_heartbeat(heartbeat['heartbeat_settings'])
             stopped_workers, new_workers = self._tp.worker_change(
                 running=heartbeat['workers_running'],
                 pending=heartbeat['workers_pending'])
 
             # Add all tasks remaining in stopped worker assignments back to the taskpool
             for worker in stopped_workers:
-                self._tp.all_assigned_tasks -= len(self._tp.task_assignment[worker])
-                self._tp.tasks += self._tp.task_assignment[worker]
-                self._tp.tasks = self._tp.task_processing[worker] + self._tp.tasks
-                del self._tp.task_assignment[worker]
-                del self._tp.task_processing[worker]
+                self._tp.remove_worker(worker)
             for worker in new_workers:
                 self._tp.task_assignment[worker] = deque()
                 self._tp.task_processing[worker] = deque()
@@ -238,6 +711,16 @@ class TaskPoolMonitor(Listener, con.MultiConnectionClient):
                     heartbeat['instance_type'], heartbeat['instance_id'], heartbeat))
 
 
+def ingest(taskpool):
+    """
+    Get the coroutine that ingests the tasks of the benchmark: the scenario, or the arrivals of the
+    load generator if LOAD_ARRIVALS is set.
+    """
+    if config.LOAD_ARRIVALS:
+        return LoadGenerator.from_config(taskpool).run()
+    return taskpool.create_full_taskpool()
+
+
 def start_instance(instance_id, im_host, account_id, nm_host=con.HOST, im_port=con.PORT_IM,
                    nm_port=con.PORT_NM):
     """
@@ -246,22 +729,31 @@ def start_instance(instance_id, im_host, account_id, nm_host=con.HOST, im_port=c
 
     log_info("Starting TaskPool with ID: " + instance_id + ".")
     resource_manager = ResourceManagerCore(instance_id=instance_id, account_id=account_id)
-    taskpool = TaskPool(instance_id=instance_id, host=nm_host, port=nm_port, resource_manager=resource_manager)
+    journal = TaskJournal()
+    tracer = Tracer() if config.TRACE_SAMPLE_RATE else None
+    taskpool = TaskPool(instance_id=instance_id, host=nm_host, port=nm_port,
+                        resource_manager=resource_manager, journal=journal, tracer=tracer)
+    taskpool.recover()
     monitor = TaskPoolMonitor(taskpool=taskpool, host=im_host, port=im_port)
     taskpool.add_listener(monitor)
 
     loop = asyncio.get_event_loop()
-    server_core = asyncio.start_server(taskpool.run, con.HOST, nm_port, loop=loop)
+    server_core = asyncio.start_server(taskpool.run, con.HOST, nm_port, loop=loop,
+                                       limit=config.MAX_BATCH_SIZE)
 
     procs = asyncio.wait([server_core, taskpool.run_task_pool(), monitor.run(),
-                          resource_manager.period_upload_log(), taskpool.create_full_taskpool()])
+                          resource_manager.period_upload_log(), ingest(taskpool),
+                          journal.period_flush(taskpool.journal_snapshot),
+                          resource_manager.period_flush_metrics(),
+                          resource_manager.serve_metrics('node_manager')])
+    clean = False  # The journal is only recovered by the next start after a crash.
     loop.run_until_complete(procs)
     try:
         loop.run_until_complete(procs)
 
         loop.run_forever()
     except KeyboardInterrupt:
-        pass
+        clean = True
     except ConnectionRefusedError as exc:
         log_error("Could not connect to server {}".format(exc))
     finally:
@@ -270,6 +762,9 @@ def start_instance(instance_id, im_host, account_id, nm_host=con.HOST, im_port=c
         for task in tasks:
             task.cancel()
             log_info("Cancelled task {}".format(task))
+        journal.close(clean=clean)
+        if tracer:
+            tracer.flush()
         resource_manager.upload_log(clean=True)
         loop.close()
 
@@ -279,9 +774,10 @@ class Task(dict):
     Task contains all information with regards to a tasks in the TaskPool
     """
 
-    def __init__(self, data, dataType):
+    def __init__(self, data, dataType, priority=config.INTERACTIVE_PRIORITY, deadline=None):
         data = re.sub('\n|\t|\r|\'|"', '', data)
-        super().__init__(data=data, taskType=dataType, state=TaskState.UPLOADING)
+        super().__init__(data=data, taskType=dataType, state=TaskState.UPLOADING,
+                         priority=priority, deadline=deadline)
 
     def get_task_type(self):
         return self['taskType']
@@ -291,3 +787,9 @@ class Task(dict):
 
     def get_task_state(self):
         return self['state']
+
+    def get_priority(self):
+        return self['priority']
+
+    def get_deadline(self):
+        return self['deadline']
@@ -0,0 +1,284 @@
+"""
+Module for the queue of unassigned tasks in the TaskPool.
+"""
+import heapq
+import itertools
+from collections import deque
+
+import aws.utils.config as config
+from aws.utils.clock import time
+from aws.nodemanager.tasktable import TaskTable, NO_DEADLINE
+from aws.resourcemanager.resourcemanager import log_metric
+from aws.utils.metrics import REGISTRY
+
+# Outcomes of the admission of a task by the IngestionLimiter.
+ADMITTED = 'admitted'  # The task can be added to the taskpool now.
+HELD = 'held'  # The task is held in the backlog of its source and added once it has tokens.
+REJECTED = 'rejected'  # The backlog of the source is full, so the task is dropped.
+
+
+class TaskQueue:
+    """
+    Queue of unassigned tasks with priority classes, per-source fair queuing and optional deadlines.
+    Priority classes are served by a smooth weighted round robin. Within a class, the sources that
+    submitted the tasks are served by a smooth weighted round robin as well, so a single noisy source
+    cannot starve the others. Within a source, the task with the earliest deadline goes first,
+    followed by the tasks without a deadline in FIFO order. Tasks whose deadline is about to pass
+    are served first, regardless of their class and source.
+    The priority, source, deadline and enqueue time of the tasks are kept in a TaskTable.
+    """
+
+    def __init__(self, weights=None, source_weights=None, table=None):
+        self.weights = weights if weights else config.PRIORITY_WEIGHTS
+        self.source_weights = source_weights if source_weights else config.SOURCE_WEIGHTS
+        self.table = table if table is not None else TaskTable()
+        # Classes ranked on their weight, the highest weight is the most urgent class.
+        self._classes = sorted(self.weights, key=self.weights.get, reverse=True)
+        self._ranks = {priority: rank for rank, priority in enumerate(self._classes)}
+        self._queues = {priority: {} for priority in self.weights}  # Class: source: heap.
+        self._credit = dict.fromkeys(self.weights, 0)
+        self._source_credit = {priority: {} for priority in self.weights}
+        self._back = itertools.count()
+        self._front = itertools.count(-1, -1)
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def __bool__(self):
+        return self._size > 0
+
+    def __iter__(self):
+        for sources in self._queues.values():
+            for queue in sources.values():
+                for _, _, task in sorted(queue):
+                    yield task
+
+    def append(self, task, priority=None, deadline=None, source=None, enqueue=None, front=False):
+        """
+        Add a new task to the queue.
+        :param task: Key of the task.
+        :param priority: Priority class of the task. If None, the default priority is used.
+        :param deadline: Optional absolute time before which the task should be finished.
+        :param source: Optional source (e.g., IP address) that submitted the task.
+        :param enqueue: Time the task entered the taskpool. If None, the current time is used.
+        :param front: If true, the task is added in front of its class (e.g., when recovered).
+        """
+        priority = priority if priority else config.DEFAULT_PRIORITY
+        if priority not in self._queues:
+            raise ValueError("Unknown priority class: {}".format(priority))
+        self.table.add(task, priority=self._ranks[priority], deadline=deadline, source=source,
+                       enqueue=enqueue if enqueue else time())
+        self._push(task, next(self._front) if front else next(self._back))
+
+    def extend(self, tasks):
+        """
+        Put tasks back at the end of their class, keeping their priority, source and deadline.
+        :param tasks: Keys of the tasks.
+        """
+        for task in tasks:
+            self._push(task, next(self._back))
+
+    def requeue(self, tasks):
+        """
+        Put tasks back in front of their class in the given order, keeping their priority, source
+        and deadline. Used for tasks that were already started by a worker.
+        :param tasks: Keys of the tasks.
+        """
+        for task in reversed(list(tasks)):
+            self._push(task, next(self._front))
+
+    def _push(self, task, sequence):
+        if task not in self.table:
+            self.table.add(task, priority=self._ranks[config.DEFAULT_PRIORITY], enqueue=time())
+        priority = self._classes[self.table.get_priority(task)]
+        heapq.heappush(self._queues[priority].setdefault(self.table.get_source(task), []),
+                       (self.table.get_deadline(task), sequence, task))
+        self._size += 1
+
+    def popleft(self):
+        """
+        Get the task that should be assigned next.
+        :return: Key of the task.
+        """
+        if not self._size:
+            raise IndexError("pop from an empty TaskQueue")
+        urgent = self._urgent_source()
+        if urgent:
+            priority, source = urgent
+        else:
+            priority = self._weighted(self._credit, self.weights, self._queues)
+            source = self._weighted(self._source_credit[priority], self.source_weights,
+                                    self._queues[priority])
+        queue = self._queues[priority][source]
+        _, _, task = heapq.heappop(queue)
+        if not queue:  # Do not keep empty queues of sources that stopped submitting.
+            del self._queues[priority][source]
+            self._source_credit[priority].pop(source, None)
+        self._size -= 1
+        wait = time() - self.table.get_time(task, 'enqueue')
+        REGISTRY.histogram('queue_wait_seconds', "Time tasks wait in the taskpool.",
+                           priority=priority).observe(wait)
+        if config.METRICS_LOG_EVENTS:
+            log_metric({'queue_wait': {'priority': priority, 'wait': wait}})
+        return task
+
+    def _urgent_source(self):
+        """
+        Get the class and source with the earliest deadline if that deadline is about to pass.
+        """
+        heads = [(queue[0][0], priority, source) for priority, sources in self._queues.items()
+                 for source, queue in sources.items()]
+        deadline, priority, source = min(heads, key=lambda head: head[0])
+        if deadline - time() <= config.DEADLINE_URGENCY:
+            return priority, source
+        return None
+
+    @staticmethod
+    def _weighted(credit, weights, queues):
+        """
+        Smooth weighted round robin over the queues that have tasks.
+        :param credit: Credit of the queues, updated in place.
+        :param weights: Weights of the queues. Queues without a weight have weight 1.
+        :param queues: Queues to choose from.
+        :return: The key of the chosen queue.
+        """
+        active = [key for key, queue in queues.items() if queue]
+        for key in active:
+            credit[key] = credit.get(key, 0) + weights.get(key, 1)
+        chosen = max(active, key=credit.get)
+        credit[chosen] -= sum(weights.get(key, 1) for key in active)
+        return chosen
+
+    def urgency(self, task):
+        """
+        Get a sortable urgency of a task, where lower values are more urgent.
+        :param task: Key of the task.
+        :return: Tuple of the class rank and the deadline.
+        """
+        rank = self.table.get_priority(task)
+        if rank is None:
+            return len(self._ranks), NO_DEADLINE
+        return rank, self.table.get_deadline(task)
+
+    def priority(self, task):
+        rank = self.table.get_priority(task)
+        return config.DEFAULT_PRIORITY if rank is None else self._classes[rank]
+
+    def depth(self):
+        """
+        Get the number of queued tasks per priority class.
+        """
+        return {priority: sum(len(queue) for queue in sources.values())
+                for priority, sources in self._queues.items()}
+
+    def source_depth(self):
+        """
+        Get the number of queued tasks per source.
+        """
+        depth = {}
+        for sources in self._queues.values():
+            for source, queue in sources.items():
+                depth[str(source)] = depth.get(str(source), 0) + len(queue)
+        return depth
+
+
+class TokenBucket:
+    """
+    Token bucket allowing `rate` tasks per second with bursts of at most `burst` tasks.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._last = time()
+
+    def _refill(self):
+        current_time = time()
+        self._tokens = min(self.burst, self._tokens + (current_time - self._last) * self.rate)
+        self._last = current_time
+
+    def is_full(self):
+        self._refill()
+        return self._tokens >= self.burst
+
+    def consume(self):
+        """
+        Take a token from the bucket if one is available.
+        :return: Boolean indicating if a token was available.
+        """
+        self._refill()
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return True
+        return False
+
+
+class IngestionLimiter:
+    """
+    Rate limits the ingestion of tasks per source. Tasks of a source that is over its rate are held
+    in a backlog of that source until tokens become available again. Tasks beyond the maximum
+    backlog of a source are rejected.
+    """
+
+    def __init__(self, rate=config.SOURCE_RATE, burst=config.SOURCE_BURST,
+                 max_backlog=config.SOURCE_BACKLOG):
+        self.rate = rate
+        self.burst = burst
+        self.max_backlog = max_backlog
+        self._buckets = {}
+        self.backlog = {}  # Source: deque of held tasks.
+
+    def admit(self, source, item):
+        """
+        Admit a task of a source, hold it in the backlog of the source or reject it.
+        :param source: Source that submitted the task.
+        :param item: Task to admit or hold.
+        :return: ADMITTED, HELD or REJECTED.
+        """
+        held = self.backlog.get(source)
+        if not held and self._bucket(source).consume():
+            return ADMITTED
+        if held and len(held) >= self.max_backlog:
+            return REJECTED
+        self.backlog.setdefault(source, deque()).append(item)
+        return HELD
+
+    def hold(self, source, item):
+        """
+        Put a task in the backlog of its source, e.g., when it is recovered after a restart.
+        """
+        self.backlog.setdefault(source, deque()).append(item)
+
+    def release(self, limit=None):
+        """
+        Release the held tasks for which the sources have tokens again.
+        :param limit: Maximum number of tasks to release (e.g., the free room in the taskpool).
+        Tasks beyond the limit stay in the backlog and keep their tokens.
+        :return: List of released tasks.
+        """
+        released = []
+        for source in list(self.backlog):
+            held = self.backlog[source]
+            bucket = self._bucket(source)
+            while held and (limit is None or len(released) < limit) and bucket.consume():
+                released.append(held.popleft())
+            if not held:
+                del self.backlog[source]
+        # A full bucket is equal to a new bucket, so forget the sources that became idle.
+        for source in [source for source, bucket in self._buckets.items()
+                       if source not in self.backlog and bucket.is_full()]:
+            del self._buckets[source]
+        return released
+
+    def _bucket(self, source):
+        if source not in self._buckets:
+            self._buckets[source] = TokenBucket(self.rate, self.burst)
+        return self._buckets[source]
+
+    def backlog_depth(self):
+        """
+        Get the number of held tasks per source.
+        """
+        return {str(source): len(held) for source, held in self.backlog.items()}
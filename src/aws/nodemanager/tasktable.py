@@ -0,0 +1,125 @@
+"""
+Module for the bounded table of task metadata in the TaskPool.
+"""
+import sys
+from array import array
+
+import aws.utils.config as config
+
+NO_DEADLINE = float('inf')
+
+
+class TaskTableFull(Exception):
+    """
+    Raised when a task is added to a TaskTable that has no free handles left.
+    """
+
+
+class TaskTable:
+    """
+    Bounded table of the metadata of the tasks that are not yet done. Each task gets an integer
+    handle into preallocated arrays, which is released again once the task is done and its metrics
+    are emitted. The memory of the table therefore does not grow with the number of tasks handled.
+    """
+    TIMES = ('arrive', 'upload', 'enqueue', 'assign', 'start', 'done')
+
+    def __init__(self, capacity=None):
+        self.capacity = capacity if capacity else config.TASK_TABLE_CAPACITY
+        self._handles = {}  # Task key: handle.
+        self._free = list(range(self.capacity - 1, -1, -1))
+        self._times = {field: array('d', bytes(8 * self.capacity)) for field in self.TIMES}
+        self._deadline = array('d', [NO_DEADLINE]) * self.capacity
+        self._priority = array('b', bytes(self.capacity))
+        self._source = [None] * self.capacity
+        self._key_bytes = 0  # Size of the keys of the tasks in the table.
+        # The preallocated columns do not change size, so their size is computed once.
+        self._column_bytes = sum(sys.getsizeof(column) for column in
+                                 list(self._times.values()) + [self._deadline, self._priority]) + \
+            sys.getsizeof(self._source)
+
+    def __len__(self):
+        return len(self._handles)
+
+    def __contains__(self, task):
+        return task in self._handles
+
+    def __iter__(self):
+        return iter(list(self._handles))
+
+    def is_full(self):
+        return not self._free
+
+    def free(self):
+        """
+        Get the number of tasks that can still be added.
+        """
+        return len(self._free)
+
+    def add(self, task, priority=0, deadline=None, source=None, enqueue=0.0):
+        """
+        Add a task to the table.
+        :param task: Key of the task.
+        :param priority: Index of the priority class of the task.
+        :param deadline: Optional absolute time before which the task should be finished.
+        :param source: Optional source that submitted the task.
+        :param enqueue: Time the task was added to the taskpool.
+        :return: Handle of the task.
+        """
+        if task in self._handles:
+            return self._handles[task]
+        if not self._free:
+            raise TaskTableFull("TaskTable is full with {} tasks.".format(self.capacity))
+        handle = self._free.pop()
+        self._handles[task] = handle
+        self._key_bytes += sys.getsizeof(task)
+        for field in self.TIMES:
+            self._times[field][handle] = 0.0
+        self._times['enqueue'][handle] = enqueue
+        self._priority[handle] = priority
+        self._deadline[handle] = NO_DEADLINE if deadline is None else deadline
+        self._source[handle] = source
+        return handle
+
+    def set_time(self, task, field, value):
+        if task in self._handles:
+            self._times[field][self._handles[task]] = value
+
+    def get_time(self, task, field):
+        """
+        Get a timestamp of a task.
+        :return: The timestamp or None if the task is unknown or the timestamp is not set.
+        """
+        handle = self._handles.get(task)
+        if handle is None or not self._times[field][handle]:
+            return None
+        return self._times[field][handle]
+
+    def get_priority(self, task):
+        handle = self._handles.get(task)
+        return None if handle is None else self._priority[handle]
+
+    def get_deadline(self, task):
+        handle = self._handles.get(task)
+        return NO_DEADLINE if handle is None else self._deadline[handle]
+
+    def get_source(self, task):
+        handle = self._handles.get(task)
+        return None if handle is None else self._source[handle]
+
+    def release(self, task):
+        """
+        Remove a task from the table and make its handle available again.
+        :param task: Key of the task.
+        """
+        handle = self._handles.pop(task, None)
+        if handle is not None:
+            self._key_bytes -= sys.getsizeof(task)
+            self._source[handle] = None
+            self._free.append(handle)
+
+    def memory_footprint(self):
+        """
+        Get the approximate number of bytes used by the table.
+        """
+        return self._column_bytes + sys.getsizeof(self._free) + sys.getsizeof(self._handles) + \
+            self._key_bytes
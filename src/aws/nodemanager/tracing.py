@@ -0,0 +1,183 @@
+"""
+Module for the per-task latency traces of the TaskPool.
+"""
+import json
+import os
+import zlib
+from collections import deque
+
+import numpy as np
+
+import aws.utils.config as config
+
+# Consecutive stages of a task. The duration of a stage is the time between the previous and the
+# next timestamp, so the stages of a trace add up to the time from arrival until reported done:
+#  - ingest: arrival at the node manager until the upload starts (e.g., held back by rate limits).
+#  - upload: upload of the task to S3.
+#  - queue: waiting in the taskpool until assigned to a worker.
+#  - assign: waiting in the assignment of the worker until sent to the worker.
+#  - dispatch: sent to the worker until the worker starts it.
+#  - download, tokenize, inference: processing on the worker.
+#  - report: the worker reports the task done until the node manager receives the report.
+STAGES = ('ingest', 'upload', 'queue', 'assign', 'dispatch', 'download', 'tokenize', 'inference',
+          'report')
+
+# Stages timed by the worker, in the order of the spans in the trace context of a done command.
+WORKER_STAGES = ('download', 'tokenize', 'inference')
+
+
+class ClockOffsets:
+    """
+    Estimates the offset of the clocks of other instances to the local clock from the timestamps
+    of their packets. The difference between the receive time and the send time of a packet is the
+    clock offset plus the network delay, so the minimum difference over recent packets is used.
+    The estimate includes the minimum delay, which is small within the region.
+    """
+
+    def __init__(self, window=config.TRACE_OFFSET_WINDOW):
+        self.window = window
+        self._samples = {}  # Instance id: recent (receive time - send time) values.
+
+    def observe(self, instance_id, remote_time, local_time):
+        """
+        Add a sample of a packet.
+        :param remote_time: Time the packet was sent, according to the clock of the instance.
+        :param local_time: Time the packet was received, according to the local clock.
+        """
+        self._samples.setdefault(instance_id, deque(maxlen=self.window)).append(
+            local_time - remote_time)
+
+    def get(self, instance_id):
+        """
+        Get the value to add to a time of an instance to convert it to the local clock.
+        """
+        samples = self._samples.get(instance_id)
+        return min(samples) if samples else 0.0
+
+    def remove(self, instance_id):
+        self._samples.pop(instance_id, None)
+
+
+class Tracer:
+    """
+    Collects the traces of a sample of the tasks and exports them to a file. Every line of the
+    file is a compact JSON list: [task, worker, arrival time, duration of each of the STAGES].
+    Durations that are unknown (e.g., of tasks recovered from the journal) are null.
+    """
+
+    def __init__(self, path=config.TRACE_FILE, sample_rate=config.TRACE_SAMPLE_RATE):
+        self.path = path
+        self.sample_rate = sample_rate
+        self.offsets = ClockOffsets()
+        self._buffer = []
+
+    def sampled(self, task):
+        """
+        Check whether a task is traced. The decision depends on the key only, so copies of a task
+        on different workers are all traced or not at all.
+        """
+        return zlib.crc32(task.encode()) % 10000 < self.sample_rate * 10000
+
+    def context(self, task):
+        """
+        Get the trace context that is sent to a worker along with a task.
+        """
+        return {'id': task}
+
+    @staticmethod
+    def worker_context(task_context, received, spans, sent):
+        """
+        Create the trace context a worker returns with a done command.
+        :param task_context: Trace context of the task command.
+        :param received: Time the worker started the task.
+        :param spans: List of (start, end) of the WORKER_STAGES.
+        :param sent: Time the worker reports the task done.
+        """
+        return dict(task_context, received=received, spans=[list(span) for span in spans],
+                    sent=sent)
+
+    def finish(self, task, worker, times, context, done_time):
+        """
+        Build the trace of a finished task and buffer it for the export.
+        :param times: Dict of the node manager timestamps of the task ('arrive', 'upload',
+        'enqueue', 'assign' and 'start'), of which some may be None.
+        :param context: Trace context returned by the worker.
+        :param done_time: Time the node manager received the done command.
+        :return: The trace.
+        """
+        offset = self.offsets.get(worker)
+
+        def local(value):
+            return value + offset if value is not None else None
+
+        spans = context.get('spans') or [[None, None]] * len(WORKER_STAGES)
+        points = [times.get('arrive'), times.get('upload'), times.get('enqueue'),
+                  times.get('assign'), times.get('start'), local(context.get('received'))]
+        durations = [self._duration(start, end) for start, end in zip(points, points[1:])]
+        durations += [self._duration(start, end) for start, end in spans]
+        durations.append(self._duration(local(context.get('sent')), done_time))
+        trace = [task, worker, times.get('arrive') or times.get('enqueue')] + durations
+        self._buffer.append(json.dumps(trace, separators=(',', ':')))
+        return trace
+
+    @staticmethod
+    def _duration(start, end):
+        if start is None or end is None:
+            return None
+        return round(end - start, 6)
+
+    def flush(self):
+        """
+        Append the buffered traces to the file.
+        """
+        if not self._buffer:
+            return
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with open(self.path, 'a') as file:
+            file.write('\n'.join(self._buffer) + '\n')
+        self._buffer = []
+
+
+def read_traces(path):
+    """
+    Read an exported trace file.
+    :return: List of dicts with the task, worker, arrival time and the duration of each stage.
+    """
+    traces = []
+    with open(path) as file:
+        for line in file:
+            if line.strip():
+                values = json.loads(line)
+                trace = dict(zip(('task', 'worker', 'arrival') + STAGES, values))
+                traces.append(trace)
+    return traces
+
+
+def stage_histograms(traces, bins=None):
+    """
+    Aggregate traces into a latency histogram and percentiles per stage.
+    :param traces: Traces as read by read_traces.
+    :param bins: Upper bounds of the bins in seconds, by default logarithmic from 1 ms to 1000 s.
+    :return: Dict of stage: {'count', 'mean', 'p50', 'p90', 'p99', 'bins', 'histogram'}.
+    """
+    bins = bins if bins is not None else [10 ** exponent for exponent in range(-3, 4)]
+    result = {}
+    for stage in STAGES + ('total',):
+        if stage == 'total':
+            values = [sum(trace[name] for name in STAGES) for trace in traces
+                      if all(trace[name] is not None for name in STAGES)]
+        else:
+            values = [trace[stage] for trace in traces if trace[stage] is not None]
+        if not values:
+            continue
+        # Count the values up to and including each bound, and larger values in the last bin.
+        indices = np.minimum(np.searchsorted(bins, values, side='left'), len(bins) - 1)
+        histogram = np.bincount(indices, minlength=len(bins))
+        result[stage] = {'count': len(values),
+                         'mean': round(float(np.mean(values)), 6),
+                         'p50': round(float(np.percentile(values, 50)), 6),
+                         'p90': round(float(np.percentile(values, 90)), 6),
+                         'p99': round(float(np.percentile(values, 99)), 6),
+                         'bins': list(bins),
+                         'histogram': histogram.tolist()}
+    return result
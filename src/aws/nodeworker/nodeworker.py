@@ -12,7 +12,11 @@ import numpy as np
 
 import aws.utils.config as config
 import aws.utils.connection as con
-from aws.resourcemanager.resourcemanager import log_info, log_error, ResourceManagerCore
+from aws.nodemanager.tracing import Tracer
+from aws.resourcemanager.resourcemanager import log_info, log_error, log_sampled, LogSampler, \
+    ResourceManagerCore
+from aws.utils.heartbeat import AdaptiveInterval
+from aws.utils.metrics import REGISTRY
 from aws.utils.monitor import Observable, Listener
 from aws.utils.packets import CommandPacket, HeartBeatPacket
 from aws.utils.state import ProgramState, InstanceState
@@ -34,13 +38,16 @@ class WorkerCore(Observable, con.MultiConnectionClient):
         self.storage_connector: ResourceManagerCore = storage_connector
         self._task_queue = deque()
         self.current_task = None
+        self._current_cancelled = False  # True if the current task is cancelled while it runs.
         self.args = {}
+        self._response_log = LogSampler()
         self._model = Senti()
         self._model.set_pretrained_embeddings(20000, 100, np.zeros([20000, 100]))
         self._model.build(input_shape=(100, 1))
         log_info("[PROGRESS] Loaded model..")
         self._model.load_weights(os.path.join("src", "aws", "nodeworker", "Senti.h5"))
         self._task_command_received = False
+        self.heartbeat_interval = AdaptiveInterval('worker', config.HEART_BEAT_INTERVAL_WORKER)
 
     def process_command(self, command: CommandPacket):
         # Enqueue for worker here!
@@ -49,6 +56,23 @@ class WorkerCore(Observable, con.MultiConnectionClient):
             self._task_command_received = True
         if command['command'] == 'done':
             self._task_command_received = False
+        if command['command'] == 'cancel':
+            # Drop speculative copies that already finished on another worker.
+            cancelled = [task for task in self._task_queue if task['task'] in command['tasks']]
+            for task in cancelled:
+                self._task_queue.remove(task)
+            if self.current_task and self.current_task['task'] in command['tasks']:
+                self._current_cancelled = True  # Interrupted by process between its stages.
+            if cancelled:
+                self.send_message(CommandPacket(command="cancelled",
+                                                instance_id=self._instance_id,
+                                                tasks=[task['task'] for task in cancelled]))
+        if command['command'] == 'heartbeat_interval':
+            self.heartbeat_interval.tune(command['settings'])
+
+    def process_heartbeat(self, heartbeat: HeartBeatPacket):
+        if heartbeat.get('heartbeat_settings'):
+            self.heartbeat_interval.tune(heartbeat['heartbeat_settings'])
 
     async def heartbeat(self):
         """
@@ -56,8 +80,11 @@ class WorkerCore(Observable, con.MultiConnectionClient):
         """
         try:
             while True:
-                self.generate_heartbeat()
-                await asyncio.sleep(config.HEART_BEAT_INTERVAL_WORKER)
+                load = len(self._task_queue) + (1 if self.current_task else 0)
+                # An idle worker only gets its next task in the response to a heartbeat.
+                if self.heartbeat_interval.due(load, idle=load == 0):
+                    self.generate_heartbeat()
+                await asyncio.sleep(self.heartbeat_interval.min_interval)
         except KeyboardInterrupt:
             pass
 
@@ -86,17 +113,27 @@ class WorkerCore(Observable, con.MultiConnectionClient):
                         key=task_file_name,
                         bucket_name=self.storage_connector.files_bucket
                     )
-                    time_to_download = round(time() - start_time_download, 5)
+                    end_time_download = time()
+                    time_to_download = round(end_time_download - start_time_download, 5)
+                    if await self._interrupted():
+                        continue
                     with open(filepath, 'r') as f:
                         input_data = "".join(f.readlines())
                         log_info("Read downloaded file {}.".format(filepath))
 
+                        start_time_tokenize = time()
                         input_sequences = Tokenize.tokenize_text(
                             os.path.join("src", "aws", "nodeworker", "tokenizer_20000.pickle"),
                             input_data)
+                        if await self._interrupted():
+                            continue
+                        start_time_inference = time()
                         labels = self._model.predict(input_sequences)
+                        end_time_inference = time()
 
                         run_time_task = round(time() - start_time_task, 5)
+                        REGISTRY.histogram('inference_seconds', "Duration of the predictions.") \
+                            .observe(end_time_inference - start_time_inference)
                         # Send command with completed task, results and instance id completed
                         message = CommandPacket(command="done",
                                                 argmax=np.argmax(labels),
@@ -105,8 +142,16 @@ class WorkerCore(Observable, con.MultiConnectionClient):
                                                 task_start=self.current_task['time'],
                                                 time_to_download=time_to_download,
                                                 run_time_task=run_time_task)
+                        if self.current_task.get('trace'):
+                            message['trace'] = Tracer.worker_context(
+                                self.current_task['trace'], received=start_time_task,
+                                spans=[(start_time_download, end_time_download),
+                                       (start_time_tokenize, start_time_inference),
+                                       (start_time_inference, end_time_inference)],
+                                sent=message['time'])
 
-                        log_info("[PROGRESS] Created response {}".format(message))
+                        log_sampled(self._response_log, "[PROGRESS] Created response {}",
+                                    message)
 
                         self.send_message(message)
 
@@ -121,6 +166,23 @@ class WorkerCore(Observable, con.MultiConnectionClient):
             log_error("Worker process crashed {}: {}".format(exc, traceback.format_exc()))
             self.storage_connector.upload_log(clean=False)
 
+    async def _interrupted(self):
+        """
+        Let the connection process received commands between the stages of a task, and stop the
+        current task if it is a speculative copy that was cancelled in the meantime.
+        :return: Boolean indicating if the current task is stopped.
+        """
+        await asyncio.sleep(0)
+        if not self._current_cancelled:
+            return False
+        log_info("Interrupted cancelled task {}.".format(self.current_task['task']))
+        self.send_message(CommandPacket(command="cancelled", instance_id=self._instance_id,
+                                        tasks=[self.current_task['task']]))
+        self._program_state = ProgramState(ProgramState.PENDING)
+        self._current_cancelled = False
+        self.current_task = None
+        return True
+
     def generate_heartbeat(self, notify=True):
         heartbeat = HeartBeatPacket(instance_id=self._instance_id,
                                     instance_type='worker',
@@ -129,7 +191,8 @@ class WorkerCore(Observable, con.MultiConnectionClient):
                                     queue_size=len(self._task_queue),
                                     current_task_start=self.current_task['time'] if self.current_task else '',
                                     args=self.args,
-                                    no_hb_task=self._task_command_received)
+                                    no_hb_task=self._task_command_received,
+                                    interval=self.heartbeat_interval.current)
         # self.send_message(message=heartbeat)
         if notify:  # Notify to the listeners (i.e., WorkerMonitor).
             self.notify(message=heartbeat)
@@ -143,6 +206,8 @@ class WorkerMonitor(Listener, con.MultiConnectionClient):
         self.core = core
         Listener.__init__(self)
         con.MultiConnectionClient.__init__(self, host, port)
+        self._skipped_heartbeats = 0
+        self._event_log = LogSampler()
 
     def event(self, message):
         """
@@ -150,16 +215,41 @@ class WorkerMonitor(Listener, con.MultiConnectionClient):
         notified through the event function with a dict message result.
         :param message: Message of the event in dict format.
         """
+        if config.HEARTBEAT_AGGREGATION and not self._needs_direct_heartbeat(message):
+            # The node manager reports the health of this worker to the IM.
+            self._skipped_heartbeats += 1
+            return
+        self._skipped_heartbeats = 0
         if self.connection_lost:
             message['error_monitor'] = self.last_exception
             message['trace_monitor'] = self.last_trace
         if self.core.connection_lost:
             message['error_core'] = self.core.last_exception
             message['trace_core'] = self.core.last_trace
-        log_info("Sending message: {}.".format(message))
+        log_sampled(self._event_log, "Sending message: {}.", message)
         self.send_message(message)
 
+    def _needs_direct_heartbeat(self, message):
+        """
+        Check if a heartbeat should be sent directly to the IM, which is the case for errors, when
+        the node manager is unreachable, and periodically as a fallback.
+        """
+        return self.core.connection_lost or self.connection_lost or message.get('args') or \
+            message.get('program_state') == str(ProgramState(ProgramState.ERROR)) or \
+            self._skipped_heartbeats + 1 >= config.HEARTBEAT_FALLBACK_RATIO
+
+    def process_heartbeat(self, heartbeat: HeartBeatPacket):
+        if heartbeat.get('heartbeat_settings'):
+            self.core.heartbeat_interval.tune(heartbeat['heartbeat_settings'])
+        node_manager = heartbeat.get('node_manager')
+        if node_manager and (node_manager != self.core.host or self.core.connection_lost):
+            # The IM remapped this worker, e.g., because its node manager failed.
+            self.core.reconnect(node_manager)
+
     def process_command(self, command: CommandPacket):
+        if command['command'] == 'heartbeat_interval':
+            self.core.heartbeat_interval.tune(command['settings'])
+            return
         if command['command'] == 'stop':
             log_error("Command 'stop' is not yet implemented.")
             raise NotImplementedError("Client has not yet implemented [stop].")
@@ -185,7 +275,8 @@ def start_instance(instance_id, host_im, host_nm, account_id, port_im=con.PORT_I
     loop = asyncio.get_event_loop()
     procs = asyncio.wait(
         [worker_core.run(), worker_core.heartbeat(), worker_core.process(), monitor.run(),
-         storage_connector.period_upload_log()])
+         storage_connector.period_upload_log(), storage_connector.period_flush_metrics(),
+         storage_connector.serve_metrics('worker')])
     try:
         loop.run_until_complete(procs)
     except KeyboardInterrupt:
@@ -2,59 +2,151 @@
 Module for the Resource Manager.
 """
 import asyncio
+import atexit
 import json
 import logging
+import logging.handlers
+import queue
 import shutil
 import os
+import sys
 import traceback
 from datetime import datetime
 from pytz import timezone
-from time import time
 
 import boto3
 from botocore.exceptions import ClientError, DataNotFoundError
 from boto3.exceptions import S3UploadFailedError
 
 import aws.utils.config as config
+from aws.utils.clock import time
+from aws.utils.localcloud import LocalCloud
+from aws.utils.metrics import REGISTRY, handle_request
 from aws.utils.monitor import Observable
 from aws.utils.state import InstanceState
 
 
 def log_metric(metric: dict):
+    """
+    Log a metric, which is read by experiment.experiment. Metrics have their own logger, so they
+    are logged regardless of LOG_LEVEL.
+    """
     metric['time'] = time()
-    logging.info("METRIC{}".format(json.dumps(metric)))
+    if _METRIC_LOGGER.isEnabledFor(logging.INFO):
+        _METRIC_LOGGER.info("METRIC{}".format(json.dumps(metric)))
 
 
-def log_info(message):
-    print(message)
-    if not isinstance(message, str):
-        message = json.dumps(message)
-    logging.info(message)
+def log_info(message, *args):
+    """
+    Log a message. Messages are written to the log file by a background thread.
+    :param message: Message, or format string of the args. The args are only formatted if the
+    level is enabled, so use them for expensive messages (e.g., with packets).
+    """
+    _log(logging.INFO, message, args)
 
 
-def log_warning(message):
-    print(message)
-    if not isinstance(message, str):
-        message = json.dumps(message)
-    logging.warning(message)
+def log_warning(message, *args):
+    _log(logging.WARNING, message, args)
 
 
-def log_error(message):
-    print(message)
-    if not isinstance(message, str):
-        message = json.dumps(message)
-    logging.error(message)
+def log_error(message, *args):
+    _log(logging.ERROR, message, args)
+
 
+def log_exception(message, *args):
+    _log(logging.ERROR, message, args, exc_info=True)
 
-def log_exception(message):
-    print(message)
-    if not isinstance(message, str):
+
+def log_sampled(sampler, message, *args):
+    """
+    Log a message of a high-volume event (e.g., every packet) at the info level, if it is sampled.
+    :param sampler: LogSampler of the event.
+    """
+    if not _LOGGER.isEnabledFor(logging.INFO) or not sampler.sample():
+        return
+    message = message.format(*args)
+    if sampler.every > 1:
+        message += ' [1 in {} logged]'.format(sampler.every)
+    _LOGGER.info(message)
+
+
+def _log(level, message, args, exc_info=False):
+    if not _LOGGER.isEnabledFor(level):
+        return  # Checked first, so a disabled message is never formatted.
+    if args:
+        message = message.format(*args)
+    elif not isinstance(message, str):
         message = json.dumps(message)
-    logging.exception(message)
+    _LOGGER.log(level, message, exc_info=exc_info)
+
 
+def flush_logs():
+    """
+    Wait until the background thread has written all queued messages (e.g., before uploading the
+    log file).
+    """
+    if _LOG_LISTENER is not None:
+        _LOG_QUEUE.join()
+
+
+class LogSampler:
+    """
+    Samples the messages of a high-volume event: only the first of every `every` messages is logged.
+    """
+
+    def __init__(self, every=config.LOG_PACKET_SAMPLE_EVERY):
+        self.every = max(1, every)
+        self._count = 0
+
+    def sample(self):
+        self._count += 1
+        return (self._count - 1) % self.every == 0
+
+
+class QueueHandler(logging.handlers.QueueHandler):
+    """
+    Hands the log records to the background writer. If the writer falls behind and the queue is
+    full, records are dropped (and counted) instead of blocking the event loop.
+    """
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            REGISTRY.counter('log_records_dropped_total',
+                             "Log records dropped because the log queue was full.").inc()
 
-# Initialize the logger.
-logging.basicConfig(filename=config.DEFAULT_LOG_FILE + '.log', level=logging.INFO)
+
+class StdoutHandler(logging.StreamHandler):
+    """
+    Writes to the current sys.stdout, so a redirect of the output (e.g., by the simulator) applies.
+    """
+
+    def emit(self, record):
+        self.stream = sys.stdout
+        super().emit(record)
+
+
+def _stop_logging():
+    global _LOG_LISTENER
+    if _LOG_LISTENER is not None:
+        _LOG_LISTENER.stop()  # Writes the remaining records.
+        _LOG_LISTENER = None
+
+
+# Initialize the logger: records are queued and written to the log file (and stdout) by a thread.
+_LOGGER = logging.getLogger()
+_LOGGER.setLevel(config.LOG_LEVEL)
+_METRIC_LOGGER = logging.getLogger('metric')  # Its records are written by the handlers of _LOGGER.
+_METRIC_LOGGER.setLevel(logging.INFO)
+_LOG_QUEUE = queue.Queue(config.LOG_QUEUE_SIZE)
+_file_handler = logging.FileHandler(config.DEFAULT_LOG_FILE + '.log')
+_file_handler.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+_LOG_LISTENER = logging.handlers.QueueListener(
+    _LOG_QUEUE, *([_file_handler, StdoutHandler()] if config.LOG_STDOUT else [_file_handler]))
+_LOGGER.addHandler(QueueHandler(_LOG_QUEUE))
+_LOG_LISTENER.start()
+atexit.register(_stop_logging)
 
 
 class ResourceManagerCore(Observable):
@@ -62,8 +154,11 @@ class ResourceManagerCore(Observable):
     def __init__(self, instance_id, account_id):
         super().__init__()
         self._instance_state = InstanceState(InstanceState.RUNNING)
-        self.s3 = boto3.client('s3')
-        self.s3_resource = boto3.resource('s3')
+        if config.LOCAL_CLOUD:  # Run by the local harness, see aws.utils.localcloud.
+            self.s3 = self.s3_resource = LocalCloud(config.LOCAL_CLOUD).s3()
+        else:
+            self.s3 = boto3.client('s3')
+            self.s3_resource = boto3.resource('s3')
         self.s3_session = boto3.session.Session()
         self.account_id = account_id
         self.files_bucket = None
@@ -134,7 +229,10 @@ class ResourceManagerCore(Observable):
                 print("Wrong value passed to S3 upload_file {}: {}".format(exc, traceback.format_exc()))
             except Exception as exc:
                 print("Could not upload file due to exception {}: {}".format(exc, traceback.format_exc()))
-        log_metric({'upload_duration': time() - start_time})
+        REGISTRY.histogram('s3_upload_seconds', "Duration of S3 uploads.").observe(
+            time() - start_time)
+        if config.METRICS_LOG_EVENTS:
+            log_metric({'upload_duration': time() - start_time})
 
     def download_file(self, bucket_name, key, file_path):
         """
@@ -158,10 +256,14 @@ class ResourceManagerCore(Observable):
             except DataNotFoundError:
                 log_error(
                     "There is no key {} in bucket {} so a file cannot be downloaded from it.".format(key, bucket_name))
-        log_metric({'download_duration': time() - start_time})
+        REGISTRY.histogram('s3_download_seconds', "Duration of S3 downloads.").observe(
+            time() - start_time)
+        if config.METRICS_LOG_EVENTS:
+            log_metric({'download_duration': time() - start_time})
 
     def upload_log(self, clean):
         try:
+            flush_logs()
             temporary_copy = config.DEFAULT_LOG_FILE + '_copy.log'
             shutil.copy(config.DEFAULT_LOG_FILE + '.log', temporary_copy)
             if clean:  # If clean, do not keep the log.
@@ -184,3 +286,24 @@ class ResourceManagerCore(Observable):
         while True:
             self.upload_log(clean=False)
             await asyncio.sleep(config.LOGGING_INTERVAL)
+
+    async def period_flush_metrics(self):
+        """
+        Log the current values of the metrics of the process periodically.
+        """
+        while True:
+            await asyncio.sleep(config.METRICS_FLUSH_INTERVAL)
+            log_metric({'metrics': REGISTRY.snapshot()})
+
+    async def serve_metrics(self, instance_type):
+        """
+        Serve the metrics of the process over HTTP on the port of the instance type.
+        """
+        port = config.METRICS_PORT.get(instance_type)
+        if port is None:
+            return
+        try:
+            await asyncio.start_server(handle_request, config.METRICS_HOST, port)
+            log_info("Serving metrics on {}:{}.".format(config.METRICS_HOST, port))
+        except OSError as exc:  # E.g., several local workers on the same host.
+            log_warning("Could not serve metrics on port {}: {}".format(port, exc))
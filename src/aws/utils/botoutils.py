@@ -1,45 +1,127 @@
+from time import time
+
 import boto3
 
+import aws.utils.config as config
 from aws.utils.state import InstanceState
 
 
 class BotoInstanceReader:
-
-    def __init__(self, region_name=None):
-        sess = boto3.session.Session()
-        if region_name:
-            self.ec2 = sess.client('ec2', region_name=region_name)
-            self.ssm = sess.client('ssm', region_name=region_name)
+    """
+    Reads the instances of the application from EC2. The instances are kept in an inventory, which
+    is refreshed by a full describe and updated with the responses of start and stop calls, so
+    decisions such as which worker to start do not need a describe of the account.
+    """
+
+    def __init__(self, region_name=None, ec2=None, ssm=None):
+        sess = boto3.session.Session() if not (ec2 and ssm) else None
+        kwargs = {'region_name': region_name} if region_name else {}
+        self.ec2 = ec2 if ec2 else sess.client('ec2', **kwargs)
+        self.ssm = ssm if ssm else sess.client('ssm', **kwargs)
+        self.inventory = {}  # Instance id: BotoInstance, as last described or changed.
+        self._described = None  # Time of the last full describe.
+
+    def read_ids(self, own_instance, filters=None, boto_response: dict = None, cached=False):
+        if cached:
+            output = self.read_cached(own_instance, filters)
         else:
-            self.ec2 = sess.client('ec2')
-            self.ssm = sess.client('ssm')
-
-    def read_ids(self, own_instance, filters=None, boto_response: dict = None):
-        output = self.read(own_instance, filters, boto_response=boto_response)
+            output = self.read(own_instance, filters, boto_response=boto_response)
         return [inst.instance_id for inst in output]
 
+    def describe(self, tag_names=config.EC2_NAME_TAGS):
+        """
+        Describe the instances of the application, following all pages of the response.
+        :param tag_names: Values of the Name tag of the instances to describe. If empty, all
+        instances of the account are described.
+        :return: A dict in the format of the boto3 describe-instances response.
+        """
+        kwargs = {'MaxResults': config.EC2_PAGE_SIZE}
+        if tag_names:
+            kwargs['Filters'] = [{'Name': 'tag:Name', 'Values': list(tag_names)}]
+        reservations = []
+        while True:
+            response = self.ec2.describe_instances(**kwargs)
+            reservations.extend(response['Reservations'])
+            if not response.get('NextToken'):
+                return {'Reservations': reservations}
+            kwargs['NextToken'] = response['NextToken']
+
     def read(self, own_instance, filters=None, boto_response: dict = None):
         """
         Read the boto response of ec2 describe-instance and convert to a list of
         BotoInstances.
         :param own_instance: The instance_id of the instance manager.
         :param filters: Any filters if wanted. E.g., `is-running`.
-        :param boto_response: A dict containing the boto3 describe-instances response.
+        :param boto_response: A dict containing the boto3 describe-instances response. If None,
+        the instances are described and the inventory is refreshed.
+        :return: List of BotoInstances.
+        """
+        refresh = not boto_response
+        if refresh:
+            boto_response = self.describe()
+        instances = [BotoInstance.instance(json_instance)
+                     for reservation in boto_response['Reservations']
+                     for json_instance in reservation['Instances']]
+        if refresh:
+            self.inventory = {instance.instance_id: instance for instance in instances}
+            self._described = time()
+        return self._select(instances, own_instance, filters)
+
+    def read_cached(self, own_instance, filters=None):
+        """
+        Read the instances from the inventory, which is refreshed if it is older than
+        EC2_INVENTORY_MAX_AGE seconds.
+        :param own_instance: The instance_id of the instance manager.
+        :param filters: Any filters if wanted. E.g., `is-running`.
         :return: List of BotoInstances.
         """
-        if filters is None:
-            filters = []
-        if not boto_response:
-            boto_response = self.ec2.describe_instances()
-        boto_instances = []
-        for reserverations in boto_response['Reservations']:
-            json_instance = reserverations['Instances'][0]
-            boto_instance = BotoInstance.instance(json_instance)
-            # Remove the Instance Manager and if the filter_out option wants it.
-            if boto_instance.instance_id != own_instance and not BotoInstanceReader._filter_out(
-                    boto_instance, filters):
-                boto_instances.append(boto_instance)
-        return boto_instances
+        if self.inventory_expired():
+            return self.read(own_instance, filters)
+        return self._select(self.inventory.values(), own_instance, filters)
+
+    def inventory_expired(self):
+        return self._described is None or time() - self._described > config.EC2_INVENTORY_MAX_AGE
+
+    def describe_ids(self, instance_ids):
+        """
+        Describe specific instances and update them in the inventory.
+        :param instance_ids: Instance ids to describe.
+        :return: List of BotoInstances.
+        """
+        response = self.ec2.describe_instances(InstanceIds=list(instance_ids))
+        instances = [BotoInstance.instance(json_instance)
+                     for reservation in response['Reservations']
+                     for json_instance in reservation['Instances']]
+        for instance in instances:
+            if instance.instance_id in self.inventory:
+                self.inventory[instance.instance_id] = instance
+        return instances
+
+    @staticmethod
+    def _select(instances, own_instance, filters):
+        # Remove the Instance Manager and if the filter_out option wants it.
+        return [instance for instance in instances if instance.instance_id != own_instance and
+                not BotoInstanceReader._filter_out(instance, filters if filters else [])]
+
+    def start_instances(self, instance_ids):
+        response = self.ec2.start_instances(InstanceIds=instance_ids)
+        self.update_inventory(response.get('StartingInstances', []))
+        return response
+
+    def stop_instances(self, instance_ids):
+        response = self.ec2.stop_instances(InstanceIds=instance_ids)
+        self.update_inventory(response.get('StoppingInstances', []))
+        return response
+
+    def update_inventory(self, state_changes):
+        """
+        Update the inventory with the state changes returned by start or stop calls.
+        :param state_changes: List of dicts with the InstanceId and CurrentState of instances.
+        """
+        for change in state_changes:
+            instance = self.inventory.get(change['InstanceId'])
+            if instance:
+                instance.state = InstanceState(change['CurrentState']['Name'])
 
     @staticmethod
     def _filter_out(instance, filters):
@@ -84,6 +166,9 @@ class BotoInstance:
     def is_running(self) -> bool:
         return self.state.is_state(InstanceState.RUNNING)
 
+    def is_stopped(self) -> bool:
+        return self.state.is_state(InstanceState.STOPPED)
+
     def is_worker(self) -> bool:
         return self.name == 'worker'
 
@@ -0,0 +1,23 @@
+"""
+Module for the clock of the application. The system clock can be replaced by a virtual clock, e.g.,
+to simulate the application faster than real time.
+"""
+import time as timepackage
+
+_clock = timepackage.time
+
+
+def time():
+    """
+    Get the current time in seconds since the epoch, according to the clock in use.
+    """
+    return _clock()
+
+
+def set_clock(clock=None):
+    """
+    Replace the clock of the application.
+    :param clock: Function returning the current time in seconds, or None for the system clock.
+    """
+    global _clock
+    _clock = clock if clock else timepackage.time
@@ -1,9 +1,34 @@
 """
 Module containing default values for the general program.
 """
+import os
+
 # How many seconds should the program wait with syncing instance states with boto?
 BOTO_UPDATE_SEC = 60
 
+# Values of the Name tag of the EC2 instances managed by the application.
+EC2_NAME_TAGS = ['Node Manager', 'Worker']
+
+# Number of instances per page of an EC2 describe call.
+EC2_PAGE_SIZE = 100
+
+# Seconds until the cached inventory of EC2 instances is described again when read.
+EC2_INVENTORY_MAX_AGE = BOTO_UPDATE_SEC
+
+# Maximum number of EC2/SSM calls of the Instance Manager in flight at the same time.
+CONTROL_PLANE_CONCURRENCY = 4
+
+# Maximum number of instances targeted by a single SSM send_command call.
+SSM_MAX_TARGETS = 50
+
+# Instance id argument of the start command that makes an instance look up its own id, so a single
+# start command can be sent to many instances.
+OWN_INSTANCE_ID = 'self'
+
+# Seconds between two polls while waiting for an instance to run, and until the wait is given up.
+INSTANCE_WAIT_POLL = 5
+INSTANCE_WAIT_TIMEOUT = 600
+
 # How many seconds should the program wait until a script should give life?
 START_SIGNAL_TIMEOUT = 10
 
@@ -13,6 +38,12 @@ SERVER_SLEEP_TIME = 1
 # Time to sleep for the send protocol of a client.
 CLIENT_SEND_SLEEP = 1
 
+# Maximum size in bytes of a single batch of packets sent over a connection.
+MAX_BATCH_SIZE = 2 ** 20
+
+# Maximum number of commands a client keeps while they are not sent yet. More commands fail to send.
+OUTBOUND_QUEUE_CAPACITY = 10000
+
 # How many seconds should be between heartbeats for NM? Must be greater than SERVER_SLEEP_TIME.
 HEART_BEAT_INTERVAL_NODE_MANAGER = 2
 
@@ -39,8 +70,23 @@ LOGGING_START_INTERVAL = LOGGING_INTERVAL
 # Default name for the log file.
 DEFAULT_LOG_FILE = '/tmp/temporary'
 
+# Level of the messages that are logged, e.g., 'INFO' or 'WARNING'.
+LOG_LEVEL = 'INFO'
+
+# If true, logged messages are also written to stdout.
+LOG_STDOUT = True
+
+# Maximum number of messages waiting for the background writer. Further messages are dropped.
+LOG_QUEUE_SIZE = 10000
+
+# Only one in this many messages of a high-volume event (e.g., sent and received packets) is logged.
+LOG_PACKET_SAMPLE_EVERY = 100
+
 DEFAULT_JOB_LOCAL_DIRECTORY = '/tmp/jobs/'
 
+# Scenario of tasks (IP, Input, Time) the node managers ingest after they start.
+SCENARIO_FILE = os.path.join('src', 'data', 'all_tasks_scenario.csv')
+
 """
 Parameters for Load balancing.
 """
@@ -53,3 +99,233 @@ MAX_JOBS_PER_WORKER = 5
 
 # Minimum needed jobs per worker. A value equal or below means there is a worker underloaded.
 MIN_JOBS_PER_WORKER = 1
+
+# Policy deciding the number of workers: 'threshold' adds or removes one worker when the jobs per
+# worker cross the limits above, 'predictive' computes the number of workers from a forecast of
+# the arrival rate and the service time of tasks.
+SCALING_POLICY = 'predictive'
+
+# Smoothing factors of the level (also used for the service time and boot latency averages) and
+# the trend of the forecast arrival rate.
+SCALING_ALPHA = 0.3
+SCALING_BETA = 0.2
+
+# Fraction of the time workers should be busy with tasks.
+SCALING_TARGET_UTILIZATION = 0.8
+
+# Seconds in which the waiting tasks should be processed by additional workers.
+SCALING_DRAIN_TIME = 30
+
+# Initial estimate of the seconds between starting a worker and its first heartbeat.
+SCALING_BOOT_LATENCY = 60
+
+# Seconds after scaling out before workers may be removed again.
+SCALING_SCALE_IN_COOLDOWN = 60
+
+# Mean CPU usage (percent) of the workers above which no workers are removed.
+SCALING_CPU_HIGH = 90
+
+"""
+Parameters for the warm pool of workers.
+"""
+# Number of workers that are kept booted with the model loaded, but do not receive tasks until a
+# scale-out activates them. A value of 0 disables the warm pool.
+WARM_POOL_SIZE = 0
+
+"""
+Parameters for speculative re-execution of straggler tasks.
+"""
+# Number of most recent task run times kept to estimate the run time percentile.
+STRAGGLER_WINDOW = 200
+
+# Minimum number of finished tasks before stragglers are detected.
+STRAGGLER_MIN_SAMPLES = 20
+
+# Percentile of the run times that is used as the straggler baseline.
+STRAGGLER_PERCENTILE = 95
+
+# A task running longer than STRAGGLER_FACTOR times the percentile is deemed a straggler.
+STRAGGLER_FACTOR = 1.5
+
+"""
+Parameters for the priority classes in the TaskPool.
+"""
+# Weight of each priority class. A class with weight 8 is served 8 times as often as weight 1.
+PRIORITY_WEIGHTS = {'interactive': 8, 'bulk': 1}
+
+# Priority class of tasks that are submitted without a priority.
+DEFAULT_PRIORITY = 'bulk'
+
+# Priority class of tasks that are submitted by the front end.
+INTERACTIVE_PRIORITY = 'interactive'
+
+# Seconds before its deadline that a task is served first, regardless of its priority class.
+DEADLINE_URGENCY = 5
+
+"""
+Parameters for the fair queuing of task sources.
+"""
+# Weight of specific sources (e.g., IP addresses). Sources not listed have weight 1.
+SOURCE_WEIGHTS = {}
+
+# Number of tasks per second a single source may submit.
+SOURCE_RATE = 2
+
+# Number of tasks a single source may submit at once before being rate limited.
+SOURCE_BURST = 10
+
+# Maximum number of tasks of a single source held back by the rate limit. Further tasks are rejected.
+SOURCE_BACKLOG = 100
+
+"""
+Parameters for admission control in the TaskPool.
+"""
+# Number of tasks in the Node Manager above which new tasks are rejected.
+TASKPOOL_HIGH_WATERMARK = 1000
+
+# Number of tasks in the Node Manager below which new tasks are accepted again after an overload.
+TASKPOOL_LOW_WATERMARK = 800
+
+# Maximum number of tasks assigned to a single worker. Other tasks wait in the taskpool.
+MAX_ASSIGNED_PER_WORKER = 10
+
+# Seconds a client is asked to wait before retrying a task rejected due to an overload.
+OVERLOAD_RETRY_AFTER = 5
+
+# Maximum number of tasks of which the Node Manager keeps metadata. Must exceed the high watermark.
+TASK_TABLE_CAPACITY = 2 * TASKPOOL_HIGH_WATERMARK
+
+"""
+Parameters for the journal of the TaskPool.
+"""
+# Directory in which the journal and snapshot of the TaskPool are stored.
+JOURNAL_DIRECTORY = '/tmp/journal/'
+
+# Seconds between group commits of the journal.
+JOURNAL_FLUSH_INTERVAL = 0.5
+
+# Number of buffered events after which the journal is committed before the interval passes.
+JOURNAL_BATCH_SIZE = 512
+
+# Number of committed events after which the journal is replaced by a snapshot.
+JOURNAL_SNAPSHOT_EVENTS = 10000
+
+"""
+Parameters for the load generator, which replaces the scenario with synthetic arrivals of tasks.
+"""
+# Arrival process of the load generator, or None to ingest SCENARIO_FILE. One of 'poisson:rate',
+# 'bursty:rate,burst_rate,mean_normal,mean_burst', 'diurnal:mean_rate,amplitude,period' or
+# 'trace[:path]' (the times, texts and sources of a scenario CSV, by default SCENARIO_FILE).
+# Rates are in tasks per second and durations in seconds.
+LOAD_ARRIVALS = None
+
+# Factor by which the arrivals are sped up, e.g., 10 replays 10 minutes of arrivals in 1 minute.
+LOAD_COMPRESSION = 1
+
+# Seconds of (uncompressed) arrivals that are submitted, e.g., to cut off a synthetic process.
+LOAD_DURATION = 600
+
+# CSV file (IP, Input) from which the texts and sources of synthetic arrivals are sampled.
+LOAD_INPUT_FILE = os.path.join('src', 'data', 'Input.csv')
+
+# Random seed of the load generator, or None for a different load on every run.
+LOAD_SEED = None
+
+"""
+Parameters for tracing the latency of tasks.
+"""
+# Fraction of the tasks of which the time spent in each stage is traced. A value of 0 disables it.
+# Off unless set in the environment, e.g., by the local harness (see its --trace-sample-rate).
+TRACE_SAMPLE_RATE = float(os.environ.get('TRACE_SAMPLE_RATE', 0))
+
+# File to which the node managers export the traces of the finished tasks.
+TRACE_FILE = '/tmp/traces.jsonl'
+
+# Number of recent packets of a worker used to estimate the offset of its clock.
+TRACE_OFFSET_WINDOW = 20
+
+"""
+Parameters for the in-process metrics (see aws.utils.metrics).
+"""
+# Seconds between two logs of the current values of all metrics.
+METRICS_FLUSH_INTERVAL = 10
+
+# Upper bounds in seconds of the buckets of the latency histograms.
+METRICS_BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50,
+                   100, 250, 500, 1000]
+
+# Address and port per instance type of the HTTP endpoint serving the metrics (/metrics in the
+# Prometheus text format, /metrics.json with percentiles). A port of None disables the endpoint.
+METRICS_HOST = '127.0.0.1'
+METRICS_PORT = {'instance_manager': 9100, 'node_manager': 9101, 'worker': 9102}
+
+# If true, high-volume events (e.g., every S3 transfer, control plane call and dequeued task) are
+# also logged one by one. Otherwise experiment.experiment reports them from the histograms.
+METRICS_LOG_EVENTS = False
+
+"""
+Parameters for sharding the workers across node managers.
+"""
+# Number of node managers the instance manager runs. Workers are divided over them.
+NODE_MANAGERS = 1
+
+# Number of points of each node on the consistent hash ring.
+HASH_RING_REPLICAS = 64
+
+"""
+Parameters for the aggregation of worker heartbeats by the node managers.
+"""
+# If true, workers report their health through their node manager instead of directly to the IM.
+HEARTBEAT_AGGREGATION = True
+
+# Every HEARTBEAT_FALLBACK_RATIO-th worker heartbeat is still sent directly to the IM.
+HEARTBEAT_FALLBACK_RATIO = 5
+
+"""
+Parameters for delta-encoded heartbeats.
+"""
+# Number of delta heartbeats sent between two full heartbeats (keyframes).
+HEARTBEAT_KEYFRAME_INTERVAL = 10
+
+"""
+Parameters for adaptive heartbeat intervals. The HEART_BEAT_INTERVAL_* values are the initial
+intervals, which grow while an instance is steady and drop when its load changes quickly.
+"""
+# Bounds of the heartbeat interval in seconds per instance type.
+HEARTBEAT_MIN_INTERVAL = {'node_manager': 1, 'worker': 1}
+HEARTBEAT_MAX_INTERVAL = {'node_manager': 10, 'worker': 15}
+
+# Factor the interval grows with on every heartbeat while the load is steady.
+HEARTBEAT_BACKOFF = 1.5
+
+# Relative change of the load (e.g., queue depth) between heartbeats that resets the interval.
+HEARTBEAT_CHANGE_THRESHOLD = 0.2
+
+# An instance is deemed dead after this many of its intervals (at least HEART_BEAT_TIMEOUT).
+HEARTBEAT_TIMEOUT_FACTOR = 3
+
+"""
+Parameters for the front end (app.py).
+"""
+# Address of the node manager to which the front end submits tasks.
+FRONT_END_NODE_MANAGER = os.environ.get('NODE_MANAGER_HOST', '127.0.0.1')
+
+"""
+Parameters for running the application locally.
+"""
+# Directory of the local cloud (see aws.utils.localcloud) that the processes of the local harness
+# use instead of AWS. The harness passes it through the environment. If not set, AWS is used.
+LOCAL_CLOUD = os.environ.get('LOCAL_CLOUD')
+
+# Instance id of a local process, as passed by the local harness.
+LOCAL_INSTANCE_ID = os.environ.get('LOCAL_INSTANCE_ID', 'instance_manager')
+
+# Address of the local instances.
+LOCAL_HOST = '127.0.0.1'
+
+if LOCAL_CLOUD:  # The local processes keep their files apart, within the local cloud.
+    DEFAULT_LOG_FILE = os.path.join(LOCAL_CLOUD, 'logs', LOCAL_INSTANCE_ID)
+    DEFAULT_JOB_LOCAL_DIRECTORY = os.path.join(LOCAL_CLOUD, 'jobs', LOCAL_INSTANCE_ID) + '/'
+    JOURNAL_DIRECTORY = os.path.join(LOCAL_CLOUD, 'journal', LOCAL_INSTANCE_ID)
+    TRACE_FILE = os.path.join(LOCAL_CLOUD, 'logs', LOCAL_INSTANCE_ID + '.traces.jsonl')
+    SCENARIO_FILE = os.path.join(LOCAL_CLOUD, 'scenario.csv')
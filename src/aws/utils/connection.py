@@ -5,16 +5,22 @@ import json
 import asyncio
 import traceback
 from abc import abstractmethod
-from collections import deque
+from collections import deque, OrderedDict
 
 from aws.utils import config
-from aws.utils.packets import HeartBeatPacket, PacketTranslator, CommandPacket, Packet
-from aws.resourcemanager.resourcemanager import log_info, log_error, log_exception
+from aws.utils.metrics import REGISTRY
+from aws.utils.packets import HeartBeatPacket, PacketTranslator, CommandPacket, Packet, \
+    HeartBeatDeltaPacket, HeartBeatEncoder, HeartBeatDecoder
+from aws.resourcemanager.resourcemanager import log_info, log_error, log_exception, log_sampled, \
+    LogSampler
 
 HOST = '0.0.0.0'
 PORT_IM = 8080
 PORT_NM = 8081
 ENCODING = 'UTF-8'
+# Maximum size of a batch a client sends. Half of the limit of the server, as the delta encoding
+# of heartbeats and the response (one packet per packet received) can be larger.
+MAX_SEND_BATCH = config.MAX_BATCH_SIZE // 2
 
 
 def encode_packet(data):
@@ -30,6 +36,64 @@ def encode_packet(data):
     raise TypeError("Unknown type found for encoding: {}".format(type(data)))
 
 
+def encode_batch(packets):
+    """
+    Encode a batch of packets into a single newline terminated message.
+    :param packets: List of packets.
+    :return: Encoded message with the default encoding.
+    """
+    return (json.dumps(packets) + '\n').encode(ENCODING)
+
+
+def decode_batch(data):
+    """
+    Decode a message of one or more packets.
+    :param data: Bytes received that should represent a packet or a list of packets.
+    :return: List of decoded packets.
+    """
+    value = data.decode(ENCODING)
+    try:
+        packets = json.loads(value)
+    except json.JSONDecodeError as e:
+        log_error("JsonDecodeError on: {} with {}: {}".format(value, e, traceback.format_exc()))
+        raise e
+    if isinstance(packets, dict):
+        packets = [packets]
+    return [PacketTranslator.translate(packet) for packet in packets]
+
+
+async def request(host, port, packet):
+    """
+    Send a single packet to a server and wait for the response, e.g., to submit a task.
+    :return: The response packet.
+    """
+    reader, writer = await asyncio.open_connection(host, port, limit=config.MAX_BATCH_SIZE)
+    try:
+        writer.write(encode_batch([packet]))
+        await writer.drain()
+        data = await reader.readline()
+    finally:
+        writer.close()
+    if data == b"":
+        raise ConnectionError("Server {}:{} closed the connection.".format(host, port))
+    return decode_batch(data)[0]
+
+
+async def submit(host, data, priority=config.INTERACTIVE_PRIORITY, deadline=None, port=PORT_NM):
+    """
+    Submit a task to a node manager, following the redirect to the node manager of the source.
+    :param data: Text of the task.
+    :param priority: Priority class of the task.
+    :param deadline: Optional number of seconds in which the task should be finished.
+    :return: Response of the node manager, e.g., 'submitted' with the key of the task.
+    """
+    packet = CommandPacket(command='submit', data=data, priority=priority, deadline=deadline)
+    response = await request(host, port, packet)
+    if response['command'] == 'redirect' and response.get('ip'):
+        response = await request(response['ip'], port, packet)
+    return response
+
+
 def decode_packet(data) -> Packet:
     """
     Decode bytes into a packet.
@@ -55,6 +119,9 @@ class MultiConnectionServer:
     def __init__(self, host, port):
         self.host = host
         self.port = port
+        self._decoder = HeartBeatDecoder()
+        self._received_log = LogSampler()  # Sampled per direction, as the two alternate.
+        self._sent_log = LogSampler()
         log_info("Serving on {}:{}..".format(self.host, self.port))
 
     def process_packet(self, message, source) -> Packet:
@@ -67,8 +134,11 @@ class MultiConnectionServer:
         packet = PacketTranslator.translate(message)
         if isinstance(packet, CommandPacket):
             return self.process_command(packet, source)
-        if isinstance(packet, HeartBeatPacket):
-            return self.process_heartbeat(packet, source)
+        if isinstance(packet, (HeartBeatPacket, HeartBeatDeltaPacket)):
+            heartbeat = self._decoder.decode(packet)
+            if heartbeat is None:  # Unknown base of the delta, ask the client for a keyframe.
+                return CommandPacket(command='keyframe', instance_id=packet['instance_id'])
+            return self.process_heartbeat(heartbeat, source)
         raise TypeError("Unknown packet found: {}".format(packet['packet_type']))
 
     @abstractmethod
@@ -81,19 +151,21 @@ class MultiConnectionServer:
 
     async def run(self, reader, writer):
         addr = writer.get_extra_info('peername')
+        encoders = HeartBeatEncoders()  # Heartbeat responses on this connection.
 
         try:
             while True:
-                data = await reader.read(1024)
+                data = await reader.readline()
                 if data == b"":  # EOF passed.
                     break
-                packet_received = decode_packet(data)
-                log_info("+ Received: {} from {}".format(packet_received, addr))
-                packet_reponse = self.process_packet(packet_received, addr)
+                encoders.acknowledge()  # The client only sends after receiving the last response.
+                packets_received = decode_batch(data)
+                log_sampled(self._received_log, "+ Received: {} from {}", packets_received, addr)
+                packets_response = [encoders.encode(self.process_packet(packet, addr))
+                                    for packet in packets_received]
 
-                log_info("- Sent: {}".format(packet_reponse))
-                data_response = encode_packet(packet_reponse)
-                writer.write(data_response)
+                log_sampled(self._sent_log, "- Sent: {}", packets_response)
+                writer.write(encode_batch(packets_response))  # One response per packet received.
                 await writer.drain()
                 await asyncio.sleep(config.SERVER_SLEEP_TIME)
         except ConnectionResetError as exc:
@@ -107,27 +179,166 @@ class MultiConnectionServer:
             writer.close()
 
 
+class HeartBeatEncoders:
+    """
+    Delta encoders of the heartbeat streams (one per instance id) sent over a connection.
+    """
+
+    def __init__(self):
+        self._encoders = {}
+
+    def encode(self, packet):
+        if not isinstance(packet, HeartBeatPacket):
+            return packet
+        if packet['instance_id'] not in self._encoders:
+            self._encoders[packet['instance_id']] = HeartBeatEncoder()
+        return self._encoders[packet['instance_id']].encode(packet)
+
+    def acknowledge(self):
+        for encoder in self._encoders.values():
+            encoder.acknowledge()
+
+    def reset(self, instance_id=None):
+        """
+        Send a keyframe next for the stream of an instance, or for all streams if None.
+        """
+        if instance_id is None:
+            self._encoders.clear()
+        else:
+            self._encoders.pop(instance_id, None)
+
+
+class OutboundQueueFull(Exception):
+    """
+    Raised when a command is sent while the commands of a client that are not sent yet are at the
+    capacity of its OutboundQueue, e.g., because the server is unreachable.
+    """
+
+
+class OutboundQueue:
+    """
+    Outgoing packets of a client. Commands are kept in a reliable FIFO lane and are sent first.
+    Heartbeats have a single latest-value slot per stream (instance id), so a newer heartbeat
+    replaces the one that was not sent yet instead of queueing behind it.
+    """
+
+    def __init__(self, capacity=config.OUTBOUND_QUEUE_CAPACITY):
+        self.capacity = capacity  # Maximum number of commands that are not sent yet.
+        self._commands = deque()
+        self._heartbeats = OrderedDict()  # Instance id: latest heartbeat not yet sent.
+        self.replaced = 0  # Number of heartbeats that were never sent, as a newer one replaced it.
+
+    def __len__(self):
+        return len(self._commands) + len(self._heartbeats)
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def append(self, packet: Packet):
+        """
+        Queue a packet to be sent.
+        :raises OutboundQueueFull: If the packet is a command and the command lane is full.
+        """
+        if isinstance(packet, HeartBeatPacket):
+            if packet['instance_id'] in self._heartbeats:
+                self.replaced += 1
+            self._heartbeats[packet['instance_id']] = packet
+        elif len(self._commands) >= self.capacity:
+            raise OutboundQueueFull("Outbound queue is full with {} commands.".format(
+                self.capacity))
+        else:
+            self._commands.append(packet)
+
+    def drain(self, max_bytes=None):
+        """
+        Take the packets that are ready to be sent, up to a batch of max_bytes. The packets that do
+        not fit stay in the queue for the next batch.
+        :param max_bytes: Maximum size of the encoded batch, or None for all packets. A batch has at
+        least one packet, even if that packet is larger.
+        :return: List of the commands in order, followed by the latest heartbeats.
+        """
+        packets = []
+        size = 3  # The brackets of the list and the newline.
+        while self._commands or self._heartbeats:
+            packet = self._commands[0] if self._commands else next(iter(self._heartbeats.values()))
+            if max_bytes is not None:
+                size += len(encode_packet(packet)) + 2  # The packet and its separator.
+                if packets and size > max_bytes:
+                    break
+            if self._commands:
+                packets.append(self._commands.popleft())
+            else:
+                packets.append(self._heartbeats.popitem(last=False)[1])
+        return packets
+
+    def requeue(self, packets):
+        """
+        Put drained packets back in front of the queue, e.g., if sending them failed. A heartbeat is
+        only put back if no newer heartbeat of its stream was queued in the meantime.
+        """
+        for packet in reversed(packets):
+            if not isinstance(packet, HeartBeatPacket):
+                self._commands.appendleft(packet)
+            elif packet['instance_id'] not in self._heartbeats:
+                self._heartbeats[packet['instance_id']] = packet
+                self._heartbeats.move_to_end(packet['instance_id'], last=False)
+
+    def drop_oldest(self):
+        """
+        Drop the oldest command that is not sent yet.
+        :return: The dropped command.
+        """
+        return self._commands.popleft()
+
+
 class MultiConnectionClient:
 
     def __init__(self, host, port, sleep_time=config.CLIENT_SEND_SLEEP):
         self.host = host
         self.port = port
-        self.send_buffer: deque[Packet] = deque()
+        self.send_buffer = OutboundQueue()
         self.running = True
         self._sleep_time = sleep_time
         self.connection_lost = False
+        self._active = False  # True while run is connected or connecting.
+        self._moved = False  # True if the client should reconnect to a new host.
         self.last_exception = ""
         self.last_trace = ""
+        self._encoders = HeartBeatEncoders()
+        self._decoder = HeartBeatDecoder()
+        self._received_log = LogSampler()  # Sampled per direction, as the two alternate.
+        self._sent_log = LogSampler()
 
     def send_message(self, message: Packet):
-        self.send_buffer.append(message)
+        """
+        Queue a packet to be sent on the connection. If too many commands are not sent yet (e.g.,
+        the server is unreachable), the oldest command is dropped to make room.
+        """
+        try:
+            self.send_buffer.append(message)
+        except OutboundQueueFull as exc:
+            dropped = self.send_buffer.drop_oldest()
+            REGISTRY.counter('commands_dropped_total',
+                             "Commands dropped because the outbound queue was full.").inc()
+            log_error("Dropped the oldest command {} to {}:{}: {}".format(dropped, self.host,
+                                                                          self.port, exc))
+            self.send_buffer.append(message)
 
     def process_message(self, message):
         packet = PacketTranslator.translate(message)
         if isinstance(packet, CommandPacket):
-            self.process_command(packet)
-        elif isinstance(packet, HeartBeatPacket):
-            self.process_heartbeat(packet)
+            if packet['command'] == 'keyframe':
+                # The server could not rebuild our last delta heartbeat.
+                self._encoders.reset(packet.get('instance_id'))
+            else:
+                self.process_command(packet)
+        elif isinstance(packet, (HeartBeatPacket, HeartBeatDeltaPacket)):
+            heartbeat = self._decoder.decode(packet)
+            if heartbeat is None:
+                log_error("Could not rebuild delta heartbeat {}. "
+                          "Waiting for a keyframe.".format(packet))
+            else:
+                self.process_heartbeat(heartbeat)
         else:
             log_error("I do not know this packet type: {}".format(packet['packet_type']))
 
@@ -139,24 +350,59 @@ class MultiConnectionClient:
         raise NotImplementedError("Client has not yet implemented process_command.")
 
     async def run(self):
-        log_info('Attempting to connect to {}:{}'.format(self.host, self.port))
-        reader, writer = await asyncio.open_connection(self.host, self.port)
-
+        self._active = True
         try:
             while self.running:
-                while self.send_buffer:
-                    packet_send: Packet = self.send_buffer.popleft()
+                self._moved = False
+                await self._connect()
+                if not self._moved:
+                    break
+        finally:
+            self._active = False
 
-                    log_info('- Sent: {}'.format(packet_send))
-                    writer.write(encode_packet(packet_send))
+    def reconnect(self, host):
+        """
+        Connect to another server, e.g., the node manager a worker is remapped to after a failover.
+        The current connection is closed, or a new one is started if the connection was lost.
+        :param host: Host of the new server.
+        """
+        if host == self.host and self._active:
+            return  # Already connecting to this host.
+        log_info('Reconnecting from {} to {}:{}'.format(self.host, host, self.port))
+        self.host = host
+        self._moved = True
+        if not self._active:
+            asyncio.ensure_future(self.run())
 
-                    data_received = await reader.read(1024)
-                    if data_received == b"":  # EOF passed.
-                        log_info("EOF passed. Closing the connection.")
-                        break
-                    packet_received = decode_packet(data_received)
-                    log_info('+ Received: {}'.format(packet_received))
-                    self.process_message(packet_received)
+    async def _connect(self):
+        log_info('Attempting to connect to {}:{}'.format(self.host, self.port))
+        writer = None
+        try:
+            reader, writer = await asyncio.open_connection(self.host, self.port,
+                                                           limit=config.MAX_BATCH_SIZE)
+            self._encoders = HeartBeatEncoders()  # A new connection starts with keyframes.
+            self._decoder = HeartBeatDecoder()
+            self.connection_lost = False
+            while self.running and not self._moved:
+                while self.send_buffer:
+                    # Coalesce the packets that are ready into writes the server can read.
+                    packets = self.send_buffer.drain(max_bytes=MAX_SEND_BATCH)
+                    try:
+                        packets_send = [self._encoders.encode(packet) for packet in packets]
+                        log_sampled(self._sent_log, '- Sent: {}', packets_send)
+                        writer.write(encode_batch(packets_send))
+
+                        data_received = await reader.readline()
+                        if data_received == b"":  # EOF passed.
+                            raise ConnectionError("Server closed the connection.")
+                    except BaseException:
+                        self.send_buffer.requeue(packets)  # Sent again on the next connection.
+                        raise
+                    self._encoders.acknowledge()
+                    packets_received = decode_batch(data_received)
+                    log_sampled(self._received_log, '+ Received: {}', packets_received)
+                    for packet_received in packets_received:
+                        self.process_message(packet_received)
 
                 await asyncio.sleep(self._sleep_time)
         except KeyboardInterrupt:
@@ -167,7 +413,8 @@ class MultiConnectionClient:
             self.last_trace = traceback.format_exc()
         finally:
             log_info('Close the socket [{}:{}]'.format(self.host, self.port))
-            writer.close()
+            if writer is not None:
+                writer.close()
             self.connection_lost = True
 
     def close(self):
@@ -0,0 +1,102 @@
+"""
+Module for non-blocking calls to the cloud control plane (EC2 and SSM).
+"""
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from time import time
+
+import aws.utils.config as config
+from aws.resourcemanager.resourcemanager import log_metric, log_warning
+from aws.utils.botoutils import BotoInstanceReader
+from aws.utils.metrics import REGISTRY
+
+
+class ControlPlaneClient:
+    """
+    Runs the blocking boto3 calls of a BotoInstanceReader in a thread pool, so the event loop keeps
+    serving heartbeats while a call is in flight. At most CONTROL_PLANE_CONCURRENCY calls run at
+    the same time, and the latency of every call is recorded as a metric.
+    """
+
+    def __init__(self, boto: BotoInstanceReader, concurrency=config.CONTROL_PLANE_CONCURRENCY):
+        self.boto = boto
+        self.concurrency = concurrency
+        self._executor = ThreadPoolExecutor(max_workers=concurrency)
+        self._semaphore = None  # Created on first use, so it belongs to the running loop.
+
+    async def call(self, name, func, *args, **kwargs):
+        """
+        Run a blocking call without blocking the event loop.
+        :param name: Name of the call in the latency metric.
+        :param func: Blocking function to call.
+        :return: The result of the call.
+        """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        async with self._semaphore:
+            start_time = time()
+            error = None
+            try:
+                return await asyncio.get_event_loop().run_in_executor(
+                    self._executor, functools.partial(func, *args, **kwargs))
+            except Exception as exc:
+                error = type(exc).__name__
+                raise exc
+            finally:
+                latency = time() - start_time
+                REGISTRY.histogram('control_plane_seconds', "Latency of EC2 and SSM calls.",
+                                   call=name).observe(latency)
+                if error:
+                    REGISTRY.counter('control_plane_errors_total', "Failed EC2 and SSM calls.",
+                                     call=name).inc()
+                if config.METRICS_LOG_EVENTS:
+                    log_metric({'control_plane_call': {'call': name, 'latency': latency,
+                                                       'error': error}})
+
+    async def read(self, own_instance, filters=None):
+        return await self.call('describe_instances', self.boto.read, own_instance, filters)
+
+    async def read_ids(self, own_instance, filters=None, cached=False):
+        if cached and not self.boto.inventory_expired():
+            return self.boto.read_ids(own_instance, filters, cached=True)  # No call needed.
+        return await self.call('describe_instances', self.boto.read_ids, own_instance, filters,
+                               cached=cached)
+
+    async def start_instances(self, instance_ids):
+        return await self.call('start_instances', self.boto.start_instances, instance_ids)
+
+    async def stop_instances(self, instance_ids):
+        return await self.call('stop_instances', self.boto.stop_instances, instance_ids)
+
+    async def send_command(self, **kwargs):
+        return await self.call('send_command', self.boto.ssm.send_command, **kwargs)
+
+    async def cancel_command(self, command_id):
+        return await self.call('cancel_command', self.boto.ssm.cancel_command,
+                               CommandId=command_id)
+
+    async def wait_until_running(self, instance_ids, poll=config.INSTANCE_WAIT_POLL,
+                                 timeout=config.INSTANCE_WAIT_TIMEOUT):
+        """
+        Wait until instances are running by polling their state, yielding to the event loop in
+        between polls.
+        :param instance_ids: Instance ids to wait for.
+        :param poll: Seconds between two polls.
+        :param timeout: Seconds until the wait is given up.
+        :return: Boolean indicating if all instances are running.
+        """
+        deadline = time() + timeout
+        while True:
+            instances = await self.call('describe_instances', self.boto.describe_ids,
+                                        instance_ids)
+            if instances and all(instance.is_running() for instance in instances):
+                return True
+            if time() + poll > deadline:
+                log_warning("Instances {} not running after {} seconds.".format(instance_ids,
+                                                                                timeout))
+                return False
+            await asyncio.sleep(poll)
+
+    def close(self):
+        self._executor.shutdown(wait=False)
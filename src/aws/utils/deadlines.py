@@ -0,0 +1,57 @@
+"""
+Module for indexing deadlines, e.g., heartbeat and start signal expiries.
+"""
+import heapq
+
+
+class DeadlineHeap:
+    """
+    Index of the next deadline of each key. Only the keys whose deadline passed are returned, so
+    checking the deadlines costs O(expired * log(n)) instead of visiting every key.
+    Rescheduling a key leaves its old entry in the heap, which is skipped once it is popped. The
+    heap is rebuilt when these stale entries outnumber the scheduled keys.
+    """
+
+    def __init__(self):
+        self._heap = []  # (deadline, key), including stale entries.
+        self._deadlines = {}  # Key: current deadline.
+
+    def __len__(self):
+        return len(self._deadlines)
+
+    def __contains__(self, key):
+        return key in self._deadlines
+
+    def get(self, key):
+        return self._deadlines.get(key)
+
+    def schedule(self, key, deadline):
+        """
+        Set the deadline of a key, replacing its previous deadline.
+        :param key: Key to schedule, e.g., an instance id.
+        :param deadline: Absolute time at which the key expires.
+        """
+        if self._deadlines.get(key) == deadline:
+            return
+        self._deadlines[key] = deadline
+        heapq.heappush(self._heap, (deadline, key))
+        if len(self._heap) > 2 * len(self._deadlines) + 64:
+            self._heap = [(deadline, key) for key, deadline in self._deadlines.items()]
+            heapq.heapify(self._heap)
+
+    def remove(self, key):
+        self._deadlines.pop(key, None)
+
+    def expired(self, current_time):
+        """
+        Remove and return the keys whose deadline passed.
+        :param current_time: Time to compare the deadlines with.
+        :return: List of expired keys, earliest deadline first.
+        """
+        expired = []
+        while self._heap and self._heap[0][0] <= current_time:
+            deadline, key = heapq.heappop(self._heap)
+            if self._deadlines.get(key) == deadline:
+                del self._deadlines[key]
+                expired.append(key)
+        return expired
@@ -0,0 +1,63 @@
+"""
+Module for consistent hashing of keys onto instances.
+"""
+import bisect
+import hashlib
+
+import aws.utils.config as config
+
+
+class ConsistentHashRing:
+    """
+    Consistent hash ring mapping keys (e.g., worker ids or task sources) onto nodes (e.g., node
+    managers). Each node is placed on the ring several times, so adding or removing a node only
+    moves the keys of that node. The hash is stable across processes, so every instance holding
+    the same nodes maps a key onto the same node.
+    """
+
+    def __init__(self, nodes=(), replicas=config.HASH_RING_REPLICAS):
+        self.replicas = replicas
+        self._hashes = []
+        self._ring = {}  # Hash: node.
+        self._nodes = set()
+        for node in nodes:
+            self.add(node)
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def __contains__(self, node):
+        return node in self._nodes
+
+    @staticmethod
+    def _hash(key):
+        return int(hashlib.md5(str(key).encode('UTF-8')).hexdigest()[:16], 16)
+
+    def add(self, node):
+        if node in self._nodes:
+            return
+        self._nodes.add(node)
+        for replica in range(self.replicas):
+            point = self._hash('{}#{}'.format(node, replica))
+            self._ring[point] = node
+            bisect.insort(self._hashes, point)
+
+    def remove(self, node):
+        if node not in self._nodes:
+            return
+        self._nodes.discard(node)
+        for replica in range(self.replicas):
+            point = self._hash('{}#{}'.format(node, replica))
+            del self._ring[point]
+            self._hashes.remove(point)
+
+    def get(self, key):
+        """
+        Get the node responsible for a key.
+        :param key: Key to map onto a node.
+        :return: The node or None if the ring is empty.
+        """
+        if not self._hashes:
+            return None
+        index = bisect.bisect(self._hashes, self._hash(key)) % len(self._hashes)
+        return self._ring[self._hashes[index]]
@@ -0,0 +1,96 @@
+"""
+Module for adaptive heartbeat intervals.
+"""
+
+import aws.utils.config as config
+from aws.utils.clock import time
+from aws.resourcemanager.resourcemanager import log_info, log_warning
+
+
+def heartbeat_timeout(interval):
+    """
+    Get the time after which an instance heartbeating with an interval is deemed dead.
+    :param interval: Heartbeat interval of the instance in seconds or None if unknown.
+    :return: Timeout in seconds, never below HEART_BEAT_TIMEOUT.
+    """
+    if not interval:
+        return config.HEART_BEAT_TIMEOUT
+    return max(config.HEART_BEAT_TIMEOUT, interval * config.HEARTBEAT_TIMEOUT_FACTOR)
+
+
+class AdaptiveInterval:
+    """
+    Heartbeat interval of an instance that adapts to its load. While the load is steady, the
+    interval grows by a backoff factor up to the maximum interval. Once the load changes quickly
+    (e.g., the queue depth jumps), the interval drops to the minimum interval so the Instance
+    Manager can react to the burst.
+    The parameters can be tuned at runtime, see `tune`.
+    """
+    TUNABLE = ('min_interval', 'max_interval', 'backoff', 'change_threshold')
+
+    def __init__(self, instance_type, interval):
+        self.instance_type = instance_type
+        self.min_interval = config.HEARTBEAT_MIN_INTERVAL[instance_type]
+        self.max_interval = config.HEARTBEAT_MAX_INTERVAL[instance_type]
+        self.backoff = config.HEARTBEAT_BACKOFF
+        self.change_threshold = config.HEARTBEAT_CHANGE_THRESHOLD
+        self.current = self._clamp(interval)
+        self._last_load = None
+        self._last_beat = 0
+
+    def _clamp(self, interval):
+        return min(self.max_interval, max(self.min_interval, interval))
+
+    def due(self, load, idle=False):
+        """
+        Check if a heartbeat should be sent now. Meant to be called frequently (at least every
+        minimum interval), so a burst is noticed before the current interval has passed.
+        :param load: Number describing the load, e.g., the queue depth.
+        :param idle: True if the instance waits for work that it pulls with its heartbeats, like
+        an idle worker does. The interval is then kept at the minimum interval.
+        :return: Boolean indicating if a heartbeat should be sent.
+        """
+        elapsed = time() - self._last_beat
+        if (idle or self._changed(load)) and elapsed >= self.min_interval:
+            self.current = self.min_interval
+        elif elapsed >= self.current:
+            if self._last_load is not None:
+                self.current = self._clamp(self.current * self.backoff)
+        else:
+            return False
+        self._last_beat = time()
+        self._last_load = load
+        return True
+
+    def _changed(self, load):
+        """
+        Check if the load changed quickly since the last heartbeat.
+        """
+        if self._last_load is None:
+            return False
+        change = abs(load - self._last_load) / max(1, abs(self._last_load))
+        return change >= self.change_threshold
+
+    def timeout(self):
+        return heartbeat_timeout(self.current)
+
+    def tune(self, settings):
+        """
+        Change the parameters of the interval at runtime.
+        :param settings: Dict with the new values of (a subset of) the TUNABLE parameters, or a dict
+        of such dicts per instance type.
+        """
+        settings = settings.get(self.instance_type, settings)
+        changed = {key: value for key, value in settings.items()
+                   if key in self.TUNABLE and getattr(self, key) != value}
+        if not changed:
+            return
+        min_interval = changed.get('min_interval', self.min_interval)
+        max_interval = changed.get('max_interval', self.max_interval)
+        if not 0 < min_interval <= max_interval:
+            log_warning("Ignoring heartbeat settings {} with an invalid range.".format(changed))
+            return
+        for key, value in changed.items():
+            setattr(self, key, value)
+        self.current = self._clamp(self.current)
+        log_info("Tuned heartbeat interval of {}: {}".format(self.instance_type, changed))
@@ -0,0 +1,346 @@
+"""
+Module with local stand-ins of the AWS APIs used by the application, e.g., to test or run the
+application without an AWS account.
+"""
+import itertools
+import json
+import os
+import shutil
+import signal
+import subprocess
+from datetime import datetime
+
+import aws.utils.config as config
+from aws.utils.clock import time
+
+
+class LocalEc2:
+    """
+    In-memory stand-in for the subset of the boto3 EC2 client used by the application. Started
+    instances are reported as pending and are running on the next describe, stopped instances are
+    reported as stopping and are stopped on the next describe. With a transition time, instances
+    finish their transition once that time has passed instead.
+    """
+    TRANSITIONS = {'pending': 'running', 'stopping': 'stopped'}
+
+    def __init__(self, transition_time=None):
+        """
+        :param transition_time: Seconds until a pending or stopping instance is running or stopped,
+        or None to finish the transitions on the next describe.
+        """
+        self._instances = {}  # Instance id: instance dict as in a describe-instances response.
+        self._reservations = {}  # Reservation id: instance ids launched together.
+        self._changed = {}  # Instance id: time of the last state change.
+        self._ids = itertools.count()
+        self.transition_time = transition_time
+        self.listeners = []  # Functions called with the instance id and state on a state change.
+        self.calls = []  # Names of the API calls made, e.g., to count describe calls.
+
+    def add_instances(self, name, count=1, state='stopped', ip_address=None):
+        """
+        Add instances in a single reservation, like a single run-instances call would.
+        :param name: Value of the Name tag, e.g., 'Worker'.
+        :param count: Number of instances.
+        :param state: Initial state of the instances.
+        :param ip_address: Public IP address of all instances, by default unique addresses.
+        :return: List of the instance ids.
+        """
+        reservation = 'r-{:017x}'.format(next(self._ids))
+        instance_ids = []
+        for _ in range(count):
+            index = next(self._ids)
+            instance_id = 'i-{:017x}'.format(index)
+            self._instances[instance_id] = {
+                'InstanceId': instance_id,
+                'PublicDnsName': 'ec2-{}.local'.format(index),
+                'PublicIpAddress': ip_address if ip_address else
+                '10.0.{}.{}'.format(index // 256, index % 256),
+                'State': {'Name': state},
+                'Tags': [{'Key': 'Name', 'Value': name}]
+            }
+            self._changed[instance_id] = time()
+            instance_ids.append(instance_id)
+        self._reservations[reservation] = instance_ids
+        return instance_ids
+
+    def describe_instances(self, Filters=None, MaxResults=None, NextToken=None, InstanceIds=None):
+        self.calls.append('describe_instances')
+        self._transition(describe=True)
+        reservations = [(reservation, [instance_id for instance_id in instance_ids
+                                       if self._match(instance_id, Filters, InstanceIds)])
+                        for reservation, instance_ids in self._reservations.items()]
+        reservations = [(reservation, instance_ids)
+                        for reservation, instance_ids in reservations if instance_ids]
+        start = int(NextToken) if NextToken else 0
+        end = start + MaxResults if MaxResults else len(reservations)
+        response = {'Reservations': [
+            {'ReservationId': reservation,
+             'Instances': [dict(self._instances[instance_id]) for instance_id in instance_ids]}
+            for reservation, instance_ids in reservations[start:end]]}
+        if end < len(reservations):
+            response['NextToken'] = str(end)
+        return response
+
+    def _match(self, instance_id, filters, instance_ids):
+        if instance_ids and instance_id not in instance_ids:
+            return False
+        instance = self._instances[instance_id]
+        for instance_filter in filters if filters else []:
+            if instance_filter['Name'] == 'tag:Name':
+                value = next((tag['Value'] for tag in instance['Tags'] if tag['Key'] == 'Name'),
+                             None)
+            elif instance_filter['Name'] == 'instance-state-name':
+                value = instance['State']['Name']
+            else:
+                raise ValueError("Unsupported filter: {}".format(instance_filter['Name']))
+            if value not in instance_filter['Values']:
+                return False
+        return True
+
+    def get_state(self, instance_id):
+        self._transition()
+        return self._instances[instance_id]['State']['Name']
+
+    def _transition(self, describe=False):
+        """
+        Finish the transitions of pending and stopping instances that are due.
+        """
+        if self.transition_time is None and not describe:
+            return
+        for instance_id, instance in self._instances.items():
+            state = instance['State']['Name']
+            if state in self.TRANSITIONS and (self.transition_time is None or time() -
+                                              self._changed[instance_id] >= self.transition_time):
+                self._set_state(instance_id, self.TRANSITIONS[state])
+
+    def _set_state(self, instance_id, state):
+        self._instances[instance_id]['State'] = {'Name': state}
+        self._changed[instance_id] = time()
+        for listener in self.listeners:
+            listener(instance_id, state)
+
+    def _change_state(self, instance_ids, from_states, state):
+        changes = []
+        for instance_id in instance_ids:
+            instance = self._instances[instance_id]
+            previous = instance['State']['Name']
+            if previous in from_states:
+                self._set_state(instance_id, state)
+            changes.append({'InstanceId': instance_id,
+                            'CurrentState': dict(instance['State']),
+                            'PreviousState': {'Name': previous}})
+        return changes
+
+    def start_instances(self, InstanceIds):
+        self.calls.append('start_instances')
+        return {'StartingInstances': self._change_state(InstanceIds, ('stopped',), 'pending')}
+
+    def stop_instances(self, InstanceIds):
+        self.calls.append('stop_instances')
+        return {'StoppingInstances': self._change_state(InstanceIds, ('pending', 'running'),
+                                                        'stopping')}
+
+
+class LocalSsm:
+    """
+    In-memory stand-in for the subset of the boto3 SSM client used by the application. Commands are
+    recorded, and run by the launcher if one is given. Like SSM, a command fails as a whole if one
+    of its instances is not running in the given LocalEc2.
+    """
+
+    class exceptions:
+        class InvalidInstanceId(Exception):
+            pass
+
+    def __init__(self, ec2=None, launcher=None):
+        """
+        :param ec2: Optional LocalEc2 with the state of the instances.
+        :param launcher: Optional function called with an instance id and a shell command to run
+        the command on that instance.
+        """
+        self.ec2 = ec2
+        self.launcher = launcher
+        self.commands = {}  # Command id: (instance ids, commands).
+        self.cancelled = []
+        self._ids = itertools.count()
+        self.calls = []
+
+    def send_command(self, InstanceIds, DocumentName, Parameters, **kwargs):
+        self.calls.append('send_command')
+        if self.ec2:
+            for instance_id in InstanceIds:
+                if self.ec2.get_state(instance_id) != 'running':
+                    raise self.exceptions.InvalidInstanceId(instance_id)
+        command_id = '{:08x}-local'.format(next(self._ids))
+        self.commands[command_id] = (list(InstanceIds), Parameters['commands'])
+        if self.launcher:
+            for instance_id in InstanceIds:
+                for command in Parameters['commands']:
+                    self.launcher(instance_id, command)
+        return {'Command': {'CommandId': command_id, 'DocumentName': DocumentName,
+                            'InstanceIds': list(InstanceIds)}}
+
+    def cancel_command(self, CommandId, InstanceIds=None):
+        self.calls.append('cancel_command')
+        self.cancelled.append(CommandId)
+        return {}
+
+
+class LocalS3:
+    """
+    Filesystem-backed stand-in for the subset of the boto3 S3 client and resource used by the
+    ResourceManagerCore. Buckets are directories and objects are files, so the store is shared by
+    all local processes.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, bucket, key=''):
+        return os.path.join(self.root, bucket, key)
+
+    def create_bucket(self, Bucket, CreateBucketConfiguration=None):
+        os.makedirs(self._path(Bucket), exist_ok=True)
+        return {'Location': '/' + Bucket}
+
+    def delete_bucket(self, Bucket):
+        shutil.rmtree(self._path(Bucket), ignore_errors=True)
+
+    def list_buckets(self):
+        return {'Buckets': [{'Name': name} for name in sorted(os.listdir(self.root))]}
+
+    def upload_file(self, Filename, Bucket, Key):
+        path = self._path(Bucket, Key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        shutil.copyfile(Filename, path + '.part')
+        os.replace(path + '.part', path)  # Readers never see a partial object.
+
+    def download_file(self, Bucket, Key, Filename):
+        shutil.copyfile(self._path(Bucket, Key), Filename)
+
+    def Bucket(self, name):
+        return LocalBucket(self, name)
+
+
+class LocalBucket:
+    """
+    Stand-in for the subset of a boto3 S3 Bucket resource used by the ResourceManagerCore.
+    """
+
+    def __init__(self, s3, name):
+        self.s3 = s3
+        self.name = name
+
+    @property
+    def creation_date(self):
+        path = self.s3._path(self.name)
+        return datetime.fromtimestamp(os.path.getctime(path)) if os.path.isdir(path) else None
+
+    @property
+    def object_versions(self):
+        return self
+
+    def delete(self):
+        path = self.s3._path(self.name)
+        for name in os.listdir(path):
+            if os.path.isdir(os.path.join(path, name)):
+                shutil.rmtree(os.path.join(path, name))
+            else:
+                os.remove(os.path.join(path, name))
+
+
+class LocalCloud:
+    """
+    Local stand-in for the AWS account of the application, kept in a directory. The EC2 instances
+    are defined by a fleet file, SSM commands start local processes (killed when their instance is
+    stopped) and S3 is stored in the directory. All instances share the address LOCAL_HOST.
+    """
+    ACCOUNT_ID = 'local'
+
+    def __init__(self, root):
+        self.root = root
+        self._processes = {}  # Instance id: processes started on the instance.
+
+    @classmethod
+    def create(cls, root, node_managers=1, workers=4, scenario=None):
+        """
+        Create a local cloud in a directory.
+        :param root: Directory of the local cloud.
+        :param node_managers: Number of node manager instances.
+        :param workers: Number of worker instances.
+        :param scenario: Optional path of the scenario CSV the node managers ingest.
+        """
+        for directory in ('logs', 'pids', 's3'):
+            os.makedirs(os.path.join(root, directory), exist_ok=True)
+        with open(os.path.join(root, 'fleet.json'), 'w') as file:
+            json.dump({'Node Manager': node_managers, 'Worker': workers}, file)
+        if scenario:
+            shutil.copyfile(scenario, os.path.join(root, 'scenario.csv'))
+        return cls(root)
+
+    def ec2(self, transition_time=0):
+        """
+        Create the EC2 stand-in with the instances of the fleet, all stopped.
+        """
+        ec2 = LocalEc2(transition_time=transition_time)
+        with open(os.path.join(self.root, 'fleet.json')) as file:
+            for name, count in json.load(file).items():
+                ec2.add_instances(name, count=count, ip_address=config.LOCAL_HOST)
+        return ec2
+
+    def ssm(self, ec2):
+        """
+        Create the SSM stand-in, which runs the commands as local processes of the instances.
+        """
+        ec2.listeners.append(self._state_changed)
+        return LocalSsm(ec2, launcher=self.launch)
+
+    def s3(self):
+        return LocalS3(os.path.join(self.root, 's3'))
+
+    def environment(self, instance_id):
+        """
+        Get the environment of a local process that runs as an instance.
+        """
+        return dict(os.environ, LOCAL_CLOUD=self.root, LOCAL_INSTANCE_ID=instance_id,
+                    PYTHONUNBUFFERED='1')
+
+    def launch(self, instance_id, command):
+        """
+        Run a shell command as a process of an instance, in its own process group.
+        :return: The started process.
+        """
+        with open(os.path.join(self.root, 'logs', instance_id + '.out'), 'a') as output:
+            process = subprocess.Popen(['bash', '-c', command], stdout=output,
+                                       stderr=subprocess.STDOUT, start_new_session=True,
+                                       env=self.environment(instance_id))
+        open(os.path.join(self.root, 'pids', str(process.pid)), 'w').close()
+        self._processes.setdefault(instance_id, []).append(process)
+        return process
+
+    def _state_changed(self, instance_id, state):
+        if state == 'stopping':
+            for process in self._processes.pop(instance_id, []):
+                self.stop_process(self.root, process.pid)
+
+    @staticmethod
+    def stop_process(root, pid, sig=signal.SIGINT):
+        """
+        Stop the process group of a local process. SIGINT lets the application clean up.
+        """
+        try:
+            os.killpg(pid, sig)
+        except (ProcessLookupError, PermissionError):
+            pass
+        pid_file = os.path.join(root, 'pids', str(pid))
+        if os.path.exists(pid_file):
+            os.remove(pid_file)
+
+    @classmethod
+    def stop_all(cls, root, sig=signal.SIGKILL):
+        """
+        Stop all processes that are still running in a local cloud.
+        """
+        for pid in os.listdir(os.path.join(root, 'pids')):
+            cls.stop_process(root, int(pid), sig)
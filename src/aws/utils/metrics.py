@@ -0,0 +1,237 @@
+"""
+Module for the in-process metrics of the application. Counters, gauges and latency histograms are
+aggregated in memory, so a metric event costs a few arithmetic operations instead of a log line.
+The current values are logged periodically and served over HTTP in the Prometheus text format.
+"""
+import bisect
+import json
+import threading
+
+import aws.utils.config as config
+
+
+class Counter:
+    """
+    Value that only increases, e.g., the number of finished tasks.
+    """
+    TYPE = 'counter'
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def to_dict(self):
+        return self.value
+
+
+class Gauge:
+    """
+    Value that can go up and down, e.g., the number of waiting tasks.
+    """
+    TYPE = 'gauge'
+
+    def __init__(self):
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def to_dict(self):
+        return self.value
+
+
+class Histogram:
+    """
+    Distribution of observed values over fixed buckets. Histograms with the same buckets can be
+    merged (e.g., of all node managers), and percentiles are estimated from the buckets.
+    """
+    TYPE = 'histogram'
+
+    def __init__(self, buckets=None):
+        """
+        :param buckets: Sorted upper bounds of the buckets, by default METRICS_BUCKETS. Values
+        above the last bound are counted in an overflow bucket.
+        """
+        self.buckets = list(buckets if buckets else config.METRICS_BUCKETS)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+
+    def merge(self, other):
+        """
+        Add the observations of another histogram with the same buckets.
+        :param other: Histogram or the dict of a histogram as returned by to_dict.
+        """
+        if isinstance(other, dict):
+            other = self.from_dict(other)
+        if other.buckets != self.buckets:
+            raise ValueError("Cannot merge histograms with different buckets.")
+        with self._lock:
+            self.counts = [count + other_count
+                           for count, other_count in zip(self.counts, other.counts)]
+            self.count += other.count
+            self.sum += other.sum
+
+    def percentile(self, percentile):
+        """
+        Estimate a percentile by interpolating linearly within its bucket.
+        :return: The estimate or None if nothing is observed.
+        """
+        if not self.count:
+            return None
+        rank = percentile / 100 * self.count
+        cumulative = 0
+        for index, count in enumerate(self.counts):
+            if count and cumulative + count >= rank:
+                lower = self.buckets[index - 1] if index > 0 else 0.0
+                if index == len(self.buckets):  # The overflow bucket has no upper bound.
+                    return lower
+                return lower + (self.buckets[index] - lower) * (rank - cumulative) / count
+            cumulative += count
+        return self.buckets[-1]
+
+    def to_dict(self):
+        return {'buckets': self.buckets, 'counts': list(self.counts), 'count': self.count,
+                'sum': round(self.sum, 6),
+                'p50': self.percentile(50), 'p90': self.percentile(90),
+                'p99': self.percentile(99)}
+
+    @classmethod
+    def from_dict(cls, values):
+        histogram = cls(values['buckets'])
+        histogram.counts = list(values['counts'])
+        histogram.count = values['count']
+        histogram.sum = values['sum']
+        return histogram
+
+
+class MetricsRegistry:
+    """
+    Registry of the metrics of a process. A metric is identified by its name and labels, and is
+    created on first use.
+    """
+
+    def __init__(self):
+        self._metrics = {}  # (name, sorted label items): metric.
+        self._help = {}  # Name: (type, help text).
+        self._lock = threading.Lock()
+
+    def counter(self, name, help_text='', **labels) -> Counter:
+        return self._get(Counter, name, help_text, labels)
+
+    def gauge(self, name, help_text='', **labels) -> Gauge:
+        return self._get(Gauge, name, help_text, labels)
+
+    def histogram(self, name, help_text='', buckets=None, **labels) -> Histogram:
+        return self._get(Histogram, name, help_text, labels, buckets)
+
+    def _get(self, metric_class, name, help_text, labels, *args):
+        key = (name, tuple(sorted((label, str(value)) for label, value in labels.items())))
+        metric = self._metrics.get(key)
+        if metric is None:
+            with self._lock:
+                metric = self._metrics.get(key)
+                if metric is None:
+                    metric_type, _ = self._help.setdefault(name, (metric_class.TYPE, help_text))
+                    if metric_type != metric_class.TYPE:
+                        raise ValueError("Metric {} is a {}.".format(name, metric_type))
+                    metric = self._metrics[key] = metric_class(*args)
+        if not isinstance(metric, metric_class):
+            raise ValueError("Metric {} is a {}.".format(name, metric.TYPE))
+        return metric
+
+    def snapshot(self):
+        """
+        Get the current values of all metrics.
+        :return: Dict of name: value, or name: {label string: value} for labelled metrics.
+        """
+        result = {}
+        for (name, labels), metric in self._items():
+            if labels:
+                label_text = ','.join('{}={}'.format(label, value) for label, value in labels)
+                result.setdefault(name, {})[label_text] = metric.to_dict()
+            else:
+                result[name] = metric.to_dict()
+        return result
+
+    def exposition(self):
+        """
+        Get the current values of all metrics in the Prometheus text exposition format.
+        """
+        lines = []
+        items = self._items()
+        for name, (metric_type, help_text) in sorted(self._help.items()):
+            lines.append('# HELP {} {}'.format(name, help_text or name))
+            lines.append('# TYPE {} {}'.format(name, metric_type))
+            for (metric_name, labels), metric in items:
+                if metric_name != name:
+                    continue
+                if metric_type == Histogram.TYPE:
+                    cumulative = 0
+                    for bound, count in zip(metric.buckets + ['+Inf'], metric.counts):
+                        cumulative += count
+                        lines.append('{}_bucket{} {}'.format(
+                            name, self._labels(labels + (('le', '{:g}'.format(bound)
+                                                          if bound != '+Inf' else bound),)),
+                            cumulative))
+                    lines.append('{}_sum{} {}'.format(name, self._labels(labels), metric.sum))
+                    lines.append('{}_count{} {}'.format(name, self._labels(labels), metric.count))
+                else:
+                    lines.append('{}{} {}'.format(name, self._labels(labels), metric.value))
+        return '\n'.join(lines) + '\n'
+
+    def _items(self):
+        with self._lock:  # Metrics may be created by other threads, e.g., of uploads.
+            return sorted(self._metrics.items(), key=lambda item: item[0])
+
+    @staticmethod
+    def _labels(labels):
+        if not labels:
+            return ''
+        return '{' + ','.join('{}="{}"'.format(label, str(value).replace('\\', '\\\\')
+                                               .replace('"', '\\"')) for label, value in labels) + '}'
+
+
+# Registry of the metrics of this process.
+REGISTRY = MetricsRegistry()
+
+
+async def handle_request(reader, writer, registry=REGISTRY):
+    """
+    Serve a single HTTP request for the metrics: /metrics in the Prometheus text format or
+    /metrics.json with the percentiles of the histograms.
+    """
+    try:
+        request_line = (await reader.readline()).decode('latin-1').split()
+        while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+            pass  # Skip the headers.
+        path = request_line[1].split('?')[0] if len(request_line) > 1 else ''
+        if path == '/metrics':
+            status, content_type, body = '200 OK', 'text/plain; version=0.0.4', \
+                registry.exposition()
+        elif path == '/metrics.json':
+            status, content_type, body = '200 OK', 'application/json', \
+                json.dumps(registry.snapshot())
+        else:
+            status, content_type, body = '404 Not Found', 'text/plain', 'Not found\n'
+        body = body.encode('utf-8')
+        writer.write('HTTP/1.0 {}\r\nContent-Type: {}\r\nContent-Length: {}\r\n\r\n'.format(
+            status, content_type, len(body)).encode('latin-1') + body)
+        await writer.drain()
+    finally:
+        writer.close()
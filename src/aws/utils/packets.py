@@ -1,13 +1,15 @@
 import json
-import time as timepackage
 
 import psutil
 
+import aws.utils.config as config
+from aws.utils import clock
+
 
 class Packet(dict):
 
     def __init__(self, packet_type, time, **kwargs):
-        time = time if time else timepackage.time()
+        time = time if time else clock.time()
         for key, value in kwargs.items():  # Convert all non built-ins to strings.
             if value.__class__.__module__ != 'builtins':
                 kwargs[key] = str(value)
@@ -21,8 +23,8 @@ class HeartBeatPacket(Packet):
 
     def __init__(self, instance_id, instance_state, instance_type, packet_type='HeartBeat',
                  time=None, cpu_usage=None, mem_usage=None, **kwargs):
-        cpu_usage = cpu_usage if cpu_usage else self.get_cpu_usage()
-        mem_usage = mem_usage if mem_usage else self.get_mem_usage()
+        cpu_usage = cpu_usage if cpu_usage is not None else self.get_cpu_usage()
+        mem_usage = mem_usage if mem_usage is not None else self.get_mem_usage()
         super().__init__(packet_type=packet_type,
                          instance_id=instance_id,
                          time=time,
@@ -41,6 +43,121 @@ class HeartBeatPacket(Packet):
         return psutil.virtual_memory().percent
 
 
+class HeartBeatDeltaPacket(Packet):
+    """
+    Heartbeat containing only the fields that changed since the acknowledged heartbeat `base`.
+    Dict fields that changed are patched per key instead of being sent completely.
+    """
+
+    def __init__(self, instance_id, base, sequence, packet_type='HeartBeatDelta', time=None,
+                 changed=None, removed=None, patch=None, **kwargs):
+        super().__init__(packet_type=packet_type, time=time, instance_id=instance_id, base=base,
+                         sequence=sequence, changed=changed if changed else {},
+                         removed=removed if removed else [], patch=patch if patch else {},
+                         **kwargs)
+
+
+class HeartBeatEncoder:
+    """
+    Encodes the heartbeats of a single stream into delta heartbeats. Deltas are relative to the last
+    heartbeat acknowledged by the receiver, and a full heartbeat (keyframe) is sent periodically
+    and whenever there is no acknowledged heartbeat.
+    """
+
+    def __init__(self, keyframe_interval=config.HEARTBEAT_KEYFRAME_INTERVAL):
+        self.keyframe_interval = keyframe_interval
+        self._sequence = 0
+        self._since_keyframe = 0
+        self._base = None
+        self._pending = None
+
+    def encode(self, heartbeat):
+        """
+        Encode a heartbeat to send.
+        :param heartbeat: Full heartbeat.
+        :return: The full heartbeat or a delta heartbeat.
+        """
+        self._sequence += 1
+        heartbeat['hb_seq'] = self._sequence
+        state = json.loads(json.dumps(heartbeat))  # Detach from objects that may still change.
+        self._pending = state
+        if self._base is None or self._since_keyframe >= self.keyframe_interval:
+            self._since_keyframe = 0
+            return heartbeat
+        self._since_keyframe += 1
+        changed, removed, patch = self._diff(self._base, state)
+        return HeartBeatDeltaPacket(instance_id=state['instance_id'], base=self._base['hb_seq'],
+                                    sequence=self._sequence, time=state['time'],
+                                    changed=changed, removed=removed, patch=patch)
+
+    @staticmethod
+    def _diff(base, state):
+        changed, patch = {}, {}
+        for key, value in state.items():
+            old = base.get(key)
+            if key in ('time', 'hb_seq') or (key in base and old == value):
+                continue
+            if isinstance(value, dict) and isinstance(old, dict):
+                patch[key] = {'changed': {sub_key: sub_value for sub_key, sub_value in value.items()
+                                          if sub_key not in old or old[sub_key] != sub_value},
+                              'removed': [sub_key for sub_key in old if sub_key not in value]}
+            else:
+                changed[key] = value
+        removed = [key for key in base if key not in state]
+        return changed, removed, patch
+
+    def acknowledge(self):
+        """
+        Mark the last encoded heartbeat as received, so following deltas are relative to it.
+        """
+        if self._pending is not None:
+            self._base = self._pending
+            self._pending = None
+
+    def reset(self):
+        """
+        Send a keyframe next, e.g., when the receiver could not rebuild a delta.
+        """
+        self._base = None
+        self._pending = None
+
+
+class HeartBeatDecoder:
+    """
+    Rebuilds full heartbeats from the full and delta heartbeats of one or more instances.
+    """
+
+    def __init__(self):
+        self._states = {}  # Instance id: last full heartbeat.
+
+    def decode(self, packet):
+        """
+        Rebuild the full heartbeat of a received heartbeat.
+        :param packet: Full or delta heartbeat.
+        :return: Full heartbeat or None if the delta is not relative to a known heartbeat.
+        """
+        if not isinstance(packet, HeartBeatDeltaPacket):
+            self._states[packet['instance_id']] = dict(packet)
+            return packet
+        state = self._states.get(packet['instance_id'])
+        if not state or state.get('hb_seq') != packet['base']:
+            return None
+        state = dict(state)
+        state.update(packet['changed'])
+        for key in packet['removed']:
+            state.pop(key, None)
+        for key, key_patch in packet['patch'].items():
+            value = dict(state.get(key) or {})
+            value.update(key_patch['changed'])
+            for sub_key in key_patch['removed']:
+                value.pop(sub_key, None)
+            state[key] = value
+        state['hb_seq'] = packet['sequence']
+        state['time'] = packet['time']
+        self._states[packet['instance_id']] = state
+        return HeartBeatPacket(**state)
+
+
 class CommandPacket(Packet):
 
     def __init__(self, command, packet_type='Command', time=None, **kwargs):
@@ -55,4 +172,6 @@ class PacketTranslator:
             return HeartBeatPacket(**packet)
         if packet['packet_type'] == 'Command':
             return CommandPacket(**packet)
+        if packet['packet_type'] == 'HeartBeatDelta':
+            return HeartBeatDeltaPacket(**packet)
         raise Exception('Unknown packet provided: {}'.format(packet['packet_type']))
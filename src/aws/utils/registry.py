@@ -0,0 +1,121 @@
+"""
+Module for the registry of instances and their states.
+"""
+from aws.utils.state import InstanceState
+
+
+class InstanceRegistry:
+    """
+    Registry of the instances per role (e.g., 'node_manager' or 'worker') with an index per role and
+    state, which is updated on every state transition. Looking up the instances of a role in some
+    states costs O(result) instead of a scan over all instances.
+    The index keeps the instances in the order they entered their state.
+    """
+
+    def __init__(self):
+        self._roles = {}  # Instance id: role.
+        self._nodes = {}  # Role: {instance id: InstanceState}.
+        self._index = {}  # (role, state): {instance id: None}, used as an ordered set.
+        self._versions = {}  # Role: number of transitions of the instances with that role.
+
+    def __contains__(self, instance_id):
+        return instance_id in self._roles
+
+    def __len__(self):
+        return len(self._roles)
+
+    def get_role(self, instance_id):
+        return self._roles.get(instance_id)
+
+    def get_state(self, instance_id):
+        role = self._roles.get(instance_id)
+        return self._nodes[role][instance_id] if role else None
+
+    def get_nodes(self, role):
+        """
+        Get the instances of a role.
+        :return: Dict of the instance ids and their InstanceState.
+        """
+        return self._nodes.setdefault(role, {})
+
+    def version(self, role):
+        """
+        Get a counter that changes whenever an instance of the role changes state, e.g., to cache
+        results derived from the registry.
+        """
+        return self._versions.get(role, 0)
+
+    def set_state(self, instance_id, role, state):
+        """
+        Set the state of an instance and update the index.
+        :param instance_id: Instance id.
+        :param role: Role of the instance.
+        :param state: InstanceState or state id.
+        :return: The previous InstanceState or None if the instance was not registered.
+        """
+        state = state if isinstance(state, InstanceState) else InstanceState(state)
+        old_state = self.get_state(instance_id)
+        if old_state is not None and self._roles[instance_id] == role and \
+                old_state.get_state() == state.get_state():
+            return old_state
+        if old_state is not None:
+            self._unindex(instance_id)
+        self._roles[instance_id] = role
+        self.get_nodes(role)[instance_id] = state
+        self._index.setdefault((role, state.get_state()), {})[instance_id] = None
+        self._versions[role] = self.version(role) + 1
+        return old_state
+
+    def remove(self, instance_id):
+        if instance_id in self._roles:
+            self._unindex(instance_id)
+
+    def _unindex(self, instance_id):
+        role = self._roles.pop(instance_id)
+        state = self._nodes[role].pop(instance_id)
+        del self._index[(role, state.get_state())][instance_id]
+        self._versions[role] = self.version(role) + 1
+
+    def get_all(self, role, states=None):
+        """
+        Get the instances of a role.
+        :param role: Role of the instances.
+        :param states: Optional state id or list of state ids to filter for.
+        :return: List of instance ids.
+        """
+        if states is None:
+            return list(self.get_nodes(role))
+        if isinstance(states, int):
+            states = [states]
+        return [instance_id for state in states
+                for instance_id in self._index.get((role, state), ())]
+
+    def count(self, role, states):
+        if isinstance(states, int):
+            states = [states]
+        return sum(len(self._index.get((role, state), ())) for state in states)
+
+    def has(self, role, states):
+        return self.count(role, states) > 0
+
+    def is_state(self, instance_id, role, state):
+        if self._roles.get(instance_id) != role:
+            return False
+        return self._nodes[role][instance_id].is_state(state)
+
+    def sync(self, role, instances):
+        """
+        Replace the instances of a role by a new membership, e.g., as received from the IM.
+        :param role: Role of the instances.
+        :param instances: Dict of state ids and the list of instance ids in that state.
+        :return: Tuple of the removed and the added instance ids.
+        """
+        current = {instance_id: state for state, instance_ids in instances.items()
+                   for instance_id in instance_ids}
+        removed = [instance_id for instance_id in self.get_nodes(role) if instance_id not in current]
+        for instance_id in removed:
+            self.remove(instance_id)
+        added = [instance_id for instance_id in current if instance_id not in self._roles]
+        for instance_id, state in current.items():
+            self.set_state(instance_id, role, state)
+        return removed, added
@@ -111,6 +111,7 @@ class InstanceState(State):
         """
         if isinstance(state_to_map, int):
             return state_to_map
+        state_to_map = state_to_map.replace('-', '_')  # EC2 names, e.g., 'shutting-down'.
         for key, value in self.MAPPING.items():
             if value == state_to_map:
                 return key
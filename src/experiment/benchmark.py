@@ -0,0 +1,298 @@
+"""
+Microbenchmarks of the hot paths of the control plane: the packets sent between the instances, the
+TaskPool of the node manager and the Instances, TimeWindow and BotoInstanceReader of the instance
+manager. Every benchmark reports its operations per second and the memory it allocates per
+operation, and can be compared with stored baselines to detect regressions. Baselines depend on
+the machine, so they are not part of the repository: the first comparison on a machine stores its
+results as the baselines.
+
+Example: python src/experiment/benchmark.py --compare
+         python src/experiment/benchmark.py --filter taskpool --save
+"""
+import argparse
+import copy
+import io
+import json
+import logging
+import os
+import sys
+import time
+import tracemalloc
+from collections import deque
+from contextlib import redirect_stdout
+
+sys.path.append('./src')
+
+from aws.instancemanager.instancemanager import Instances, TimeWindow
+from aws.nodemanager.nodemanager import TaskPool
+from aws.utils.botoutils import BotoInstanceReader
+from aws.utils.connection import decode_packet, encode_packet
+from aws.utils.localcloud import LocalEc2, LocalSsm
+from aws.utils.packets import HeartBeatPacket, PacketTranslator
+from aws.utils.state import InstanceState
+
+BASELINE_FILE = os.path.join('src', 'experiment', 'benchmark_baseline.json')
+BOTO_RESULT_FILE = os.path.join('test', 'test_files', 'boto_result.json')
+
+# Sizes of the benchmarks, as (workers, tasks).
+SIZES = [(10, 100), (100, 1000)]
+
+
+def node_manager_heartbeat(workers, tasks):
+    """
+    Create a heartbeat of a node manager as sent to the IM.
+    """
+    return HeartBeatPacket(instance_id='node_manager', instance_type='node_manager',
+                           instance_state=InstanceState.RUNNING, cpu_usage=50.0, mem_usage=50.0,
+                           tasks_waiting=tasks, tasks_running=workers,
+                           worker_allocation={'i-{:017x}'.format(worker): tasks // workers
+                                              for worker in range(workers)},
+                           worker_health={'i-{:017x}'.format(worker): [0.0, 1, 50.0, 50.0, 3]
+                                          for worker in range(workers)},
+                           queue_depth={'interactive': 0, 'bulk': tasks}, overloaded=False,
+                           tasks_arrived=tasks, service_time=1.0, interval=2)
+
+
+def create_taskpool(workers, tasks):
+    """
+    Create a TaskPool with running workers and registered tasks that are not yet assigned.
+    :return: The TaskPool and the keys of the tasks.
+    """
+    taskpool = TaskPool('node_manager', host='127.0.0.1', port=0, resource_manager=None)
+    for worker in range(workers):
+        worker = 'i-{:017x}'.format(worker)
+        taskpool.workers.set_state(worker, 'worker', InstanceState(InstanceState.RUNNING))
+        taskpool.task_assignment[worker] = deque()
+        taskpool.task_processing[worker] = deque()
+    keys = ['task{}.txt'.format(task) for task in range(tasks)]
+    for task in keys:
+        taskpool.tasks.append(task, source='10.0.0.{}'.format(hash(task) % 16))
+    return taskpool, keys
+
+
+def bench_assign_tasks(workers, tasks):
+    taskpool, keys = create_taskpool(workers, tasks)
+    taskpool.tasks = type(taskpool.tasks)(table=taskpool.table)  # Keep the tasks in the table only.
+
+    def op():
+        taskpool.tasks.extend(keys)
+        taskpool.assign_tasks()
+        for assignment in taskpool.task_assignment.values():  # Undo the assignment.
+            assignment.clear()
+        taskpool.all_assigned_tasks = 0
+    return op
+
+
+def bench_steal_task(workers, tasks):
+    taskpool, _ = create_taskpool(workers, tasks)
+    taskpool.assign_tasks()
+    thieves = list(taskpool.task_assignment)
+
+    def op():
+        thief = thieves[0]
+        task = taskpool.steal_task(thief)
+        if task:
+            taskpool.task_assignment[thief].append(task)
+        thieves.append(thieves.pop(0))
+    return op
+
+
+def bench_generate_heartbeat(workers, tasks):
+    taskpool, _ = create_taskpool(workers, tasks)
+    taskpool.assign_tasks()
+    return lambda: taskpool.generate_heartbeat(notify=False)
+
+
+def bench_heartbeat_packet(workers, tasks):
+    return lambda: node_manager_heartbeat(workers, tasks)
+
+
+def bench_encode_packet(workers, tasks):
+    heartbeat = node_manager_heartbeat(workers, tasks)
+    return lambda: encode_packet(heartbeat)
+
+
+def bench_decode_packet(workers, tasks):
+    data = encode_packet(node_manager_heartbeat(workers, tasks))
+    return lambda: decode_packet(data)
+
+
+def bench_translate(workers, tasks):
+    packet = json.loads(encode_packet(node_manager_heartbeat(workers, tasks)))
+    return lambda: PacketTranslator.translate(packet)
+
+
+def bench_instances_get_all(workers, tasks):
+    instances = Instances()
+    for worker in range(workers):
+        state = InstanceState.RUNNING if worker % 2 else InstanceState.STOPPED
+        instances.set_state('i-{:017x}'.format(worker), 'worker', InstanceState(state))
+    return lambda: instances.get_all('worker', [InstanceState.RUNNING, InstanceState.PENDING])
+
+
+def bench_update_node_manager(workers, tasks):
+    window = TimeWindow()
+    heartbeat = node_manager_heartbeat(workers, tasks)
+    return lambda: window.update_node_manager(heartbeat)
+
+
+def bench_get_action(workers, tasks):
+    window = TimeWindow()
+    for index in range(2):
+        heartbeat = node_manager_heartbeat(workers, tasks)
+        heartbeat['time'] += index
+        window.update_node_manager(heartbeat)
+    current_workers = list(window.worker_allocation)
+    return lambda: window.get_action(current_workers, 2 * workers)
+
+
+def bench_boto_read(workers, tasks):
+    with open(BOTO_RESULT_FILE) as file:
+        canned = json.load(file)
+    reservations = []
+    for copy_index in range(max(1, workers // 4)):  # The canned response has 4 instances.
+        for reservation in copy.deepcopy(canned['Reservations']):
+            for instance in reservation['Instances']:
+                instance['InstanceId'] += '-{}'.format(copy_index)
+            reservations.append(reservation)
+    reader = BotoInstanceReader(ec2=LocalEc2(), ssm=LocalSsm())
+    response = {'Reservations': reservations}
+    return lambda: reader.read(own_instance='instance_manager', filters=['is_worker'],
+                               boto_response=response)
+
+
+BENCHMARKS = [
+    ('packets.heartbeat_packet', bench_heartbeat_packet),
+    ('packets.encode_packet', bench_encode_packet),
+    ('packets.decode_packet', bench_decode_packet),
+    ('packets.translate', bench_translate),
+    ('taskpool.assign_tasks', bench_assign_tasks),
+    ('taskpool.steal_task', bench_steal_task),
+    ('taskpool.generate_heartbeat', bench_generate_heartbeat),
+    ('instances.get_all', bench_instances_get_all),
+    ('timewindow.update_node_manager', bench_update_node_manager),
+    ('timewindow.get_action', bench_get_action),
+    ('botoutils.read', bench_boto_read)
+]
+
+
+def measure(op, min_time=0.2, repeat=5, samples=20):
+    """
+    Measure an operation.
+    :param op: Function without arguments to measure.
+    :param min_time: Minimum seconds of a single timed run.
+    :param repeat: Number of timed runs, of which the fastest is used.
+    :param samples: Number of operations of which the allocated memory is traced.
+    :return: Dict with the operations per second, the peak bytes allocated during an operation
+    and the bytes still allocated after an operation.
+    """
+    iterations = 1
+    while True:  # Find the number of iterations that takes at least min_time.
+        elapsed = _time(op, iterations)
+        if elapsed >= min_time:
+            break
+        iterations *= 2 if elapsed < min_time / 10 else 1 + int(min_time / max(elapsed, 1e-9))
+    best = min([elapsed] + [_time(op, iterations) for _ in range(repeat - 1)])
+    peak, retained = [], []
+    for _ in range(samples):  # Traced separately, as tracing slows down the operations.
+        tracemalloc.start()
+        op()
+        current, maximum = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        peak.append(maximum)
+        retained.append(current)
+    return {'ops_per_sec': round(iterations / best, 1),
+            'alloc_bytes': int(sum(peak) / samples),
+            'retained_bytes': int(sum(retained) / samples)}
+
+
+def _time(op, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        op()
+    return time.perf_counter() - start
+
+
+def run(names=None, min_time=0.2, sizes=None):
+    """
+    Run the benchmarks.
+    :param names: Optional substring of the names of the benchmarks to run.
+    :param min_time: Minimum seconds of a single timed run.
+    :param sizes: List of (workers, tasks), by default SIZES.
+    :return: Dict of benchmark name: result of measure.
+    """
+    results = {}
+    loggers = [logging.getLogger(), logging.getLogger('metric')]
+    levels = [logger.level for logger in loggers]
+    for logger in loggers:
+        logger.setLevel(logging.WARNING)  # Writing the log would dominate the measurements.
+    try:
+        with redirect_stdout(io.StringIO()):
+            for name, setup in BENCHMARKS:
+                for workers, tasks in sizes if sizes else SIZES:
+                    full_name = '{}[workers={},tasks={}]'.format(name, workers, tasks)
+                    if names and names not in full_name:
+                        continue
+                    results[full_name] = measure(setup(workers, tasks), min_time=min_time)
+    finally:
+        for logger, level in zip(loggers, levels):
+            logger.setLevel(level)
+    return results
+
+
+def compare(results, baselines, tolerance):
+    """
+    Compare results with baselines.
+    :param tolerance: Allowed relative slowdown or increase of the allocated memory.
+    :return: List of the names of the benchmarks that regressed.
+    """
+    regressions = []
+    for name, result in results.items():
+        baseline = baselines.get(name)
+        if not baseline:
+            continue
+        if result['ops_per_sec'] < baseline['ops_per_sec'] * (1 - tolerance) or \
+                result['alloc_bytes'] > baseline['alloc_bytes'] * (1 + tolerance):
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--filter', default=None, help="Only run benchmarks containing this.")
+    parser.add_argument('--min-time', type=float, default=0.2)
+    parser.add_argument('--baseline', default=BASELINE_FILE)
+    parser.add_argument('--save', action='store_true', help="Store the results as baselines.")
+    parser.add_argument('--compare', action='store_true', help="Compare with the baselines.")
+    # The timings vary between runs on a busy machine, so only large slowdowns are regressions.
+    parser.add_argument('--tolerance', type=float, default=0.5)
+    args = parser.parse_args()
+
+    baselines = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as file:
+            baselines = json.load(file)
+    elif args.compare:
+        print("No baselines found in {}. Storing the results as baselines.".format(args.baseline))
+        args.save = True
+    results = run(args.filter, min_time=args.min_time)
+    regressions = compare(results, baselines, args.tolerance) if args.compare else []
+    print('{:<60} {:>12} {:>10} {:>12} {:>9}'.format('benchmark', 'ops/sec', 'alloc B',
+                                                      'retained B', 'vs base'))
+    for name, result in results.items():
+        baseline = baselines.get(name)
+        change = '{:+.0%}'.format(result['ops_per_sec'] / baseline['ops_per_sec'] - 1) \
+            if baseline else ''
+        print('{:<60} {:>12.1f} {:>10} {:>12} {:>9}{}'.format(
+            name, result['ops_per_sec'], result['alloc_bytes'], result['retained_bytes'], change,
+            ' REGRESSION' if name in regressions else ''))
+    if args.save:
+        baselines.update(results)
+        with open(args.baseline, 'w') as file:
+            json.dump(baselines, file, indent=2, sort_keys=True)
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
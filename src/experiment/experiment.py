@@ -130,6 +130,34 @@ class Plotter:
                            )
             )
 
+    @staticmethod
+    def histogram_statistics(metrics, histogram, rounding=2):
+        """
+        Print the statistics of a histogram from the last snapshot of the metrics registry, for the
+        events that are only logged one by one with METRICS_LOG_EVENTS.
+        :param histogram: Name of the histogram, e.g., 's3_upload_seconds'.
+        """
+        for _, values in metrics.items():  # This loop always runs once (metrics=['metrics']).
+            _, snapshot = values[-1]  # The histograms are cumulative.
+            if not snapshot.get(histogram, {}).get('count'):
+                continue
+            values = snapshot[histogram]
+            print(
+                """Statistics report [{}]:
+                    - Count  : {}
+                    - Average: {}
+                    - P50    : {}
+                    - P90    : {}
+                    - P99    : {}
+                """.format(histogram,
+                           values['count'],
+                           round(values['sum'] / values['count'], rounding),
+                           round(values['p50'], rounding),
+                           round(values['p90'], rounding),
+                           round(values['p99'], rounding)
+                           )
+            )
+
     @staticmethod
     def charge_time(metrics, rounding=2):
         for _, values in metrics.items():
@@ -238,8 +266,12 @@ def main_im():
     plotter.process(metrics, ['workers'], plotter.plot_metrics,
                     xlabel='Time (in seconds)', ylabel='Workers running',
                     int_yticks=True)
-    plotter.process(metrics, ['upload_duration'],
-                    plotter.statistics)
+    if 'upload_duration' in metrics:
+        plotter.process(metrics, ['upload_duration'],
+                        plotter.statistics)
+    else:  # Without METRICS_LOG_EVENTS, the uploads are only aggregated in a histogram.
+        plotter.process(metrics, ['metrics'], plotter.histogram_statistics,
+                        histogram='s3_upload_seconds')
     plotter.process(metrics, ['charged_time'],
                     plotter.charge_time)
     plotter.process(metrics, ['heartbeat'], plotter.plot_heartbeats,
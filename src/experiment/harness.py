@@ -0,0 +1,130 @@
+"""
+Local harness that runs the application as a multi-process cluster on this machine. The instance
+manager, node manager and workers are separate processes, as on EC2, but EC2, SSM and S3 are local
+stand-ins (see aws.utils.localcloud). The harness runs a scenario and reports the throughput and
+latency percentiles of the tasks, e.g., to benchmark a change end to end before deploying it.
+
+Example: python src/experiment/harness.py --workers 4 --scenario src/data/elasticity_scenario.csv
+"""
+import argparse
+import glob
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.append('./src')
+
+from aws.utils.localcloud import LocalCloud
+
+METRIC_PREFIX = 'METRIC'
+
+
+def read_metrics(root):
+    """
+    Read the metrics logged by the processes of a local cloud, both from the logs that are still
+    written and from the logs that are uploaded to the local S3.
+    :return: List of metric dicts.
+    """
+    paths = glob.glob(os.path.join(root, 'logs', '*.log'))
+    paths += glob.glob(os.path.join(root, 's3', '*-logging', '*', '*.log'))
+    metrics = []
+    for path in paths:
+        with open(path) as file:
+            for line in file:
+                index = line.find(METRIC_PREFIX)
+                if line.startswith('INFO') and index >= 0:
+                    try:
+                        metrics.append(json.loads(line[index + len(METRIC_PREFIX):]))
+                    except ValueError:  # A line that is still being written.
+                        pass
+    return metrics
+
+
+def report(metrics, tasks):
+    """
+    Summarize the metrics of a run.
+    :param metrics: List of metric dicts.
+    :param tasks: Number of tasks in the scenario.
+    """
+    finished = pd.DataFrame([metric['task_finished'] for metric in metrics
+                             if 'task_finished' in metric],
+                            columns=['start_time', 'duration', 'response_time'])
+    finish_times = [metric['time'] for metric in metrics if 'task_finished' in metric]
+    result = {'tasks': tasks, 'tasks_finished': len(finished)}
+    if len(finished) > 1:
+        span = max(finish_times) - finished['start_time'].min()
+        result['throughput'] = round(len(finished) / span, 3) if span > 0 else None
+    for column in ('duration', 'response_time'):
+        values = finished[column].dropna()
+        for percentile in (50, 90, 99):
+            result['{}_p{}'.format(column, percentile)] = \
+                round(float(np.percentile(values, percentile)), 3) if len(values) else None
+    result['max_workers'] = max((metric['workers'] for metric in metrics if 'workers' in metric),
+                                default=0)
+    return result
+
+
+def run(root, tasks, timeout, poll=5, quiet=False):
+    """
+    Run the instance manager of a local cloud until all tasks of the scenario are finished.
+    :param root: Directory of the local cloud.
+    :param tasks: Number of tasks in the scenario.
+    :param timeout: Seconds after which the run is stopped, even if tasks are not finished.
+    :return: List of metric dicts.
+    """
+    cloud = LocalCloud(root)
+    with open(os.path.join(root, 'logs', 'instance_manager.out'), 'a') as output:
+        process = subprocess.Popen([sys.executable, os.path.join('src', 'main.py'),
+                                    'instance_manager'], stdout=output, stderr=subprocess.STDOUT,
+                                   start_new_session=True, env=cloud.environment('instance_manager'))
+    open(os.path.join(root, 'pids', str(process.pid)), 'w').close()
+    start_time = time.time()
+    try:
+        finished = 0
+        while finished < tasks and time.time() - start_time < timeout and process.poll() is None:
+            time.sleep(poll)
+            finished = sum('task_finished' in metric for metric in read_metrics(root))
+            if not quiet:
+                print("{:.0f}s: {}/{} tasks finished".format(time.time() - start_time, finished,
+                                                             tasks))
+    finally:
+        # The instance manager stops its instances (and so their processes) on an interrupt.
+        LocalCloud.stop_process(root, process.pid)
+        try:
+            process.wait(timeout=60)
+        except subprocess.TimeoutExpired:
+            pass
+        LocalCloud.stop_all(root, signal.SIGKILL)
+    return read_metrics(root)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--scenario', default=os.path.join('src', 'data',
+                                                           'elasticity_scenario.csv'))
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--timeout', type=float, default=1800)
+    parser.add_argument('--directory', default=None,
+                        help="Directory of the local cloud, by default a temporary directory.")
+    parser.add_argument('--trace-sample-rate', type=float, default=1.0,
+                        help="Fraction of the tasks of which the node managers export a trace to "
+                             "the logs of the local cloud. 0 disables tracing.")
+    args = parser.parse_args()
+    os.environ['TRACE_SAMPLE_RATE'] = str(args.trace_sample_rate)  # Passed on to the instances.
+
+    root = os.path.abspath(args.directory if args.directory else tempfile.mkdtemp(prefix='cloud'))
+    LocalCloud.create(root, node_managers=1, workers=args.workers, scenario=args.scenario)
+    print("Running the local cloud in {}".format(root))
+    tasks = len(pd.read_csv(args.scenario))
+    print(report(run(root, tasks=tasks, timeout=args.timeout), tasks=tasks))
+
+
+if __name__ == '__main__':
+    main()
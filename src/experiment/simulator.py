@@ -0,0 +1,444 @@
+"""
+Discrete-event simulator of the cluster. The simulator runs the real TaskPool (assignment,
+stealing and speculation), TimeWindow and scaling policy on a virtual clock, while the EC2
+instances and the work of the workers are simulated. A 30-minute scenario is replayed in seconds.
+
+Example: python src/experiment/simulator.py --service-time exp:1.5 --boot-time uniform:40,80
+"""
+import argparse
+import heapq
+import io
+import itertools
+import json
+import logging
+import os
+import random
+import sys
+import tarfile
+from collections import deque
+from contextlib import redirect_stdout
+
+import pandas as pd
+
+sys.path.append('./src')
+
+import aws.utils.config as config
+from aws.instancemanager.instancemanager import Instances, NodeMonitor, TimeWindow
+from aws.nodemanager.nodemanager import TaskPool, TaskPoolMonitor
+from aws.resourcemanager.resourcemanager import flush_logs, log_metric
+from aws.utils import clock
+from aws.utils.heartbeat import AdaptiveInterval
+from aws.utils.monitor import Listener
+from aws.utils.packets import CommandPacket, HeartBeatPacket
+from aws.utils.state import InstanceState, ProgramState
+
+NODE_MANAGER = 'node_manager'
+NODE_MANAGER_IP = '10.0.0.1'
+
+
+def parse_distribution(spec, rng):
+    """
+    Create a function sampling from a distribution.
+    :param spec: 'const:x', 'exp:mean', 'uniform:low,high' or 'lognormal:mu,sigma'.
+    :param rng: Random generator to sample with.
+    :return: Function without arguments returning a sample in seconds.
+    """
+    name, _, args = spec.partition(':')
+    args = [float(arg) for arg in args.split(',') if arg]
+    if name == 'const':
+        return lambda: args[0]
+    if name == 'exp':
+        return lambda: rng.expovariate(1 / args[0])
+    if name == 'uniform':
+        return lambda: rng.uniform(args[0], args[1])
+    if name == 'lognormal':
+        return lambda: rng.lognormvariate(args[0], args[1])
+    raise ValueError("Unknown distribution: {}".format(spec))
+
+
+class MetricCollector(logging.Handler):
+    """
+    Collects the metrics logged by log_metric, in the format of experiment.Parser._extract_metrics.
+    """
+
+    def __init__(self):
+        super().__init__(level=logging.INFO)
+        self.metrics = []
+
+    def emit(self, record):
+        message = record.getMessage()
+        if message.startswith('METRIC'):
+            self.metrics.append(json.loads(message[len('METRIC'):]))
+
+
+class SimulatedTaskPool(TaskPool):
+    """
+    TaskPool that keeps the task data in memory instead of uploading it to S3.
+    """
+
+    def register_task(self, task_data, key=None):
+        return key if key else self.new_task_key()
+
+
+class NodeManagerLink(Listener):
+    """
+    Delivers the heartbeats of the TaskPool to the IM and the response back to the TaskPool.
+    """
+
+    def __init__(self, monitor: NodeMonitor, taskpool_monitor: TaskPoolMonitor):
+        super().__init__()
+        self.monitor = monitor
+        self.taskpool_monitor = taskpool_monitor
+
+    def event(self, message):
+        response = self.monitor.process_heartbeat(message, (NODE_MANAGER_IP, 0))
+        self.taskpool_monitor.process_heartbeat(response)
+
+
+class SimulatedWorker:
+    """
+    Worker following the protocol of WorkerCore with the node manager. Processing a task takes a
+    sample of the service time distribution.
+    """
+
+    def __init__(self, simulation, instance_id):
+        self.sim = simulation
+        self.instance_id = instance_id
+        self.source = (instance_id, 0)
+        self.queue = deque()
+        self.current_task = None
+        self.started = None
+        self.task_command_received = False
+        self.heartbeat_interval = AdaptiveInterval('worker', config.HEART_BEAT_INTERVAL_WORKER)
+        self.alive = True
+
+    def start(self):
+        self._poll()
+
+    def stop(self):
+        self.alive = False
+
+    def _poll(self):
+        if not self.alive:
+            return
+        load = len(self.queue) + (1 if self.current_task else 0)
+        if self.heartbeat_interval.due(load, idle=load == 0):
+            self._send_heartbeat()
+        self.sim.schedule(self.heartbeat_interval.min_interval, self._poll)
+
+    def _send_heartbeat(self):
+        busy = self.current_task is not None
+        heartbeat = HeartBeatPacket(instance_id=self.instance_id,
+                                    instance_type='worker',
+                                    instance_state=InstanceState(InstanceState.RUNNING),
+                                    program_state=str(ProgramState(
+                                        ProgramState.RUNNING if busy else ProgramState.PENDING)),
+                                    queue_size=len(self.queue),
+                                    current_task_start=self.current_task['time'] if busy else '',
+                                    args={},
+                                    no_hb_task=self.task_command_received,
+                                    interval=self.heartbeat_interval.current,
+                                    cpu_usage=100.0 if busy else 1.0,
+                                    mem_usage=50.0)
+        self._receive(self.sim.taskpool.process_heartbeat(heartbeat, self.source))
+
+    def _receive(self, packet):
+        command = packet.get('command')
+        if command == 'task':
+            self.queue.append(packet)
+            self.task_command_received = True
+            self._process()
+        elif command == 'done':
+            self.task_command_received = False
+        elif command == 'cancel':
+            cancelled = [task for task in self.queue if task['task'] in packet['tasks']]
+            for task in cancelled:
+                self.queue.remove(task)
+            if self.current_task and self.current_task['task'] in packet['tasks']:
+                cancelled.append(self.current_task)  # Interrupted like WorkerCore does.
+                self.current_task = None
+            if cancelled:
+                self._receive(self.sim.taskpool.process_command(
+                    CommandPacket(command='cancelled', instance_id=self.instance_id,
+                                  tasks=[task['task'] for task in cancelled]), self.source))
+                self._process()
+        elif packet.get('heartbeat_settings'):
+            self.heartbeat_interval.tune(packet['heartbeat_settings'])
+
+    def _process(self):
+        if self.current_task or not self.queue:
+            return
+        self.current_task = self.queue.popleft()
+        self.started = self.sim.now
+        self.sim.schedule(self.sim.service_time(), self._finish, self.current_task)
+
+    def _finish(self, task):
+        if not self.alive or self.current_task is not task:
+            return
+        message = CommandPacket(command='done',
+                                argmax=0,
+                                instance_id=self.instance_id,
+                                task=task['task'],
+                                task_start=task['time'],
+                                time_to_download=0.0,
+                                run_time_task=round(self.sim.now - self.started, 5))
+        self.current_task = None
+        self._receive(self.sim.taskpool.process_command(message, self.source))
+        self._process()
+
+
+class SimulatedInstanceManager:
+    """
+    Instance Manager deciding on the workers with the real TimeWindow and scaling policy. Starting a
+    worker takes a sample of the boot time distribution.
+    """
+
+    def __init__(self, simulation, workers):
+        self.sim = simulation
+        self.instances = Instances()
+        self.timewindow = TimeWindow()
+        self.heartbeat_settings = {}
+        self.warm_pool = set()
+        self.node_manager_running = False
+        self.workers = 0
+        self.signal_times = []  # Seconds since the start at which workers were started or stopped.
+        self._activations = {}
+        self._workers = {}  # Instance id: SimulatedWorker of the started workers.
+        self.instances.set_state(NODE_MANAGER, 'node_manager', InstanceState(InstanceState.RUNNING))
+        self.instances.set_ip(NODE_MANAGER, NODE_MANAGER_IP)
+        for index in range(workers):
+            self.instances.set_state('worker-{}'.format(index), 'worker',
+                                     InstanceState(InstanceState.STOPPED))
+
+    def run(self):
+        """
+        Take a scaling decision, as in the loop of NodeScheduler.run.
+        """
+        workers = self.instances.get_all('worker', [InstanceState.PENDING, InstanceState.RUNNING])
+        max_workers = len(self.instances.get_nodes('worker'))
+        response = self.timewindow.get_action(current_workers=workers, max_workers=max_workers)
+        if 'create' in response:
+            self.start_workers(response['create'])
+        elif 'kill' in response:
+            self.stop_workers(response['kill'])
+        self.sim.schedule(config.SERVER_SLEEP_TIME, self.run)
+
+    def start_workers(self, count):
+        workers = self.instances.get_all('worker', [InstanceState.STOPPED])[:count]
+        for worker in workers:
+            self.instances.set_state(worker, 'worker', InstanceState(InstanceState.PENDING))
+            self.instances.charge_time[worker] = self.sim.now
+            self._activations[worker] = self.sim.now
+            self.sim.schedule(self.sim.boot_time(), self._booted, worker, self.sim.now)
+        if workers:
+            self.workers += len(workers)
+            self.signal_times.append(int(self.sim.elapsed()))
+            log_metric({'workers': self.workers})
+
+    def _booted(self, worker, start_time):
+        if not self.instances.is_state(worker, 'worker', InstanceState.PENDING):
+            return  # Stopped while booting.
+        self.timewindow.policy.observe_boot(self.sim.now - start_time)
+        self.instances.set_state(worker, 'worker', InstanceState(InstanceState.RUNNING))
+        self._workers[worker] = SimulatedWorker(self.sim, worker)
+        self._workers[worker].start()
+
+    def stop_workers(self, workers):
+        for worker in workers:
+            self.instances.set_state(worker, 'worker', InstanceState(InstanceState.STOPPED))
+            self.instances.clear_time(worker)
+            self._activations.pop(worker, None)
+            if worker in self._workers:
+                self._workers.pop(worker).stop()
+            self.charge(worker)
+        if workers:
+            self.workers -= len(workers)
+            self.signal_times.append(int(self.sim.elapsed()))
+            log_metric({'workers': self.workers})
+
+    def charge(self, instance_id):
+        if instance_id in self.instances.charge_time:
+            log_metric({'charged_time': {
+                'instance_id': instance_id,
+                'charged': self.sim.now - self.instances.charge_time.pop(instance_id)}})
+
+    def record_activations(self, worker_allocation):
+        for worker in [worker for worker in self._activations if worker in worker_allocation]:
+            log_metric({'worker_activation': {'instance_id': worker, 'mode': 'cold',
+                                              'latency': self.sim.now - self._activations.pop(
+                                                  worker)}})
+
+
+class Simulation:
+    """
+    Replays a scenario CSV (IP, Input, Time) on a virtual clock and collects the logged metrics.
+    """
+
+    def __init__(self, scenario, workers=10, service_time='exp:1.0', boot_time='uniform:40,80',
+                 seed=0, start_time=1.6e9):
+        """
+        :param scenario: Path of the scenario CSV or a DataFrame with the Time, Input, IP columns.
+        :param workers: Number of worker instances that can be started.
+        :param service_time: Distribution of the run time of a task, see parse_distribution.
+        :param boot_time: Distribution of the time until a started worker sends heartbeats.
+        :param seed: Seed of the random generator.
+        :param start_time: Virtual time at the start of the simulation.
+        """
+        self.scenario = pd.read_csv(scenario) if isinstance(scenario, str) else scenario
+        rng = random.Random(seed)
+        self.service_time = parse_distribution(service_time, rng)
+        self.boot_time = parse_distribution(boot_time, rng)
+        self.start_time = start_time
+        self.now = start_time
+        self._events = []  # (time, sequence, function, arguments).
+        self._sequence = itertools.count()
+        self.samples = []  # (second, tasks, workers running) for experiment.worker_plot.
+        self.metrics = []
+        self._remaining = len(self.scenario)  # Tasks of the scenario that did not arrive yet.
+
+        self.taskpool = SimulatedTaskPool(NODE_MANAGER, host=NODE_MANAGER_IP, port=0,
+                                          resource_manager=None)
+        self.im = SimulatedInstanceManager(self, workers)
+        link = NodeManagerLink(NodeMonitor(self.im),
+                               TaskPoolMonitor(self.taskpool, host=None, port=0))
+        self.taskpool.add_listener(link)
+
+    def schedule(self, delay, function, *args):
+        heapq.heappush(self._events, (self.now + delay, next(self._sequence), function, args))
+
+    def elapsed(self):
+        return self.now - self.start_time
+
+    def run(self, duration=None, quiet=True):
+        """
+        Run the simulation until all tasks are done or the duration has passed.
+        :param duration: Maximum number of simulated seconds.
+        :param quiet: Boolean indicating if the output of the application is suppressed.
+        :return: List of the logged metrics.
+        """
+        collector = MetricCollector()
+        logger = logging.getLogger()  # Also receives the metrics, whatever the level of the log.
+        logger.addHandler(collector)
+        clock.set_clock(lambda: self.now)
+        try:
+            with redirect_stdout(io.StringIO() if quiet else sys.stdout):
+                self._start()
+                while self._events:
+                    event_time, _, function, args = heapq.heappop(self._events)
+                    if duration is not None and event_time - self.start_time > duration:
+                        break
+                    self.now = event_time
+                    function(*args)
+                    if self._finished():
+                        break
+                for instance_id in list(self.im.instances.charge_time):
+                    self.im.charge(instance_id)
+                flush_logs()  # Written while the output is still redirected.
+        finally:
+            clock.set_clock()
+            logger.removeHandler(collector)
+        self.metrics = collector.metrics
+        return self.metrics
+
+    def _start(self):
+        for row in self.scenario.itertuples():
+            self.schedule(row.Time, self._arrive, TaskPool.translate(row.Input), row.IP)
+        self.im.instances.charge_time = {NODE_MANAGER: self.now}  # The IM itself is not charged.
+        self.schedule(0, self._run_task_pool)
+        self.schedule(0, self.im.run)
+        self.schedule(0, self._sample)
+
+    def _arrive(self, task_data, source):
+        if self.taskpool.update_overload():
+            # Slow down ingestion until recovered, as in create_full_taskpool.
+            self.schedule(config.OVERLOAD_RETRY_AFTER, self._arrive, task_data, source)
+            return
+        self._remaining -= 1
+        self.taskpool.add_task(task_data, source=source)  # Held back tasks are added later.
+
+    def _run_task_pool(self):
+        """
+        Run an iteration of TaskPool.run_task_pool.
+        """
+        taskpool = self.taskpool
+        taskpool.release_backlog()
+        taskpool.update_overload()
+        if taskpool.heartbeat_interval.due(taskpool.queue_depth()):
+            taskpool.generate_heartbeat()
+        taskpool.assign_tasks()
+        taskpool.speculate_stragglers()
+        self.schedule(min(config.HEART_BEAT_INTERVAL_NODE_MANAGER,
+                          taskpool.heartbeat_interval.min_interval), self._run_task_pool)
+
+    def _sample(self):
+        running = self.im.instances.get_all('worker', [InstanceState.RUNNING])
+        self.samples.append((int(self.elapsed()), self.taskpool.queue_depth(), len(running)))
+        self.schedule(1, self._sample)
+
+    def _finished(self):
+        return not self._remaining and not self.taskpool.queue_depth() and \
+            not self.taskpool.limiter.backlog_depth()
+
+    def write_log(self, path):
+        """
+        Write the metrics as a compressed log, which can be read by experiment.Parser.parse.
+        """
+        content = ''.join('INFO:root:METRIC{}\n'.format(json.dumps(metric))
+                          for metric in self.metrics).encode('utf-8')
+        with tarfile.open(path, 'w:gz') as tar:
+            member = tarfile.TarInfo('simulation.log')
+            member.size = len(content)
+            tar.addfile(member, io.BytesIO(content))
+
+    def write_results(self, path='results.csv', signal_path='signal_times.txt'):
+        """
+        Write the tasks and running workers per second, and the times at which workers were
+        started or stopped, as read by experiment.worker_plot.
+        """
+        pd.DataFrame(self.samples, columns=['time', 'tasks', 'workers']).to_csv(path, index=False)
+        with open(signal_path, 'w') as file:
+            file.write(str(self.im.signal_times))
+
+    def summary(self):
+        """
+        Get the main results of the simulation.
+        """
+        finished = [metric['task_finished'] for metric in self.metrics if 'task_finished' in metric]
+        charged = sum(metric['charged_time']['charged'] for metric in self.metrics
+                      if 'charged_time' in metric)
+        return {'simulated_time': round(self.elapsed(), 2),
+                'tasks_finished': len(finished),
+                'tasks': len(self.scenario),
+                'mean_duration': round(sum(task['duration'] for task in finished) /
+                                       len(finished), 2) if finished else None,
+                'max_workers': max((workers for _, _, workers in self.samples), default=0),
+                'charged_time': round(charged, 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--scenario', default=os.path.join('src', 'data',
+                                                           'elasticity_scenario.csv'))
+    parser.add_argument('--workers', type=int, default=10)
+    parser.add_argument('--service-time', default='exp:1.0')
+    parser.add_argument('--boot-time', default='uniform:40,80')
+    parser.add_argument('--policy', default=None, help="Scaling policy, see SCALING_POLICY.")
+    parser.add_argument('--duration', type=float, default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--log', default='simulation.tgz')
+    parser.add_argument('--results', default='results.csv')
+    parser.add_argument('--signals', default='signal_times.txt')
+    args = parser.parse_args()
+
+    if args.policy:
+        config.SCALING_POLICY = args.policy
+    simulation = Simulation(args.scenario, workers=args.workers, service_time=args.service_time,
+                            boot_time=args.boot_time, seed=args.seed)
+    simulation.run(duration=args.duration)
+    simulation.write_log(args.log)
+    simulation.write_results(args.results, args.signals)
+    print(simulation.summary())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,39 @@
+"""
+Aggregates the task traces exported by the node managers (see TRACE_FILE) into a latency
+histogram and percentiles per stage.
+
+Example: python src/experiment/traces.py /tmp/traces.jsonl --json stages.json
+"""
+import argparse
+import json
+import sys
+
+sys.path.append('./src')
+
+from aws.nodemanager.tracing import read_traces, stage_histograms
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('paths', nargs='+', help="Trace files, e.g., one per node manager.")
+    parser.add_argument('--json', default=None, help="File to write the histograms to.")
+    args = parser.parse_args()
+
+    traces = [trace for path in args.paths for trace in read_traces(path)]
+    histograms = stage_histograms(traces)
+    print('{} traces'.format(len(traces)))
+    print('{:<10} {:>7} {:>10} {:>10} {:>10} {:>10}   histogram (<= {} s)'.format(
+        'stage', 'count', 'mean', 'p50', 'p90', 'p99',
+        ', '.join('{:g}'.format(bound) for bound in next(iter(histograms.values()))['bins'])
+        if histograms else ''))
+    for stage, result in histograms.items():
+        print('{:<10} {:>7} {:>10.4f} {:>10.4f} {:>10.4f} {:>10.4f}   {}'.format(
+            stage, result['count'], result['mean'], result['p50'], result['p90'], result['p99'],
+            result['histogram']))
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(histograms, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
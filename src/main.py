@@ -4,9 +4,12 @@ Main function to be called when starting the AWS main instance.
 import sys
 sys.path.append('./src')
 
+from ec2_metadata import ec2_metadata
+
 import aws.instancemanager.instancemanager as im
 import aws.nodemanager.nodemanager as nm
 import aws.nodeworker.nodeworker as nw
+import aws.utils.config as config
 from aws.resourcemanager.resourcemanager import log_info, log_error
 
 
@@ -34,6 +37,9 @@ def main():
         log_info('Initiating bootcall Instance Manager..')
         im.start_instance(debug=debug, git_pull=branch)
     elif len(args) >= 4:
+        if args[3] == config.OWN_INSTANCE_ID:
+            # A start command sent to many instances at once lets each instance look up its own id.
+            args[3] = config.LOCAL_INSTANCE_ID if config.LOCAL_CLOUD else ec2_metadata.instance_id
         if args[1] == 'node_manager':
             # Example: python src/main.py worker [IM ip] [node_manager_id]
             print('[INFO] Initiating bootcall Node Manager..')
@@ -0,0 +1,92 @@
+import unittest
+
+from aws.instancemanager.autoscaling import HoltForecast, PredictivePolicy, ThresholdPolicy, \
+    create_policy
+from aws.utils import config
+
+
+class Window:
+
+    def __init__(self, total_tasks, worker_allocation, overloaded=False):
+        self.mean_total_tasks = total_tasks
+        self.worker_allocation = worker_allocation
+        self.overloaded = overloaded
+
+    def mean(self):
+        return sum(self.mean_total_tasks) / max(1, len(self.worker_allocation))
+
+
+def heartbeat(time, arrived, waiting=0, service_time=1.0, cpu=50):
+    return {'instance_id': 'nm', 'time': time, 'tasks_arrived': arrived, 'tasks_waiting': waiting,
+            'service_time': service_time, 'worker_health': {'w1': [0, 0, cpu, 0, 1]}}
+
+
+class TestThresholdPolicy(unittest.TestCase):
+
+    def test_create_without_workers(self):
+        action = ThresholdPolicy().get_action(Window([3], {}), [], 4)
+        self.assertEqual({'create': 1}, action)
+
+    def test_kill_least_loaded(self):
+        window = Window([0], {'w1': 0, 'w2': 0, 'w3': 0})
+        window.worker_allocation = {'w1': 2, 'w2': 0, 'w3': 1}
+        window.mean_total_tasks = [1.5]
+        window.mean = lambda: 0.5
+        action = ThresholdPolicy().get_action(window, ['w1', 'w2', 'w3'], 4)
+        self.assertEqual({'kill': ['w2']}, action)
+
+
+class TestHoltForecast(unittest.TestCase):
+
+    def test_trend(self):
+        forecast = HoltForecast(0.5, 0.5)
+        for second in range(20):
+            forecast.update(2.0 * second, second)
+        self.assertGreater(forecast.trend, 1)
+        self.assertGreater(forecast.forecast(10), forecast.forecast(0))
+
+
+class TestPredictivePolicy(unittest.TestCase):
+
+    def setUp(self):
+        self.policy = create_policy('predictive')
+        self.window = Window([0], {})
+
+    def test_scale_out_in_one_step(self):
+        self.policy.observe(heartbeat(0, 0))
+        self.policy.observe(heartbeat(10, 400, waiting=300))  # 40 tasks/s of 1 second each.
+        action = self.policy.get_action(self.window, ['w1'], 100)
+        self.assertGreater(action['create'], 40)
+
+    def test_capped_by_max_workers(self):
+        self.policy.observe(heartbeat(0, 0))
+        self.policy.observe(heartbeat(10, 400))
+        self.assertEqual({'create': 3}, self.policy.get_action(self.window, ['w1'], 4))
+
+    def test_scale_in_after_cooldown(self):
+        workers = ['w1', 'w2', 'w3']
+        self.policy.observe(heartbeat(0, 0))
+        self.policy.observe(heartbeat(10, 10))
+        self.policy._last_scale_out = 0
+        self.window.worker_allocation = {'w1': 1, 'w2': 0, 'w3': 2}
+        self.assertEqual({'kill': ['w2']}, self.policy.get_action(self.window, workers, 4))
+
+        self.policy.cpu_usage = config.SCALING_CPU_HIGH + 1
+        self.assertEqual({}, self.policy.get_action(self.window, workers, 4))
+
+    def test_no_scale_in_during_cooldown(self):
+        self.policy.observe(heartbeat(0, 0))
+        self.policy.observe(heartbeat(10, 10))
+        self.assertEqual({'create': 1}, self.policy.get_action(self.window, ['w1'], 100))
+        self.policy.observe(heartbeat(20, 10))
+        self.assertEqual({}, self.policy.get_action(self.window, ['w1', 'w2', 'w3'], 100))
+
+    def test_unknown_policy(self):
+        self.assertIsInstance(create_policy('threshold'), ThresholdPolicy)
+        self.assertIsInstance(create_policy(), PredictivePolicy)
+        with self.assertRaises(ValueError):
+            create_policy('unknown')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,37 @@
+import unittest
+
+from experiment.benchmark import BENCHMARKS, compare, measure, run
+
+
+class TestBenchmark(unittest.TestCase):
+
+    def test_run(self):
+        results = run('taskpool', min_time=0.001, sizes=[(2, 8)])
+        self.assertEqual({'taskpool.assign_tasks[workers=2,tasks=8]',
+                          'taskpool.steal_task[workers=2,tasks=8]',
+                          'taskpool.generate_heartbeat[workers=2,tasks=8]'}, set(results))
+        for result in results.values():
+            self.assertGreater(result['ops_per_sec'], 0)
+            self.assertGreaterEqual(result['alloc_bytes'], result['retained_bytes'])
+
+    def test_setups(self):
+        # Every benchmark can run repeatedly (e.g., the benchmarks that change state undo it).
+        for name, setup in BENCHMARKS:
+            if name.startswith('botoutils'):
+                continue  # Reads its canned response relative to the root of the repository.
+            op = setup(4, 16)
+            for _ in range(3):
+                op()
+
+    def test_measure_allocations(self):
+        kept = []
+        result = measure(lambda: kept.append(bytearray(10000)), min_time=0.001, samples=5)
+        self.assertGreaterEqual(result['retained_bytes'], 10000)
+
+    def test_compare(self):
+        baselines = {'a': {'ops_per_sec': 100, 'alloc_bytes': 1000},
+                     'b': {'ops_per_sec': 100, 'alloc_bytes': 1000}}
+        results = {'a': {'ops_per_sec': 80, 'alloc_bytes': 1000},
+                   'b': {'ops_per_sec': 100, 'alloc_bytes': 1300},
+                   'c': {'ops_per_sec': 1, 'alloc_bytes': 1}}
+        self.assertEqual(['b'], compare(results, baselines, tolerance=0.25))
@@ -1,6 +1,9 @@
 import json
 import unittest
+from unittest import mock
+
 from aws.utils.botoutils import BotoInstanceReader
+from aws.utils.localcloud import LocalEc2
 
 
 class TestBotoIntanceReader(unittest.TestCase):
@@ -66,5 +69,44 @@ class TestBotoIntanceReader(unittest.TestCase):
             print('Workers: {}'.format(boto_instances))
 
 
+class TestInventory(unittest.TestCase):
+
+    def setUp(self):
+        self.ec2 = LocalEc2()
+        self.manager = self.ec2.add_instances('Instance Manager', state='running')[0]
+        self.node_manager = self.ec2.add_instances('Node Manager')[0]
+        self.workers = self.ec2.add_instances('Worker', count=3)  # A single reservation.
+        self.boto = BotoInstanceReader(ec2=self.ec2, ssm=object())
+
+    def test_all_instances_of_reservation(self):
+        self.assertEqual(self.workers, self.boto.read_ids(self.manager, filters=['is_worker']))
+
+    def test_pagination_and_tag_filter(self):
+        for _ in range(5):
+            self.ec2.add_instances('Worker')
+        self.ec2.add_instances('Other')
+        with mock.patch('aws.utils.config.EC2_PAGE_SIZE', 2):
+            instances = self.boto.read(self.manager)
+        self.assertEqual(9, len(instances))
+        self.assertEqual(4, self.ec2.calls.count('describe_instances'))  # 7 reservations.
+
+    def test_cached_read(self):
+        self.boto.read(self.manager)
+        self.boto.start_instances(self.workers[:1])
+        stopped = self.boto.read_ids(self.manager, filters=['is_worker', 'is_stopped'],
+                                     cached=True)
+        self.assertEqual(self.workers[1:], stopped)
+        self.assertEqual(1, self.ec2.calls.count('describe_instances'))
+        self.boto.stop_instances(self.workers[:1])
+        self.assertEqual('stopping', str(self.boto.inventory[self.workers[0]].state))
+
+    def test_stale_cache(self):
+        self.assertEqual(3, len(self.boto.read_ids(self.manager, filters=['is_worker'],
+                                                   cached=True)))
+        with mock.patch('aws.utils.config.EC2_INVENTORY_MAX_AGE', -1):
+            self.boto.read_cached(self.manager)
+        self.assertEqual(2, self.ec2.calls.count('describe_instances'))
+
+
 if __name__ == '__main__':
     unittest.main()
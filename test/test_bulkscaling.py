@@ -0,0 +1,216 @@
+import asyncio
+import time
+import unittest
+from unittest import mock
+
+import aws.instancemanager.instancemanager as im
+from aws.nodemanager.nodemanager import TaskPoolMonitor
+from aws.utils import clock, config
+from aws.utils.botoutils import BotoInstanceReader
+from aws.utils.heartbeat import AdaptiveInterval
+from aws.utils.localcloud import LocalEc2, LocalSsm
+from aws.utils.packets import HeartBeatPacket
+from aws.utils.state import InstanceState
+from experiment.simulator import NodeManagerLink, SimulatedTaskPool
+
+
+class SchedulerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.ec2 = LocalEc2()
+        self.ssm = LocalSsm(self.ec2)
+        self.node_managers = self.ec2.add_instances('Node Manager', count=2, state='running')
+        self.workers = self.ec2.add_instances('Worker', count=20)
+        reader = BotoInstanceReader(ec2=self.ec2, ssm=self.ssm)
+        with mock.patch.object(im, 'ec2_metadata'), \
+                mock.patch.object(im, 'BotoInstanceReader', return_value=reader):
+            self.scheduler = im.NodeScheduler(debug=False, git_pull=None, account_id='account')
+        self.wait(self.scheduler.update_instances(check=False))
+        del self.ec2.calls[:]
+
+    def tearDown(self):
+        self.scheduler.control_plane.close()
+        self.loop.close()
+
+    def wait(self, coroutine):
+        return self.loop.run_until_complete(coroutine)
+
+
+
+class TestBulkScaling(SchedulerTestCase):
+
+    def test_start_workers_single_call(self):
+        started = self.wait(self.scheduler.start_workers(18))
+        self.assertEqual(18, len(started))
+        self.assertEqual(['start_instances'], self.ec2.calls)
+        self.assertEqual(18, self.scheduler.workers)
+        for worker in started:
+            self.assertIn(worker, self.scheduler.instances.charge_time)
+            self.assertTrue(self.scheduler.instances.is_state(worker, 'worker',
+                                                              InstanceState.PENDING))
+
+        self.wait(self.scheduler.start_workers(5))
+        self.assertEqual(20, self.scheduler.workers)  # Only 2 stopped workers were left.
+
+    def test_start_commands_per_node_manager(self):
+        started = self.wait(self.scheduler.start_workers(20))
+        self.ec2.describe_instances()  # The workers are running now.
+        self.wait(self.scheduler._send_start_commands('worker', started))
+        self.assertEqual(2, len(self.ssm.calls))  # One command per node manager.
+        targets = [instance_id for instance_ids, _ in self.ssm.commands.values()
+                   for instance_id in instance_ids]
+        self.assertCountEqual(started, targets)
+        for _, commands in self.ssm.commands.values():
+            self.assertIn(' {} '.format(config.OWN_INSTANCE_ID), commands[0])
+
+    def test_start_commands_not_running(self):
+        started = self.wait(self.scheduler.start_workers(4))
+        self.ec2.describe_instances()
+        self.wait(self.scheduler._kill_instance(started[:1], ['worker']))
+        self.wait(self.scheduler._send_start_commands('worker', started))
+        targets = [instance_id for instance_ids, _ in self.ssm.commands.values()
+                   for instance_id in instance_ids]
+        self.assertCountEqual(started[1:], targets)
+
+    def test_kill_workers_single_call(self):
+        started = self.wait(self.scheduler.start_workers(10))
+        self.wait(self.scheduler._kill_instance(started, ['worker'] * len(started)))
+        self.assertEqual(['start_instances', 'stop_instances'], self.ec2.calls)
+        self.assertEqual(0, self.scheduler.workers)
+        self.assertFalse(set(started) & set(self.scheduler.instances.charge_time))
+
+
+class TestWarmPool(SchedulerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        config.WARM_POOL_SIZE, self.pool_size = 3, config.WARM_POOL_SIZE
+
+    def tearDown(self):
+        config.WARM_POOL_SIZE = self.pool_size
+        super().tearDown()
+
+    def test_fill_and_activate(self):
+        self.wait(self.scheduler.maintain_warm_pool())
+        parked = set(self.scheduler.warm_pool)
+        self.assertEqual(3, len(parked))
+
+        response = im.NodeMonitor(self.scheduler)._generate_nm_response(self.node_managers[0])
+        self.assertFalse(parked & set(response['workers_pending']))
+
+        self.wait(self.scheduler.scale_out(5))
+        self.assertFalse(self.scheduler.warm_pool)
+        self.assertEqual(5, self.scheduler.workers)  # 3 activated and 2 started.
+        self.assertEqual(['start_instances', 'start_instances'], self.ec2.calls)
+
+        self.wait(self.scheduler.maintain_warm_pool())
+        self.assertEqual(3, len(self.scheduler.warm_pool))
+
+    def test_activation_latency(self):
+        self.wait(self.scheduler.maintain_warm_pool())
+        warm = self.scheduler.activate_workers(1)[0]
+        cold = self.wait(self.scheduler.start_workers(1))[0]
+        with mock.patch.object(im, 'log_metric') as log_metric:
+            self.scheduler.record_activations({warm: 1, cold: 2})
+        modes = {call[0][0]['worker_activation']['instance_id']:
+                 call[0][0]['worker_activation']['mode'] for call in log_metric.call_args_list}
+        self.assertEqual({warm: 'warm', cold: 'cold'}, modes)
+        self.assertFalse(self.scheduler._activations)
+
+    def test_activation_of_idle_worker(self):
+        now = [time.time()]
+        clock.set_clock(lambda: now[0])
+        self.addCleanup(clock.set_clock, time.time)
+        node_manager = self.node_managers[0]
+        self.scheduler.instances.set_state(self.node_managers[1], 'node_manager',
+                                           InstanceState(InstanceState.STOPPED))
+        self.wait(self.scheduler.maintain_warm_pool())
+        intervals = {}
+        for worker in self.scheduler.warm_pool:
+            self.scheduler.instances.set_state(worker, 'worker',
+                                               InstanceState(InstanceState.RUNNING))
+            intervals[worker] = AdaptiveInterval('worker', config.HEART_BEAT_INTERVAL_WORKER)
+        taskpool = SimulatedTaskPool(node_manager, host='127.0.0.1', port=0,
+                                     resource_manager=None)
+        taskpool.add_listener(NodeManagerLink(im.NodeMonitor(self.scheduler),
+                                              TaskPoolMonitor(taskpool, host=None, port=0)))
+        started = {}
+
+        def tick():
+            # An iteration of the node manager and of the heartbeats of the (idle) workers.
+            now[0] += 0.5
+            if taskpool.heartbeat_interval.due(taskpool.queue_depth()):
+                taskpool.generate_heartbeat()
+            taskpool.assign_tasks()
+            for worker, interval in intervals.items():
+                load = 1 if worker in started else 0
+                if interval.due(load, idle=load == 0):
+                    heartbeat = HeartBeatPacket(instance_id=worker, instance_type='worker',
+                                                instance_state='running', cpu_usage=1.0,
+                                                mem_usage=2.0, no_hb_task=False)
+                    if taskpool.process_heartbeat(heartbeat, None).get('command') == 'task':
+                        started.setdefault(worker, now[0])
+
+        for _ in range(120):  # The workers are parked for a minute.
+            tick()
+        activated = self.scheduler.activate_workers(1)[0]
+        activation_time = now[0]
+        for index in range(5):
+            taskpool.add_task('task {}'.format(index))
+        for _ in range(60):
+            tick()
+        self.assertEqual([activated], list(started))
+        self.assertLessEqual(started[activated] - activation_time,
+                             config.HEARTBEAT_MIN_INTERVAL['node_manager'] +
+                             config.HEARTBEAT_MIN_INTERVAL['worker'] + 1)
+
+
+class TestNodeManagerAssignment(SchedulerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.started = self.wait(self.scheduler.start_workers(20))
+        self.ec2.describe_instances()
+        self.monitor = im.NodeMonitor(self.scheduler)
+
+    def worker_heartbeat(self, worker):
+        heartbeat = HeartBeatPacket(instance_id=worker, instance_type='worker',
+                                    instance_state='running', cpu_usage=1.0, mem_usage=2.0)
+        return self.monitor.process_heartbeat(heartbeat, None)
+
+    def test_workers_divided(self):
+        instances = self.scheduler.instances
+        workers = [instances.get_workers_of(node_manager, [InstanceState.PENDING])
+                   for node_manager in self.node_managers]
+        self.assertTrue(all(workers))
+        self.assertCountEqual(self.started, workers[0] + workers[1])
+        for worker in workers[1]:
+            self.assertEqual(instances.get_ip(self.node_managers[1]),
+                             self.worker_heartbeat(worker)['node_manager'])
+
+    def test_failover(self):
+        instances = self.scheduler.instances
+        moved = instances.get_workers_of(self.node_managers[0], [InstanceState.PENDING])
+        instances.set_state(self.node_managers[0], 'node_manager',
+                            InstanceState(InstanceState.STOPPED))
+        self.assertCountEqual(self.started, instances.get_workers_of(
+            self.node_managers[1], [InstanceState.PENDING, InstanceState.RUNNING]))
+        for worker in moved:  # The workers are told to connect to the other node manager.
+            self.assertEqual(instances.get_ip(self.node_managers[1]),
+                             self.worker_heartbeat(worker)['node_manager'])
+
+    def test_no_node_manager_running(self):
+        for node_manager in self.node_managers:
+            self.scheduler.instances.set_state(node_manager, 'node_manager',
+                                               InstanceState(InstanceState.STOPPED))
+        self.wait(self.scheduler._send_start_commands('worker', self.started))
+        self.assertFalse(self.ssm.calls)
+        self.assertNotIn('node_manager', self.worker_heartbeat(self.started[0]))
+        for worker in self.started:  # Checked again later.
+            self.assertIn(worker, self.scheduler.instances.deadlines)
+
+
+if __name__ == '__main__':
+    unittest.main()
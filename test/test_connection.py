@@ -0,0 +1,273 @@
+import asyncio
+import logging
+import unittest
+
+from aws.resourcemanager.resourcemanager import LogSampler
+from aws.utils import config
+from aws.utils.connection import OutboundQueue, OutboundQueueFull, HeartBeatEncoders, \
+    MultiConnectionClient, MultiConnectionServer, encode_batch, decode_batch, submit
+from aws.utils.packets import CommandPacket, HeartBeatPacket, HeartBeatDeltaPacket
+from experiment.simulator import SimulatedTaskPool
+
+
+def heartbeat(instance_id, **kwargs):
+    return HeartBeatPacket(instance_id=instance_id, instance_state='running',
+                           instance_type='worker', cpu_usage=1.0, mem_usage=2.0, **kwargs)
+
+
+class TestOutboundQueue(unittest.TestCase):
+
+    def test_commands_before_heartbeats(self):
+        queue = OutboundQueue()
+        queue.append(heartbeat('i-1'))
+        queue.append(CommandPacket(command='done', task='a'))
+        queue.append(CommandPacket(command='done', task='b'))
+        packets = queue.drain()
+        self.assertEqual(['a', 'b'], [packet['task'] for packet in packets[:2]])
+        self.assertIsInstance(packets[2], HeartBeatPacket)
+        self.assertFalse(queue)
+
+    def test_latest_heartbeat_per_stream(self):
+        queue = OutboundQueue()
+        for idx in range(5):
+            queue.append(heartbeat('i-1', queue_size=idx))
+        queue.append(heartbeat('i-2', queue_size=0))
+        self.assertEqual(2, len(queue))
+        self.assertEqual(4, queue.replaced)
+        self.assertEqual([4, 0], [packet['queue_size'] for packet in queue.drain()])
+
+    def test_capacity(self):
+        queue = OutboundQueue(capacity=2)
+        queue.append(CommandPacket(command='done', task='a'))
+        queue.append(CommandPacket(command='done', task='b'))
+        with self.assertRaises(OutboundQueueFull):
+            queue.append(CommandPacket(command='done', task='c'))
+        queue.append(heartbeat('i-1'))  # Heartbeats replace each other, so are never refused.
+        self.assertEqual(['a', 'b'], [packet['task'] for packet in queue.drain()[:2]])
+        queue.append(CommandPacket(command='done', task='c'))
+        self.assertEqual(1, len(queue))
+
+    def test_drain_max_bytes(self):
+        queue = OutboundQueue()
+        for index in range(10):
+            queue.append(CommandPacket(command='done', task=str(index) * 100))
+        queue.append(heartbeat('i-1'))
+        first = queue.drain(max_bytes=1000)
+        self.assertLessEqual(len(encode_batch(first)), 1000)
+        self.assertLess(len(first), 10)
+        self.assertEqual([str(index) * 100 for index in range(len(first))],
+                         [packet['task'] for packet in first])
+
+        queue.requeue(first)  # E.g., the connection failed.
+        queue.append(heartbeat('i-1', queue_size=1))
+        packets = queue.drain()
+        self.assertEqual([str(index) * 100 for index in range(10)],
+                         [packet['task'] for packet in packets[:10]])
+        self.assertEqual(1, packets[10]['queue_size'])  # The newer heartbeat is kept.
+        self.assertEqual(11, len(packets))
+        self.assertEqual(1, len(queue.drain(max_bytes=1) or [None]))  # At least one packet.
+
+
+class TestBatch(unittest.TestCase):
+
+    def test_roundtrip(self):
+        packets = [CommandPacket(command='done', task='a\nb'), heartbeat('i-1')]
+        data = encode_batch(packets)
+        self.assertEqual(1, data.count(b'\n'))
+        decoded = decode_batch(data)
+        self.assertEqual(packets, decoded)
+        self.assertIsInstance(decoded[1], HeartBeatPacket)
+
+    def test_single_packet(self):
+        self.assertEqual(1, len(decode_batch(b'{"packet_type": "Command", "command": "done", '
+                                             b'"time": 1}')))
+
+    def test_encoders_per_stream(self):
+        encoders = HeartBeatEncoders()
+        encoders.encode(heartbeat('i-1'))
+        encoders.encode(heartbeat('i-2'))
+        encoders.acknowledge()
+        self.assertIsInstance(encoders.encode(heartbeat('i-1')), HeartBeatDeltaPacket)
+        encoders.reset('i-2')
+        self.assertIsInstance(encoders.encode(heartbeat('i-2')), HeartBeatPacket)
+
+
+class TestSubmit(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.sleep_time = config.SERVER_SLEEP_TIME
+        config.SERVER_SLEEP_TIME = 0
+
+    def tearDown(self):
+        config.SERVER_SLEEP_TIME = self.sleep_time
+        self.loop.close()
+
+    def test_interactive_submit(self):
+        taskpool = SimulatedTaskPool('node_manager', host='127.0.0.1', port=0,
+                                     resource_manager=None)
+
+        async def run():
+            server = await asyncio.start_server(taskpool.run, '127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+            try:
+                return await submit('127.0.0.1', 'some "text"', port=port)
+            finally:
+                await asyncio.sleep(0.05)  # The server closes the connection after the EOF.
+                server.close()
+                await server.wait_closed()
+
+        response = self.loop.run_until_complete(run())
+        self.assertEqual('submitted', response['command'])
+        self.assertEqual('interactive', taskpool.tasks.priority(response['task']))
+        self.assertEqual({'interactive': 1, 'bulk': 0}, taskpool.tasks.depth())
+
+
+class Server(MultiConnectionServer):
+
+    def __init__(self, host, port=0):
+        super().__init__(host, port)
+        self.received = []
+
+    def process_heartbeat(self, heartbeat, source):
+        self.received.append(heartbeat['instance_id'])
+        return heartbeat
+
+    def process_command(self, command, source):
+        self.received.append(command['task'])
+        return command
+
+
+class Client(MultiConnectionClient):
+
+    def process_command(self, command):
+        pass
+
+
+class TestReconnect(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.sleep_time = config.SERVER_SLEEP_TIME
+        config.SERVER_SLEEP_TIME = 0
+
+    def tearDown(self):
+        config.SERVER_SLEEP_TIME = self.sleep_time
+        self.loop.close()
+
+    def test_reconnect_to_other_host(self):
+        servers = [Server('127.0.0.1'), Server('127.0.0.2')]
+
+        async def run():
+            first = await asyncio.start_server(servers[0].run, '127.0.0.1', 0)
+            port = first.sockets[0].getsockname()[1]
+            second = await asyncio.start_server(servers[1].run, '127.0.0.2', port)
+            client = Client('127.0.0.1', port, sleep_time=0.01)
+            task = asyncio.ensure_future(client.run())
+            client.send_message(heartbeat('i-1'))
+            await asyncio.sleep(0.1)
+            client.reconnect('127.0.0.2')
+            client.send_message(heartbeat('i-2'))
+            await asyncio.sleep(0.1)
+            self.assertFalse(client.connection_lost)
+            client.close()
+            await task
+            await asyncio.sleep(0.05)  # The servers close the connections after the EOF.
+            for server in (first, second):
+                server.close()
+                await server.wait_closed()
+
+        self.loop.run_until_complete(run())
+        self.assertEqual(['i-1'], servers[0].received)
+        self.assertEqual(['i-2'], servers[1].received)
+
+    def test_backlog_above_batch_size(self):
+        monitor = Server('127.0.0.1')
+        client = Client('127.0.0.1', 0, sleep_time=0.01)
+        tasks = ['task{:05d}.txt'.format(index) + 'x' * 200 for index in range(6000)]
+        for task in tasks:  # More than MAX_BATCH_SIZE, queued while the server is unreachable.
+            client.send_message(CommandPacket(command='done', task=task))
+        self.assertGreater(len(encode_batch(client.send_buffer.drain())), config.MAX_BATCH_SIZE)
+        for task in tasks:
+            client.send_message(CommandPacket(command='done', task=task))
+
+        async def run():
+            server = await asyncio.start_server(monitor.run, '127.0.0.1', 0,
+                                                limit=config.MAX_BATCH_SIZE)
+            client.port = server.sockets[0].getsockname()[1]
+            task = asyncio.ensure_future(client.run())
+            for _ in range(100):
+                await asyncio.sleep(0.05)
+                if not client.send_buffer:
+                    break
+            client.close()
+            await task
+            await asyncio.sleep(0.05)  # The server closes the connection after the EOF.
+            server.close()
+            await server.wait_closed()
+
+        self.loop.run_until_complete(run())
+        self.assertFalse(client.connection_lost and client.last_exception)
+        self.assertEqual(tasks, monitor.received)
+
+    def test_full_queue_drops_oldest(self):
+        client = Client('127.0.0.1', 0)
+        client.send_buffer = OutboundQueue(capacity=2)
+        for task in 'abc':
+            client.send_message(CommandPacket(command='done', task=task))
+        self.assertEqual(['b', 'c'], [packet['task'] for packet in client.send_buffer.drain()])
+
+
+class TestPacketLog(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.records = []
+        self.handler = logging.Handler()
+        self.handler.emit = self.records.append
+        self.logger = logging.getLogger()
+        self.level = self.logger.level
+        self.logger.setLevel(logging.INFO)
+        self.logger.addHandler(self.handler)
+        self.sleep_time = config.SERVER_SLEEP_TIME
+        config.SERVER_SLEEP_TIME = 0
+
+    def tearDown(self):
+        config.SERVER_SLEEP_TIME = self.sleep_time
+        self.logger.removeHandler(self.handler)
+        self.logger.setLevel(self.level)
+        self.loop.close()
+
+    def test_sampled_per_direction(self):
+        client = Client('127.0.0.1', 0, sleep_time=0.01)
+        monitor = Server('127.0.0.1')
+        for instance in (client, monitor):
+            instance._received_log, instance._sent_log = LogSampler(every=2), LogSampler(every=2)
+
+        async def run():
+            server = await asyncio.start_server(monitor.run, '127.0.0.1', 0)
+            client.port = server.sockets[0].getsockname()[1]
+            task = asyncio.ensure_future(client.run())
+            for index in range(4):  # Every packet is sent and answered before the next one.
+                client.send_message(heartbeat('i-{}'.format(index)))
+                await asyncio.sleep(0.05)
+            client.close()
+            await task
+            await asyncio.sleep(0.05)  # The server closes the connection after the EOF.
+            server.close()
+            await server.wait_closed()
+
+        self.loop.run_until_complete(run())
+        messages = [record.getMessage() for record in self.records]
+        # The first and third of the four packets, of both the client and the server.
+        self.assertEqual(4, len([message for message in messages
+                                 if message.startswith('- Sent')]))
+        self.assertEqual(4, len([message for message in messages
+                                 if message.startswith('+ Received')]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import asyncio
+import threading
+import time
+import unittest
+
+from aws.utils.botoutils import BotoInstanceReader
+from aws.utils.controlplane import ControlPlaneClient
+from aws.utils.localcloud import LocalEc2
+
+
+class TestControlPlaneClient(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.ec2 = LocalEc2()
+        self.workers = self.ec2.add_instances('Worker', count=2)
+        self.client = ControlPlaneClient(BotoInstanceReader(ec2=self.ec2, ssm=object()),
+                                         concurrency=2)
+
+    def tearDown(self):
+        self.client.close()
+        self.loop.close()
+
+    def test_bounded_concurrency(self):
+        lock = threading.Lock()
+        running = [0, 0]  # Current and maximum concurrent calls.
+
+        def slow_call():
+            with lock:
+                running[0] += 1
+                running[1] = max(running)
+            time.sleep(0.05)
+            with lock:
+                running[0] -= 1
+
+        self.loop.run_until_complete(asyncio.gather(
+            *[self.client.call('slow', slow_call) for _ in range(6)]))
+        self.assertEqual(2, running[1])
+
+    def test_loop_not_blocked(self):
+        ticks = []
+
+        async def ticker():
+            for _ in range(3):
+                ticks.append(time.time())
+                await asyncio.sleep(0.01)
+
+        self.loop.run_until_complete(asyncio.gather(
+            self.client.call('slow', time.sleep, 0.2), ticker()))
+        self.assertLess(ticks[-1] - ticks[0], 0.15)
+
+    def test_wait_until_running(self):
+        async def start_and_wait():
+            await self.client.start_instances(self.workers)
+            return await self.client.wait_until_running(self.workers, poll=0.01, timeout=1)
+
+        self.assertTrue(self.loop.run_until_complete(start_and_wait()))
+
+    def test_wait_timeout(self):
+        self.assertFalse(self.loop.run_until_complete(
+            self.client.wait_until_running(self.workers, poll=0.01, timeout=0.05)))
+
+    def test_errors_propagate(self):
+        with self.assertRaises(KeyError):
+            self.loop.run_until_complete(self.client.stop_instances(['i-unknown']))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import unittest
+from time import time
+
+from aws.instancemanager.instancemanager import Instances
+from aws.utils import config
+from aws.utils.deadlines import DeadlineHeap
+from aws.utils.packets import HeartBeatPacket
+from aws.utils.state import InstanceState
+
+
+class TestDeadlineHeap(unittest.TestCase):
+
+    def test_expired_in_order(self):
+        deadlines = DeadlineHeap()
+        deadlines.schedule('b', 2)
+        deadlines.schedule('a', 1)
+        deadlines.schedule('c', 3)
+        self.assertEqual(['a', 'b'], deadlines.expired(2))
+        self.assertEqual(1, len(deadlines))
+        self.assertEqual([], deadlines.expired(2))
+
+    def test_reschedule(self):
+        deadlines = DeadlineHeap()
+        deadlines.schedule('a', 1)
+        deadlines.schedule('a', 5)
+        self.assertEqual([], deadlines.expired(4))
+        self.assertEqual(['a'], deadlines.expired(5))
+
+    def test_remove(self):
+        deadlines = DeadlineHeap()
+        deadlines.schedule('a', 1)
+        deadlines.remove('a')
+        self.assertNotIn('a', deadlines)
+        self.assertEqual([], deadlines.expired(1))
+
+    def test_compaction(self):
+        deadlines = DeadlineHeap()
+        for deadline in range(1000):
+            deadlines.schedule('a', deadline)
+        self.assertLess(len(deadlines._heap), 100)
+        self.assertEqual(['a'], deadlines.expired(999))
+
+
+class TestInstanceDeadlines(unittest.TestCase):
+
+    def setUp(self):
+        self.instances = Instances()
+        self.instances.set_state('i-1', 'worker', InstanceState(InstanceState.PENDING))
+
+    def heartbeat(self):
+        self.instances.set_last_heartbeat(HeartBeatPacket(
+            instance_id='i-1', instance_state='running', instance_type='worker',
+            cpu_usage=0.0, mem_usage=0.0))
+
+    def test_new_instance_checked_right_away(self):
+        self.assertEqual(['i-1'], self.instances.deadlines.expired(time()))
+
+    def test_pending_heartbeat_checked_right_away(self):
+        self.instances.set_last_start_signal('i-1')
+        self.heartbeat()
+        self.assertEqual(['i-1'], self.instances.deadlines.expired(time()))
+
+    def test_running_heartbeat_expiry(self):
+        self.instances.set_state('i-1', 'worker', InstanceState(InstanceState.RUNNING))
+        self.heartbeat()
+        self.assertEqual([], self.instances.deadlines.expired(time()))
+        deadline = self.instances.deadlines.get('i-1')
+        self.assertAlmostEqual(time() + config.HEART_BEAT_TIMEOUT, deadline, delta=1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,31 @@
+import unittest
+
+from aws.utils.hashring import ConsistentHashRing
+
+
+class TestConsistentHashRing(unittest.TestCase):
+
+    def test_empty(self):
+        self.assertIsNone(ConsistentHashRing().get('worker'))
+
+    def test_stable(self):
+        keys = ['i-{}'.format(idx) for idx in range(100)]
+        first = ConsistentHashRing(['nm-a', 'nm-b', 'nm-c'])
+        second = ConsistentHashRing(['nm-c', 'nm-a', 'nm-b'])
+        self.assertEqual([first.get(key) for key in keys], [second.get(key) for key in keys])
+        self.assertEqual({'nm-a', 'nm-b', 'nm-c'}, {first.get(key) for key in keys})
+
+    def test_remove_moves_only_removed_keys(self):
+        keys = ['i-{}'.format(idx) for idx in range(200)]
+        ring = ConsistentHashRing(['nm-a', 'nm-b', 'nm-c'])
+        before = {key: ring.get(key) for key in keys}
+        ring.remove('nm-c')
+        for key in keys:
+            if before[key] != 'nm-c':
+                self.assertEqual(before[key], ring.get(key))
+            else:
+                self.assertIn(ring.get(key), ('nm-a', 'nm-b'))
+
+
+if __name__ == '__main__':
+    unittest.main()
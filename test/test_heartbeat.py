@@ -0,0 +1,59 @@
+import unittest
+
+from aws.utils import config
+from aws.utils.heartbeat import AdaptiveInterval, heartbeat_timeout
+
+
+class TestAdaptiveInterval(unittest.TestCase):
+
+    def setUp(self):
+        self.interval = AdaptiveInterval('worker', 2)
+        self.interval.min_interval, self.interval.max_interval = 1, 8
+
+    def beat(self, load):
+        self.interval._last_beat = 0  # Pretend the current interval has passed.
+        self.assertTrue(self.interval.due(load))
+        return self.interval.current
+
+    def test_backoff_when_steady(self):
+        self.beat(5)
+        intervals = [self.beat(5) for _ in range(6)]
+        self.assertEqual(sorted(intervals), intervals)
+        self.assertEqual(8, intervals[-1])
+
+    def test_burst_resets(self):
+        self.beat(5)
+        for _ in range(6):
+            self.beat(5)
+        self.assertEqual(1, self.beat(50))
+
+    def test_burst_before_interval(self):
+        self.beat(5)
+        self.interval._last_beat -= self.interval.min_interval
+        self.assertFalse(self.interval.due(5))
+        self.assertTrue(self.interval.due(50))
+
+    def test_idle_at_min_interval(self):
+        self.beat(0)
+        intervals = [self.beat(0) for _ in range(6)]
+        self.assertEqual(8, intervals[-1])  # A steady load backs off.
+        self.interval._last_beat -= self.interval.min_interval
+        self.assertTrue(self.interval.due(0, idle=True))
+        self.assertEqual(1, self.interval.current)
+
+    def test_tune(self):
+        self.beat(5)
+        for _ in range(6):
+            self.beat(5)
+        self.interval.tune({'worker': {'max_interval': 4}, 'node_manager': {'max_interval': 2}})
+        self.assertEqual(4, self.interval.current)
+        self.interval.tune({'min_interval': 5, 'max_interval': 3})  # Invalid range is ignored.
+        self.assertEqual((1, 4), (self.interval.min_interval, self.interval.max_interval))
+
+    def test_timeout(self):
+        self.assertEqual(config.HEART_BEAT_TIMEOUT, heartbeat_timeout(None))
+        self.assertEqual(100 * config.HEARTBEAT_TIMEOUT_FACTOR, heartbeat_timeout(100))
+
+
+if __name__ == '__main__':
+    unittest.main()
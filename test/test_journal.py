@@ -0,0 +1,76 @@
+import shutil
+import tempfile
+import unittest
+
+from aws.nodemanager.journal import TaskJournal
+
+
+class TestTaskJournal(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_replay(self):
+        journal = TaskJournal(self.directory)
+        journal.record('add', 'a', 'bulk', None, '10.0.0.1', 1.0)
+        journal.record('add', 'b', 'interactive', 5.0, None, 2.0)
+        journal.record('add', 'c', 'bulk', None, None, 3.0)
+        journal.record('dispatch', 'a')
+        journal.record('done', 'b')
+        journal.close()
+        recovered = TaskJournal(self.directory).recover()
+        self.assertEqual([['a', 'bulk', None, '10.0.0.1', 1.0, True],
+                          ['c', 'bulk', None, None, 3.0, False]], recovered)
+
+    def test_snapshot(self):
+        journal = TaskJournal(self.directory)
+        journal.record('add', 'a', 'bulk', None, None, 1.0)
+        journal.record('add', 'b', 'bulk', None, None, 2.0)
+        journal.snapshot([['b', 'bulk', None, None, 2.0, False]])
+        journal.record('add', 'c', 'bulk', None, None, 3.0)
+        journal.record('done', 'b')
+        journal.close()
+        recovered = TaskJournal(self.directory).recover()
+        self.assertEqual(['c'], [entry[0] for entry in recovered])
+
+    def test_held_and_ingested(self):
+        journal = TaskJournal(self.directory)
+        journal.record('hold', 'a', 'text a', None, None, '10.0.0.1', 1.0)
+        journal.record('hold', 'b', 'text b', None, None, '10.0.0.1', 2.0)
+        journal.record('ingest', None, 2)
+        journal.snapshot([], held=[['a', 'text a', None, None, '10.0.0.1', 1.0],
+                                   ['b', 'text b', None, None, '10.0.0.1', 2.0]], ingested=2)
+        journal.record('add', 'a', 'bulk', None, '10.0.0.1', 3.0)  # Released by the rate limit.
+        journal.record('hold', 'c', 'text c', None, None, '10.0.0.1', 3.0)
+        journal.record('ingest', None, 3)
+        journal.close()
+        recovered = TaskJournal(self.directory)
+        self.assertEqual(['a'], [entry[0] for entry in recovered.recover()])
+        self.assertEqual(['b', 'c'], [entry[0] for entry in recovered.held])
+        self.assertEqual(3, recovered.ingested)
+
+    def test_unflushed_events_are_lost(self):
+        journal = TaskJournal(self.directory)
+        journal.record('add', 'a', 'bulk', None, None, 1.0)
+        self.assertEqual([], TaskJournal(self.directory).recover())
+        journal.flush()
+        self.assertEqual(1, len(TaskJournal(self.directory).recover()))
+
+    def test_clean_close_is_not_replayed(self):
+        journal = TaskJournal(self.directory)
+        journal.record('add', 'a', 'bulk', None, None, 1.0)
+        journal.record('hold', 'b', 'text b', None, None, '10.0.0.1', 2.0)
+        journal.snapshot([['a', 'bulk', None, None, 1.0, False]], ingested=2)
+        journal.record('ingest', None, 3)
+        journal.close(clean=True)
+        recovered = TaskJournal(self.directory)
+        self.assertEqual([], recovered.recover())
+        self.assertEqual([], recovered.held)
+        self.assertEqual(0, recovered.ingested)
+
+
+if __name__ == '__main__':
+    unittest.main()
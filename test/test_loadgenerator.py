@@ -0,0 +1,91 @@
+import asyncio
+import random
+import time
+import unittest
+
+import pandas as pd
+
+from aws.nodemanager.loadgenerator import LoadGenerator, parse_arrivals
+from aws.nodemanager.taskqueue import IngestionLimiter
+from experiment.simulator import SimulatedTaskPool
+
+
+def inputs(count=4):
+    return pd.DataFrame({'IP': ['10.0.1.{}'.format(index) for index in range(count)],
+                         'Input': ['text\n{}'.format(index) for index in range(count)]})
+
+
+def arrivals(spec, duration, seed=0):
+    times = []
+    for arrival, _, _ in parse_arrivals(spec, random.Random(seed)):
+        if arrival > duration:
+            return times
+        times.append(arrival)
+
+
+class TestArrivals(unittest.TestCase):
+
+    def test_poisson_rate(self):
+        self.assertAlmostEqual(10000, len(arrivals('poisson:10', 1000)), delta=300)
+
+    def test_bursty(self):
+        times = arrivals('bursty:1,100,50,10', 6000)
+        per_second = pd.Series(times).astype(int).value_counts()
+        self.assertGreater(per_second.max(), 50)  # Bursts are far above the normal rate.
+        self.assertGreater(len(times), 6000)
+        self.assertEqual(sorted(times), times)
+
+    def test_diurnal(self):
+        times = pd.Series(arrivals('diurnal:10,0.9,1000', 10000))
+        peak = ((times % 1000 > 200) & (times % 1000 < 300)).sum()  # The sine peaks at 250.
+        trough = ((times % 1000 > 700) & (times % 1000 < 800)).sum()
+        self.assertGreater(peak, 5 * trough)
+
+    def test_unknown(self):
+        with self.assertRaises(ValueError):
+            parse_arrivals('constant:1', random.Random())
+
+
+class TestLoadGenerator(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.taskpool = SimulatedTaskPool('node_manager', host='127.0.0.1', port=0,
+                                          resource_manager=None)
+        self.taskpool.ring.add('node_manager')
+
+    def tearDown(self):
+        self.loop.close()
+
+    def test_schedule(self):
+        generator = LoadGenerator(self.taskpool, 'poisson:5', inputs(), compression=10,
+                                  duration=100, seed=1)
+        schedule = list(generator.schedule())
+        self.assertAlmostEqual(500, len(schedule), delta=100)
+        self.assertLessEqual(schedule[-1][0], 10)  # 100 seconds of arrivals in 10 seconds.
+        self.assertTrue(all('\n' not in task_data for _, task_data, _ in schedule))
+        self.assertTrue({source for _, _, source in schedule} <= set(inputs()['IP']))
+
+    def test_open_loop(self):
+        # Ingestion takes longer than the time between arrivals, which must not delay them.
+        def slow_register(task_data, key=None):
+            time.sleep(0.05)
+            return key
+        self.taskpool.register_task = slow_register
+        generator = LoadGenerator(self.taskpool, 'poisson:100', inputs(40), duration=0.5, seed=2)
+        start = time.time()
+        self.loop.run_until_complete(generator.run())
+        self.assertLess(time.time() - start, 2)
+        self.assertEqual(generator.offered,
+                         generator.accepted + generator.held + generator.rejected)
+        self.assertEqual(generator.accepted, len(self.taskpool.tasks))
+        self.assertLess(generator.max_lag, 0.2)
+
+    def test_held_apart_from_rejected(self):
+        self.taskpool.limiter = IngestionLimiter(rate=0.001, burst=2, max_backlog=3)
+        generator = LoadGenerator(self.taskpool, 'poisson:100', inputs(1), duration=0.2, seed=3)
+        self.loop.run_until_complete(generator.run())
+        self.assertGreater(generator.offered, 5)
+        self.assertEqual((2, 3, generator.offered - 5),
+                         (generator.accepted, generator.held, generator.rejected))
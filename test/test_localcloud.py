@@ -0,0 +1,129 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from aws.utils import clock
+from aws.utils.localcloud import LocalCloud, LocalEc2, LocalS3, LocalSsm
+from experiment.harness import read_metrics, report
+
+
+class TestLocalS3(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.s3 = LocalS3(os.path.join(self.root, 's3'))
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_round_trip(self):
+        self.assertIsNone(self.s3.Bucket('local-files').creation_date)
+        self.s3.create_bucket(Bucket='local-files')
+        self.assertIsNotNone(self.s3.Bucket('local-files').creation_date)
+        source = os.path.join(self.root, 'source.txt')
+        with open(source, 'w') as file:
+            file.write('task')
+        self.s3.upload_file(source, 'local-files', 'worker/task.txt')
+        target = os.path.join(self.root, 'target.txt')
+        self.s3.download_file('local-files', 'worker/task.txt', target)
+        with open(target) as file:
+            self.assertEqual('task', file.read())
+        self.s3.Bucket('local-files').object_versions.delete()
+        self.s3.delete_bucket(Bucket='local-files')
+        self.assertEqual([], self.s3.list_buckets()['Buckets'])
+
+
+class TestLocalEc2(unittest.TestCase):
+
+    def tearDown(self):
+        clock.set_clock(time.time)
+
+    def test_transition_time(self):
+        now = [1000.0]
+        clock.set_clock(lambda: now[0])
+        ec2 = LocalEc2(transition_time=10)
+        changes = []
+        ec2.listeners.append(lambda instance_id, state: changes.append(state))
+        instance_id = ec2.add_instances('Worker')[0]
+        ec2.start_instances(InstanceIds=[instance_id])
+        self.assertEqual('pending', ec2.get_state(instance_id))
+        now[0] += 10
+        self.assertEqual('running', ec2.get_state(instance_id))
+        self.assertEqual(['pending', 'running'], changes)
+
+    def test_ssm_launcher(self):
+        ec2 = LocalEc2()
+        launched = []
+        ssm = LocalSsm(ec2, launcher=lambda instance_id, command: launched.append(instance_id))
+        instance_ids = ec2.add_instances('Worker', count=2, state='running')
+        ssm.send_command(InstanceIds=instance_ids, DocumentName='AWS-RunShellScript',
+                         Parameters={'commands': ['true']})
+        self.assertEqual(instance_ids, launched)
+        ec2.stop_instances(InstanceIds=instance_ids[:1])
+        with self.assertRaises(LocalSsm.exceptions.InvalidInstanceId):
+            ssm.send_command(InstanceIds=instance_ids, DocumentName='AWS-RunShellScript',
+                             Parameters={'commands': ['true']})
+
+
+class TestLocalCloud(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.cloud = LocalCloud.create(self.root, node_managers=1, workers=2)
+
+    def tearDown(self):
+        LocalCloud.stop_all(self.root)
+        shutil.rmtree(self.root)
+
+    def test_fleet(self):
+        ec2 = self.cloud.ec2()
+        response = ec2.describe_instances(Filters=[{'Name': 'tag:Name', 'Values': ['Worker']}])
+        self.assertEqual(2, len(response['Reservations'][0]['Instances']))
+
+    def test_stop_kills_processes(self):
+        ec2 = self.cloud.ec2()
+        ssm = self.cloud.ssm(ec2)
+        instance_id = ec2.add_instances('Worker')[0]
+        ec2.start_instances(InstanceIds=[instance_id])
+        ssm.send_command(InstanceIds=[instance_id], DocumentName='AWS-RunShellScript',
+                         Parameters={'commands': ['echo $LOCAL_INSTANCE_ID ; sleep 60']})
+        process = self.cloud._processes[instance_id][0]
+        self.assertEqual(1, len(os.listdir(os.path.join(self.root, 'pids'))))
+        output = os.path.join(self.root, 'logs', instance_id + '.out')
+        for _ in range(100):  # Wait until the process runs.
+            if os.path.getsize(output):
+                break
+            time.sleep(0.05)
+        ec2.stop_instances(InstanceIds=[instance_id])
+        self.assertIsNotNone(process.wait(timeout=10))
+        self.assertEqual([], os.listdir(os.path.join(self.root, 'pids')))
+        with open(output) as file:
+            self.assertEqual(instance_id, file.read().strip())
+
+
+class TestHarness(unittest.TestCase):
+
+    def test_report(self):
+        metrics = [{'task_finished': {'start_time': 0, 'duration': index + 1,
+                                      'response_time': index + 0.5}, 'time': index + 1}
+                   for index in range(10)] + [{'workers': 3, 'time': 5}]
+        result = report(metrics, tasks=12)
+        self.assertEqual(10, result['tasks_finished'])
+        self.assertEqual(1.0, result['throughput'])
+        self.assertEqual(5.5, result['duration_p50'])
+        self.assertEqual(5.0, result['response_time_p50'])
+        self.assertEqual(3, result['max_workers'])
+
+    def test_read_metrics(self):
+        root = tempfile.mkdtemp()
+        try:
+            os.makedirs(os.path.join(root, 'logs'))
+            with open(os.path.join(root, 'logs', 'i-1.log'), 'w') as file:
+                file.write('INFO:root:METRIC{"workers": 2, "time": 1}\n'
+                           'INFO:root:Starting Node Scheduler..\n'
+                           'INFO:root:METRIC{"workers"')
+            self.assertEqual([{'workers': 2, 'time': 1}], read_metrics(root))
+        finally:
+            shutil.rmtree(root)
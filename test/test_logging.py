@@ -0,0 +1,68 @@
+import logging
+import unittest
+
+from aws.resourcemanager.resourcemanager import LogSampler, flush_logs, log_info, log_metric, \
+    log_sampled
+
+
+class Expensive:
+    """
+    Argument of a message that counts how often it is formatted.
+    """
+
+    def __init__(self):
+        self.formatted = 0
+
+    def __format__(self, format_spec):
+        self.formatted += 1
+        return 'expensive'
+
+
+class TestLogging(unittest.TestCase):
+
+    def setUp(self):
+        self.records = []
+        self.handler = logging.Handler()
+        self.handler.emit = self.records.append
+        self.logger = logging.getLogger()
+        self.level = self.logger.level
+        self.logger.addHandler(self.handler)
+
+    def tearDown(self):
+        self.logger.removeHandler(self.handler)
+        self.logger.setLevel(self.level)
+
+    def test_level_before_formatting(self):
+        argument = Expensive()
+        self.logger.setLevel(logging.WARNING)
+        log_info("Packet: {}", argument)
+        self.assertEqual(0, argument.formatted)
+        self.assertEqual([], self.records)
+
+        self.logger.setLevel(logging.INFO)
+        log_info("Packet: {}", argument)
+        log_info("Not a format string: {}")
+        self.assertEqual(1, argument.formatted)
+        self.assertEqual(["Packet: expensive", "Not a format string: {}"],
+                         [record.getMessage() for record in self.records])
+
+    def test_sampling(self):
+        self.logger.setLevel(logging.INFO)
+        sampler = LogSampler(every=10)
+        argument = Expensive()
+        for _ in range(25):
+            log_sampled(sampler, "+ Received: {}", argument)
+        self.assertEqual(3, len(self.records))
+        self.assertEqual(3, argument.formatted)
+        self.assertEqual("+ Received: expensive [1 in 10 logged]", self.records[0].getMessage())
+
+    def test_metric_regardless_of_level(self):
+        self.logger.setLevel(logging.WARNING)
+        log_info("Not logged.")
+        log_metric({'workers': 1})
+        self.assertEqual(1, len(self.records))
+        self.assertTrue(self.records[0].getMessage().startswith('METRIC{"workers": 1'))
+
+    def test_flush(self):
+        log_info("Written by the background thread.")
+        flush_logs()  # Returns once the queue is empty.
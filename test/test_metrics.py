@@ -0,0 +1,88 @@
+import asyncio
+import json
+import unittest
+
+from aws.utils.metrics import Histogram, MetricsRegistry, handle_request
+
+
+class TestHistogram(unittest.TestCase):
+
+    def test_percentiles(self):
+        histogram = Histogram(buckets=[1, 2, 4, 8])
+        for value in [0.5] * 50 + [3] * 40 + [6] * 9 + [100]:
+            histogram.observe(value)
+        self.assertEqual([50, 0, 40, 9, 1], histogram.counts)
+        self.assertAlmostEqual(1.0, histogram.percentile(50))
+        self.assertAlmostEqual(4.0, histogram.percentile(90))
+        self.assertAlmostEqual(8.0, histogram.percentile(100))  # Overflow: last bound.
+        self.assertIsNone(Histogram(buckets=[1]).percentile(50))
+
+    def test_merge(self):
+        first, second = Histogram(buckets=[1, 2]), Histogram(buckets=[1, 2])
+        first.observe(0.5)
+        second.observe(1.5)
+        second.observe(1.5)
+        first.merge(second.to_dict())
+        self.assertEqual([1, 2, 0], first.counts)
+        self.assertEqual(3, first.count)
+        self.assertAlmostEqual(3.5, first.sum)
+        with self.assertRaises(ValueError):
+            first.merge(Histogram(buckets=[1, 3]))
+
+
+class TestRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = MetricsRegistry()
+        self.registry.counter('tasks_total', "Tasks.", priority='bulk').inc(2)
+        self.registry.counter('tasks_total', "Tasks.", priority='interactive').inc()
+        self.registry.gauge('workers').set(3)
+        self.registry.histogram('wait_seconds', buckets=[0.1, 1]).observe(0.5)
+
+    def test_same_metric(self):
+        self.assertIs(self.registry.gauge('workers'), self.registry.gauge('workers'))
+        with self.assertRaises(ValueError):
+            self.registry.counter('workers')
+
+    def test_exposition(self):
+        lines = self.registry.exposition().splitlines()
+        self.assertIn('# TYPE tasks_total counter', lines)
+        self.assertIn('tasks_total{priority="bulk"} 2', lines)
+        self.assertIn('workers 3', lines)
+        self.assertIn('wait_seconds_bucket{le="0.1"} 0', lines)
+        self.assertIn('wait_seconds_bucket{le="1"} 1', lines)
+        self.assertIn('wait_seconds_bucket{le="+Inf"} 1', lines)
+        self.assertIn('wait_seconds_count 1', lines)
+
+    def test_snapshot(self):
+        snapshot = self.registry.snapshot()
+        self.assertEqual({'priority=bulk': 2, 'priority=interactive': 1}, snapshot['tasks_total'])
+        self.assertEqual(1, snapshot['wait_seconds']['count'])
+        json.dumps(snapshot)
+
+    def test_endpoint(self):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+
+        async def get(path):
+            server = await asyncio.start_server(
+                lambda reader, writer: handle_request(reader, writer, self.registry),
+                '127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write('GET {} HTTP/1.1\r\nHost: localhost\r\n\r\n'.format(path).encode())
+            response = await reader.read()
+            writer.close()
+            server.close()
+            await server.wait_closed()
+            return response.decode()
+
+        try:
+            response = loop.run_until_complete(get('/metrics'))
+            self.assertTrue(response.startswith('HTTP/1.0 200 OK'))
+            self.assertIn('workers 3', response)
+            response = loop.run_until_complete(get('/metrics.json'))
+            self.assertEqual(3, json.loads(response.split('\r\n\r\n', 1)[1])['workers'])
+            self.assertIn('404', loop.run_until_complete(get('/other')).splitlines()[0])
+        finally:
+            loop.close()
@@ -0,0 +1,71 @@
+import unittest
+
+from aws.utils.connection import encode_packet, decode_packet
+from aws.utils.packets import HeartBeatPacket, HeartBeatDeltaPacket, HeartBeatEncoder, \
+    HeartBeatDecoder
+
+
+def heartbeat(**kwargs):
+    return HeartBeatPacket(instance_id='i-1', instance_state='running', instance_type='node_manager',
+                           cpu_usage=1.0, mem_usage=2.0, **kwargs)
+
+
+def transfer(packet):
+    return decode_packet(encode_packet(packet))
+
+
+class TestHeartBeatDelta(unittest.TestCase):
+
+    def test_first_is_keyframe(self):
+        encoder = HeartBeatEncoder()
+        self.assertIsInstance(encoder.encode(heartbeat()), HeartBeatPacket)
+
+    def test_delta_roundtrip(self):
+        encoder, decoder = HeartBeatEncoder(), HeartBeatDecoder()
+        decoder.decode(transfer(encoder.encode(heartbeat(worker_allocation={'a': 1, 'b': 2},
+                                                         args={'x': 1}))))
+        encoder.acknowledge()
+        delta = encoder.encode(heartbeat(worker_allocation={'a': 1, 'c': 3}))
+        self.assertIsInstance(delta, HeartBeatDeltaPacket)
+        self.assertNotIn('instance_type', delta['changed'])
+        self.assertEqual({'changed': {'c': 3}, 'removed': ['b']}, delta['patch']['worker_allocation'])
+        self.assertEqual(['args'], delta['removed'])
+        rebuilt = decoder.decode(transfer(delta))
+        self.assertEqual({'a': 1, 'c': 3}, rebuilt['worker_allocation'])
+        self.assertEqual('node_manager', rebuilt['instance_type'])
+        self.assertNotIn('args', rebuilt)
+
+    def test_delta_relative_to_acknowledged(self):
+        encoder, decoder = HeartBeatEncoder(), HeartBeatDecoder()
+        decoder.decode(transfer(encoder.encode(heartbeat(queue=1))))
+        encoder.acknowledge()
+        encoder.encode(heartbeat(queue=2))  # Lost, never acknowledged.
+        rebuilt = decoder.decode(transfer(encoder.encode(heartbeat(queue=3))))
+        self.assertEqual(3, rebuilt['queue'])
+
+    def test_unknown_base(self):
+        encoder = HeartBeatEncoder()
+        encoder.encode(heartbeat())
+        encoder.acknowledge()
+        self.assertIsNone(HeartBeatDecoder().decode(transfer(encoder.encode(heartbeat()))))
+
+    def test_keyframe_interval(self):
+        encoder = HeartBeatEncoder(keyframe_interval=2)
+        types = []
+        for _ in range(6):
+            types.append(type(encoder.encode(heartbeat())))
+            encoder.acknowledge()
+        self.assertEqual([HeartBeatPacket, HeartBeatDeltaPacket, HeartBeatDeltaPacket] * 2, types)
+
+    def test_smaller(self):
+        encoder = HeartBeatEncoder()
+        allocation = {'i-{}'.format(idx): idx for idx in range(100)}
+        full = encode_packet(encoder.encode(heartbeat(worker_allocation=allocation)))
+        encoder.acknowledge()
+        allocation['i-0'] = 5
+        delta = encode_packet(encoder.encode(heartbeat(worker_allocation=allocation)))
+        self.assertLess(len(delta) * 5, len(full))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,44 @@
+import unittest
+
+from aws.utils.registry import InstanceRegistry
+from aws.utils.state import InstanceState
+
+
+class TestInstanceRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = InstanceRegistry()
+        self.registry.set_state('w1', 'worker', InstanceState(InstanceState.RUNNING))
+        self.registry.set_state('w2', 'worker', InstanceState(InstanceState.PENDING))
+        self.registry.set_state('nm', 'node_manager', InstanceState(InstanceState.RUNNING))
+
+    def test_index(self):
+        self.assertEqual(['w1'], self.registry.get_all('worker', InstanceState.RUNNING))
+        self.assertEqual(['w1', 'w2'], self.registry.get_all(
+            'worker', [InstanceState.RUNNING, InstanceState.PENDING]))
+        self.assertEqual(['w1', 'w2'], self.registry.get_all('worker'))
+        self.assertFalse(self.registry.has('worker', InstanceState.STOPPED))
+
+    def test_transition(self):
+        version = self.registry.version('worker')
+        old_state = self.registry.set_state('w2', 'worker', InstanceState.RUNNING)
+        self.assertTrue(old_state.is_state(InstanceState.PENDING))
+        self.assertEqual(['w1', 'w2'], self.registry.get_all('worker', InstanceState.RUNNING))
+        self.assertEqual(0, self.registry.count('worker', InstanceState.PENDING))
+        self.assertGreater(self.registry.version('worker'), version)
+        version = self.registry.version('worker')
+        self.registry.set_state('w2', 'worker', InstanceState.RUNNING)
+        self.assertEqual(version, self.registry.version('worker'))
+        self.assertEqual(1, self.registry.version('node_manager'))
+
+    def test_sync(self):
+        removed, added = self.registry.sync('worker', {InstanceState.RUNNING: ['w2', 'w3'],
+                                                       InstanceState.PENDING: []})
+        self.assertEqual((['w1'], ['w3']), (removed, added))
+        self.assertNotIn('w1', self.registry)
+        self.assertIn('nm', self.registry)
+        self.assertTrue(self.registry.is_state('w2', 'worker', InstanceState.RUNNING))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import json
+import os
+import tarfile
+import tempfile
+import time
+import unittest
+
+import pandas as pd
+
+from aws.utils import clock, config
+from experiment.simulator import Simulation, parse_distribution
+
+
+def scenario(tasks, burst_time=10):
+    return pd.DataFrame({'IP': ['10.0.1.{}'.format(index % 4) for index in range(tasks)],
+                         'Input': ['text {}'.format(index) for index in range(tasks)],
+                         'Time': [burst_time] * tasks})
+
+
+class TestSimulation(unittest.TestCase):
+
+    def setUp(self):
+        self.simulation = Simulation(scenario(60), workers=5, service_time='const:2',
+                                     boot_time='const:30')
+
+    def test_all_tasks_finished(self):
+        start = time.time()
+        self.simulation.run(duration=1800)
+        summary = self.simulation.summary()
+        self.assertEqual(60, summary['tasks_finished'])
+        self.assertGreater(summary['max_workers'], 1)
+        self.assertGreater(summary['simulated_time'], 40)  # Workers need 30 seconds to boot.
+        self.assertLess(time.time() - start, 10)
+        self.assertLess(abs(clock.time() - time.time()), 1)  # The system clock is restored.
+
+    def test_metrics(self):
+        metrics = self.simulation.run(duration=1800)
+        keys = {key for metric in metrics for key in metric}
+        self.assertTrue({'workers', 'heartbeat', 'task_finished', 'charged_time'} <= keys)
+        self.assertTrue(all(metric['time'] >= self.simulation.start_time for metric in metrics))
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'simulation.tgz')
+            self.simulation.write_log(path)
+            with tarfile.open(path, 'r') as tar:
+                lines = [line.decode('utf-8') for member in tar.getmembers()
+                         for line in tar.extractfile(member).readlines()]
+            self.assertEqual(metrics, [json.loads(line.split('METRIC')[1]) for line in lines])
+
+            self.simulation.write_results(os.path.join(directory, 'results.csv'),
+                                          os.path.join(directory, 'signal_times.txt'))
+            results = pd.read_csv(os.path.join(directory, 'results.csv'))
+            self.assertEqual(['time', 'tasks', 'workers'], list(results.columns))
+
+    def test_deterministic(self):
+        self.simulation.run(duration=1800)
+        other = Simulation(scenario(60), workers=5, service_time='const:2', boot_time='const:30')
+        other.run(duration=1800)
+        self.assertEqual(self.simulation.summary()['simulated_time'],
+                         other.summary()['simulated_time'])
+
+    def test_idle_worker_pickup(self):
+        tasks = pd.DataFrame({'IP': ['10.0.1.0'] * 2, 'Input': ['first', 'second'],
+                              'Time': [10, 120]})
+        simulation = Simulation(tasks, workers=1, service_time='const:1', boot_time='const:1')
+        simulation.im.run = lambda: None  # Keep the worker, which is idle in between the tasks.
+        simulation.im.start_workers(1)
+        metrics = simulation.run(duration=600)
+        response_times = [metric['task_finished']['response_time'] for metric in metrics
+                          if 'task_finished' in metric]
+        self.assertEqual(2, len(response_times))
+        # Assigned at the next iteration of the node manager, and picked up by the next heartbeat.
+        self.assertLessEqual(response_times[1], 1 + config.HEART_BEAT_INTERVAL_NODE_MANAGER +
+                             config.HEARTBEAT_MIN_INTERVAL['worker'])
+
+    def test_distributions(self):
+        import random
+        rng = random.Random(0)
+        self.assertEqual(2.0, parse_distribution('const:2', rng)())
+        self.assertTrue(1 <= parse_distribution('uniform:1,3', rng)() <= 3)
+        self.assertGreater(parse_distribution('exp:1', rng)(), 0)
+        with self.assertRaises(ValueError):
+            parse_distribution('normal:1', rng)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import time
+import unittest
+from collections import deque
+
+from aws.utils import clock
+from aws.utils.packets import CommandPacket, HeartBeatPacket
+from aws.utils.state import InstanceState
+from experiment.simulator import SimulatedTaskPool
+
+
+class TestSpeculation(unittest.TestCase):
+
+    def setUp(self):
+        self.now = [1000.0]
+        clock.set_clock(lambda: self.now[0])
+        self.taskpool = SimulatedTaskPool('node_manager', host='127.0.0.1', port=0,
+                                          resource_manager=None)
+        for worker in ['w1', 'w2']:
+            self.taskpool.workers.set_state(worker, 'worker', InstanceState(InstanceState.RUNNING))
+            self.taskpool.task_assignment[worker] = deque()
+            self.taskpool.task_processing[worker] = deque()
+        self.taskpool.run_times.extend([1.0] * 20)  # A straggler runs longer than 1.5 seconds.
+
+        # The task starts on w1 and becomes a straggler, so a copy is assigned to idle w2.
+        self.task = self.taskpool.add_task('text')
+        self.taskpool.task_assignment['w1'].append(self.taskpool.tasks.popleft())
+        self.taskpool.all_assigned_tasks += 1
+        self.taskpool._next_task('w1', CommandPacket(command='done'))
+        self.now[0] += 2
+        self.taskpool.speculate_stragglers()
+
+    def tearDown(self):
+        clock.set_clock(time.time)
+
+    def heartbeat(self, worker):
+        return HeartBeatPacket(instance_id=worker, instance_type='worker',
+                               instance_state=InstanceState.RUNNING, time=self.now[0],
+                               cpu_usage=1.0, mem_usage=1.0, no_hb_task=True)
+
+    def done(self, worker):
+        return CommandPacket(command='done', instance_id=worker, task=self.task,
+                             task_start=self.now[0], time_to_download=0, run_time_task=2.0)
+
+    def test_speculate_straggler(self):
+        self.assertEqual(deque([self.task]), self.taskpool.task_assignment['w2'])
+        self.assertEqual({'w1', 'w2'}, self.taskpool.speculated[self.task])
+        self.taskpool.speculate_stragglers()  # A task is copied only once.
+        self.assertEqual(1, len(self.taskpool.task_assignment['w2']))
+
+    def test_copy_wins(self):
+        self.taskpool._next_task('w2', CommandPacket(command='done'))
+        self.taskpool.process_command(self.done('w2'), None)
+        self.assertEqual(0, self.taskpool.all_assigned_tasks)
+        self.assertNotIn(self.task, self.taskpool.table)
+
+        # The original on w1 is cancelled once, not on every heartbeat.
+        response = self.taskpool.process_heartbeat(self.heartbeat('w1'), None)
+        self.assertEqual(('cancel', [self.task]), (response['command'], response['tasks']))
+        self.assertNotEqual('cancel', self.taskpool.process_heartbeat(
+            self.heartbeat('w1'), None).get('command'))
+
+        self.taskpool.process_command(CommandPacket(command='cancelled', instance_id='w1',
+                                                    tasks=[self.task]), None)
+        self.assertFalse(self.taskpool.task_processing['w1'])
+        self.assertFalse(self.taskpool.cancelled['w1'])
+
+    def test_original_wins(self):
+        self.taskpool.process_command(self.done('w1'), None)
+        self.assertFalse(self.taskpool.task_assignment['w2'])  # The copy had not started yet.
+        self.assertNotIn(self.task, self.taskpool.speculated)
+        self.assertNotEqual('cancel', self.taskpool.process_heartbeat(
+            self.heartbeat('w2'), None).get('command'))
+
+    def test_remove_worker_with_copy(self):
+        self.taskpool._next_task('w2', CommandPacket(command='done'))
+        self.taskpool.remove_worker('w1')
+        self.assertFalse(self.taskpool.tasks)  # w2 still runs a copy.
+        self.assertNotIn(self.task, self.taskpool.speculated)
+
+        self.taskpool.remove_worker('w2')
+        self.assertEqual([self.task], list(self.taskpool.tasks))  # The last copy is lost.
+
+
+if __name__ == '__main__':
+    unittest.main()
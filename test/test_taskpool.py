@@ -0,0 +1,230 @@
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from collections import deque
+
+import pandas as pd
+
+import aws.utils.config as config
+from aws.nodemanager.journal import TaskJournal
+from aws.nodemanager.taskqueue import IngestionLimiter
+from aws.nodemanager.tasktable import TaskTable
+from aws.utils import clock
+from aws.utils.monitor import Listener
+from aws.utils.packets import CommandPacket
+from aws.utils.state import InstanceState
+from experiment.simulator import SimulatedTaskPool
+
+
+def submit(data, source='10.0.0.1', **kwargs):
+    return CommandPacket(command='submit', data=data, source=source, **kwargs)
+
+
+class TestSubmit(unittest.TestCase):
+
+    def setUp(self):
+        self.now = [1000.0]
+        clock.set_clock(lambda: self.now[0])
+        self.taskpool = SimulatedTaskPool('node_manager', host='127.0.0.1', port=0,
+                                          resource_manager=None)
+        self.taskpool.limiter = IngestionLimiter(rate=1, burst=1, max_backlog=1)
+
+    def tearDown(self):
+        clock.set_clock(time.time)
+
+    def test_held_and_throttled(self):
+        submitted = self.taskpool.process_command(submit('a'), None)
+        self.assertEqual('submitted', submitted['command'])
+        self.assertIn(submitted['task'], self.taskpool.table)
+
+        held = self.taskpool.process_command(submit('b'), None)
+        self.assertEqual('held', held['command'])
+        self.assertEqual(held['task'], self.taskpool.limiter.backlog['10.0.0.1'][0][-1])
+
+        throttled = self.taskpool.process_command(submit('c'), None)
+        self.assertEqual('throttled', throttled['command'])
+        self.assertEqual(1, self.taskpool.limiter.backlog_depth()['10.0.0.1'])
+
+        # The held task is added under the key that was returned to the client.
+        self.now[0] += 1
+        self.taskpool.release_backlog()
+        self.assertIn(held['task'], self.taskpool.table)
+
+    def test_release_up_to_table_capacity(self):
+        self.taskpool.table = self.taskpool.tasks.table = TaskTable(capacity=3)
+        self.taskpool.limiter = IngestionLimiter(rate=1, burst=1, max_backlog=10)
+        self.taskpool.add_task('a', source='10.0.0.1')
+        self.taskpool.add_task('b', source='10.0.0.2')
+        held = [self.taskpool.process_command(submit(str(index)), None)['task']
+                for index in range(4)]
+        self.now[0] += 10  # Tokens for all held tasks, but room for only one.
+        self.taskpool.release_backlog()
+        self.assertTrue(self.taskpool.table.is_full())
+        self.assertIn(held[0], self.taskpool.table)
+        self.assertEqual({'10.0.0.1': 3}, self.taskpool.limiter.backlog_depth())
+
+        self.taskpool.table.release(held[0])
+        self.now[0] += 10
+        self.taskpool.release_backlog()
+        self.assertIn(held[1], self.taskpool.table)
+        self.assertEqual({'10.0.0.1': 2}, self.taskpool.limiter.backlog_depth())
+
+    def test_unknown_priority(self):
+        response = self.taskpool.process_command(submit('a', priority='urgent'), None)
+        self.assertEqual('rejected', response['command'])
+
+
+class Heartbeats(Listener):
+
+    def __init__(self):
+        self.heartbeats = []
+
+    def event(self, message):
+        self.heartbeats.append(message)
+
+
+class TestAdmissionControl(unittest.TestCase):
+
+    def setUp(self):
+        self.settings = (config.TASKPOOL_HIGH_WATERMARK, config.TASKPOOL_LOW_WATERMARK,
+                         config.MAX_ASSIGNED_PER_WORKER)
+        config.TASKPOOL_HIGH_WATERMARK, config.TASKPOOL_LOW_WATERMARK = 10, 5
+        config.MAX_ASSIGNED_PER_WORKER = 3
+        self.taskpool = SimulatedTaskPool('node_manager', host='127.0.0.1', port=0,
+                                          resource_manager=None)
+        self.taskpool.limiter = IngestionLimiter(rate=0, burst=100)
+
+    def tearDown(self):
+        (config.TASKPOOL_HIGH_WATERMARK, config.TASKPOOL_LOW_WATERMARK,
+         config.MAX_ASSIGNED_PER_WORKER) = self.settings
+
+    def add_worker(self, worker):
+        self.taskpool.workers.set_state(worker, 'worker', InstanceState(InstanceState.RUNNING))
+        self.taskpool.task_assignment[worker] = deque()
+        self.taskpool.task_processing[worker] = deque()
+
+    def test_watermarks(self):
+        tasks = [self.taskpool.add_task(str(index)) for index in range(10)]
+        self.assertFalse(self.taskpool.overloaded)
+        self.assertTrue(self.taskpool.update_overload())  # At the high watermark.
+        self.assertIsNone(self.taskpool.add_task('rejected'))
+
+        for _ in range(4):  # Between the watermarks the overload holds.
+            self.taskpool.table.release(self.taskpool.tasks.popleft())
+        self.assertEqual(6, self.taskpool.queue_depth())
+        self.assertTrue(self.taskpool.update_overload())
+
+        self.taskpool.table.release(self.taskpool.tasks.popleft())
+        self.assertFalse(self.taskpool.update_overload())  # Recovered at the low watermark.
+        self.assertIsNotNone(self.taskpool.add_task('accepted'))
+        self.assertEqual(10, len(tasks))
+
+    def test_overloaded_submit(self):
+        for index in range(10):
+            self.taskpool.add_task(str(index))
+        response = self.taskpool.process_command(submit('a'), None)
+        self.assertEqual('overloaded', response['command'])
+        self.assertEqual(config.OVERLOAD_RETRY_AFTER, response['retry_after'])
+        self.assertEqual(10, response['queue_depth'])
+
+    def test_heartbeat_queue_depth(self):
+        heartbeats = Heartbeats()
+        self.taskpool.add_listener(heartbeats)
+        self.add_worker('w1')
+        self.taskpool.limiter = IngestionLimiter(rate=0, burst=4)
+        for index in range(5):  # The last task is held back by the rate limit.
+            self.taskpool.add_task(str(index))
+        self.taskpool.assign_tasks()
+        self.taskpool.generate_heartbeat()
+        heartbeat = heartbeats.heartbeats[-1]
+        self.assertEqual(5, heartbeat['queue_depth'])  # Queued, assigned and held tasks.
+        self.assertFalse(heartbeat['overloaded'])
+
+    def test_max_assigned_per_worker(self):
+        self.add_worker('w1')
+        self.add_worker('w2')
+        for index in range(8):
+            self.taskpool.add_task(str(index))
+        self.taskpool.assign_tasks()
+        self.assertEqual([3, 3], [len(self.taskpool.task_assignment[worker])
+                                  for worker in ['w1', 'w2']])
+        self.assertEqual(2, len(self.taskpool.tasks))
+        self.assertEqual(6, self.taskpool.all_assigned_tasks)
+
+    def test_concurrent_uploads(self):
+        self.taskpool.table = self.taskpool.tasks.table = TaskTable(capacity=3)
+
+        def slow_register(task_data, key=None):
+            time.sleep(0.01)
+            return key
+        self.taskpool.register_task = slow_register
+
+        async def run():
+            # All uploads are in flight at the same time.
+            return await asyncio.gather(*[self.taskpool.add_task_async(str(index))
+                                          for index in range(5)])
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            tasks = loop.run_until_complete(run())
+        finally:
+            loop.close()
+        self.assertEqual(3, len([task for task in tasks if task is not None]))
+        self.assertEqual(3, len(self.taskpool.tasks))
+        self.assertEqual(0, self.taskpool.uploading)
+        self.assertTrue(self.taskpool.update_overload())
+
+
+class TestRecovery(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.scenario_file = config.SCENARIO_FILE
+        config.SCENARIO_FILE = os.path.join(self.directory, 'scenario.csv')
+        pd.DataFrame({'IP': ['10.0.0.1'] * 4, 'Input': ['a', 'b', 'c', 'd'],
+                      'Time': [0, 0, 5, 5]}).to_csv(config.SCENARIO_FILE, index=False)
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+    def tearDown(self):
+        config.SCENARIO_FILE = self.scenario_file
+        self.loop.close()
+        shutil.rmtree(self.directory)
+
+    def start(self):
+        journal = TaskJournal(os.path.join(self.directory, 'journal'))
+        taskpool = SimulatedTaskPool('node_manager', host='127.0.0.1', port=0,
+                                     resource_manager=None, journal=journal)
+        taskpool.limiter = IngestionLimiter(rate=0, burst=1)
+        taskpool.ring.add('node_manager')
+        taskpool.recover()
+        return taskpool
+
+    def test_restart(self):
+        taskpool = self.start()
+        taskpool.ingested = 2  # The first two rows were ingested: one added and one held.
+        added = taskpool.add_task('a', source='10.0.0.1')
+        self.assertIsNone(taskpool.add_task('b', source='10.0.0.1'))
+        taskpool._record('ingest', None, 2)
+        taskpool.journal.close()
+
+        restarted = self.start()
+        self.assertEqual([added], list(restarted.tasks))
+        self.assertEqual(['b'], [item[0] for item in restarted.limiter.backlog['10.0.0.1']])
+        self.assertEqual(2, restarted.ingested)
+
+        # Only the rows after the recovered position are ingested, without waiting for them.
+        start = time.time()
+        self.loop.run_until_complete(restarted.create_full_taskpool())
+        self.assertLess(time.time() - start, 3)
+        self.assertEqual(4, restarted.ingested)
+        self.assertEqual(['b', 'c', 'd'], [item[0] for item in
+                                           restarted.limiter.backlog['10.0.0.1']])
+        self.assertEqual(1, len(restarted.tasks))
+
+
+if __name__ == '__main__':
+    unittest.main()
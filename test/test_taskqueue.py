@@ -0,0 +1,103 @@
+import unittest
+from time import time
+
+from aws.nodemanager.taskqueue import TaskQueue, IngestionLimiter, ADMITTED, HELD, REJECTED
+
+
+class TestTaskQueue(unittest.TestCase):
+
+    def test_fifo_within_class(self):
+        queue = TaskQueue(weights={'bulk': 1})
+        for task in ['a', 'b', 'c']:
+            queue.append(task, priority='bulk')
+        self.assertEqual(['a', 'b', 'c'], [queue.popleft() for _ in range(3)])
+        self.assertFalse(queue)
+
+    def test_weighted_classes(self):
+        queue = TaskQueue(weights={'interactive': 3, 'bulk': 1})
+        for idx in range(8):
+            queue.append('bulk{}'.format(idx), priority='bulk')
+            queue.append('interactive{}'.format(idx), priority='interactive')
+        first = [queue.popleft() for _ in range(4)]
+        self.assertEqual(3, len([task for task in first if task.startswith('interactive')]))
+
+    def test_earliest_deadline_first(self):
+        queue = TaskQueue(weights={'bulk': 1})
+        queue.append('late', priority='bulk', deadline=time() + 100)
+        queue.append('none', priority='bulk')
+        queue.append('early', priority='bulk', deadline=time() + 50)
+        self.assertEqual(['early', 'late', 'none'], [queue.popleft() for _ in range(3)])
+
+    def test_urgent_deadline_overrides_weight(self):
+        queue = TaskQueue(weights={'interactive': 100, 'bulk': 1})
+        queue.append('interactive', priority='interactive')
+        queue.append('bulk', priority='bulk', deadline=time())
+        self.assertEqual('bulk', queue.popleft())
+
+    def test_requeue_in_front(self):
+        queue = TaskQueue(weights={'bulk': 1})
+        for task in ['a', 'b', 'c']:
+            queue.append(task, priority='bulk')
+        started = [queue.popleft(), queue.popleft()]
+        queue.requeue(started)
+        self.assertEqual(['a', 'b', 'c'], [queue.popleft() for _ in range(3)])
+
+    def test_urgency(self):
+        queue = TaskQueue(weights={'interactive': 3, 'bulk': 1})
+        queue.append('bulk', priority='bulk')
+        queue.append('interactive', priority='interactive')
+        self.assertLess(queue.urgency('interactive'), queue.urgency('bulk'))
+
+    def test_unknown_priority(self):
+        queue = TaskQueue(weights={'bulk': 1})
+        with self.assertRaises(ValueError):
+            queue.append('a', priority='interactive')
+
+    def test_fair_sources(self):
+        queue = TaskQueue(weights={'bulk': 1})
+        for idx in range(10):
+            queue.append('noisy{}'.format(idx), priority='bulk', source='10.0.0.1')
+        queue.append('quiet', priority='bulk', source='10.0.0.2')
+        first = [queue.popleft() for _ in range(2)]
+        self.assertIn('quiet', first)
+        self.assertEqual({'10.0.0.1': 9}, queue.source_depth())
+
+
+class TestIngestionLimiter(unittest.TestCase):
+
+    def test_burst_and_backlog(self):
+        limiter = IngestionLimiter(rate=0, burst=2)
+        admitted = [limiter.admit('a', idx) for idx in range(4)]
+        self.assertEqual([ADMITTED, ADMITTED, HELD, HELD], admitted)
+        self.assertEqual(ADMITTED, limiter.admit('b', 0))
+        self.assertEqual({'a': 2}, limiter.backlog_depth())
+        self.assertEqual([], limiter.release())
+
+    def test_max_backlog(self):
+        limiter = IngestionLimiter(rate=0, burst=1, max_backlog=2)
+        admitted = [limiter.admit('a', idx) for idx in range(4)]
+        self.assertEqual([ADMITTED, HELD, HELD, REJECTED], admitted)
+        self.assertEqual({'a': 2}, limiter.backlog_depth())
+
+    def test_release_limit(self):
+        limiter = IngestionLimiter(rate=1000, burst=1)
+        for idx in range(5):
+            limiter.admit('a', idx)
+        released = []
+        while limiter.backlog_depth().get('a', 0) > 2:
+            released += limiter.release(limit=1)
+        self.assertEqual([1, 2], released)
+        self.assertEqual([3, 4], list(limiter.backlog['a']))
+        self.assertEqual([], limiter.release(limit=0))
+
+    def test_release(self):
+        limiter = IngestionLimiter(rate=1000, burst=1)
+        limiter.admit('a', 0)
+        limiter.admit('a', 1)
+        while limiter.backlog:
+            released = limiter.release()
+        self.assertEqual([1], released)
+
+
+if __name__ == '__main__':
+    unittest.main()
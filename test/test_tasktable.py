@@ -0,0 +1,47 @@
+import unittest
+
+from aws.nodemanager.tasktable import TaskTable, TaskTableFull, NO_DEADLINE
+
+
+class TestTaskTable(unittest.TestCase):
+
+    def test_add_and_release(self):
+        table = TaskTable(capacity=2)
+        table.add('a', priority=1, deadline=10.0, source='10.0.0.1', enqueue=1.0)
+        table.set_time('a', 'assign', 2.0)
+        self.assertEqual(1.0, table.get_time('a', 'enqueue'))
+        self.assertEqual(2.0, table.get_time('a', 'assign'))
+        self.assertIsNone(table.get_time('a', 'done'))
+        self.assertEqual(1, table.get_priority('a'))
+        self.assertEqual(10.0, table.get_deadline('a'))
+        self.assertEqual('10.0.0.1', table.get_source('a'))
+        table.release('a')
+        self.assertNotIn('a', table)
+        self.assertEqual(NO_DEADLINE, table.get_deadline('a'))
+
+    def test_bounded(self):
+        table = TaskTable(capacity=2)
+        table.add('a')
+        table.add('b')
+        self.assertTrue(table.is_full())
+        with self.assertRaises(TaskTableFull):
+            table.add('c')
+        table.release('a')
+        table.add('c')
+        self.assertIsNone(table.get_time('c', 'assign'))
+
+    def test_flat_memory(self):
+        table = TaskTable(capacity=100)
+        for idx in range(50):
+            table.add('task{}'.format(idx))
+        for idx in range(50):
+            table.release('task{}'.format(idx))
+        footprint = table.memory_footprint()
+        for idx in range(1000):
+            table.add('other{}'.format(idx))
+            table.release('other{}'.format(idx))
+        self.assertLessEqual(table.memory_footprint(), footprint)
+
+
+if __name__ == '__main__':
+    unittest.main()
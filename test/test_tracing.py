@@ -0,0 +1,94 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from collections import deque
+
+from aws.nodemanager.tracing import STAGES, ClockOffsets, Tracer, read_traces, stage_histograms
+from aws.utils import clock
+from aws.utils.packets import CommandPacket, HeartBeatPacket
+from aws.utils.state import InstanceState
+from experiment.simulator import SimulatedTaskPool
+
+SKEW = 100.0  # Seconds the clock of the worker is ahead.
+
+
+class TestClockOffsets(unittest.TestCase):
+
+    def test_minimum_delay(self):
+        offsets = ClockOffsets(window=3)
+        self.assertEqual(0.0, offsets.get('w1'))
+        for sent, received in [(110.0, 10.5), (120.0, 20.1), (130.0, 30.3)]:
+            offsets.observe('w1', sent, received)
+        self.assertAlmostEqual(-99.9, offsets.get('w1'))
+
+
+class TestTracer(unittest.TestCase):
+
+    def setUp(self):
+        self.now = [1000.0]
+        clock.set_clock(lambda: self.now[0])
+        self.directory = tempfile.mkdtemp()
+        self.tracer = Tracer(path=os.path.join(self.directory, 'traces.jsonl'), sample_rate=1.0)
+        self.taskpool = SimulatedTaskPool('node_manager', host='127.0.0.1', port=0,
+                                          resource_manager=None, tracer=self.tracer)
+        self.taskpool.workers.set_state('w1', 'worker', InstanceState(InstanceState.RUNNING))
+        self.taskpool.task_assignment['w1'] = deque()
+        self.taskpool.task_processing['w1'] = deque()
+
+    def tearDown(self):
+        clock.set_clock(time.time)
+        shutil.rmtree(self.directory)
+
+    def heartbeat(self):
+        return HeartBeatPacket(instance_id='w1', instance_state=InstanceState.RUNNING,
+                               instance_type='worker', time=self.now[0] + SKEW + 0.01,
+                               cpu_usage=1.0, mem_usage=1.0, no_hb_task=True)
+
+    def test_trace(self):
+        task = self.taskpool.add_task('text', source='10.0.0.1')
+        self.now[0] += 2
+        self.taskpool.assign_tasks()
+        self.now[0] += 1
+        self.taskpool.process_heartbeat(self.heartbeat(), None)
+        packet = self.taskpool._next_task('w1', CommandPacket(command='done'))
+        self.assertEqual({'id': task}, packet['trace'])
+
+        worker_time = self.now[0] + SKEW + 0.5  # Received after half a second.
+        context = Tracer.worker_context(packet['trace'], received=worker_time,
+                                        spans=[(worker_time, worker_time + 1),
+                                               (worker_time + 1, worker_time + 1.5),
+                                               (worker_time + 1.5, worker_time + 3.5)],
+                                        sent=worker_time + 3.5)
+        self.now[0] += 4.02
+        self.taskpool.process_command(CommandPacket(
+            command='done', instance_id='w1', task=task, task_start=packet['time'],
+            time_to_download=1, run_time_task=3.5, trace=context, time=worker_time + 3.5), None)
+        self.tracer.flush()
+
+        traces = read_traces(self.tracer.path)
+        self.assertEqual(1, len(traces))
+        trace = traces[0]
+        self.assertEqual((task, 'w1', 1000.0), (trace['task'], trace['worker'], trace['arrival']))
+        expected = {'ingest': 0, 'upload': 0, 'queue': 2, 'assign': 1, 'dispatch': 0.49,
+                    'download': 1, 'tokenize': 0.5, 'inference': 2, 'report': 0.03}
+        for stage in STAGES:
+            self.assertAlmostEqual(expected[stage], trace[stage], places=5, msg=stage)
+
+    def test_sampling(self):
+        self.tracer.sample_rate = 0.0
+        self.taskpool.add_task('text', source='10.0.0.1')
+        self.taskpool.assign_tasks()
+        packet = self.taskpool._next_task('w1', CommandPacket(command='done'))
+        self.assertNotIn('trace', packet)
+
+    def test_histograms(self):
+        traces = [dict({stage: 0.01 * index for stage in STAGES}, task=str(index))
+                  for index in range(1, 101)]
+        traces.append(dict({stage: None for stage in STAGES}, queue=50.0, task='recovered'))
+        histograms = stage_histograms(traces, bins=[0.1, 1, 100])
+        self.assertEqual(101, histograms['queue']['count'])
+        self.assertEqual([10, 90, 1], histograms['queue']['histogram'])
+        self.assertEqual(100, histograms['total']['count'])
+        self.assertAlmostEqual(0.5, histograms['download']['p50'], places=1)
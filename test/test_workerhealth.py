@@ -0,0 +1,119 @@
+import time
+import unittest
+from collections import deque
+from types import SimpleNamespace
+
+from aws.instancemanager.instancemanager import Instances
+from aws.utils import clock, config
+from aws.utils.heartbeat import heartbeat_timeout
+from aws.utils.monitor import Listener
+from aws.utils.packets import HeartBeatPacket
+from aws.utils.state import InstanceState, ProgramState
+from experiment.simulator import SimulatedTaskPool
+
+try:
+    from aws.nodeworker.nodeworker import WorkerMonitor
+except ImportError:  # The worker needs TensorFlow.
+    WorkerMonitor = None
+
+
+def heartbeat(instance_id, **kwargs):
+    return HeartBeatPacket(instance_id=instance_id, instance_state='running',
+                           instance_type='worker', cpu_usage=1.0, mem_usage=2.0, **kwargs)
+
+
+class Heartbeats(Listener):
+
+    def __init__(self):
+        self.heartbeats = []
+
+    def event(self, message):
+        self.heartbeats.append(message)
+
+
+class TestNodeManagerSummary(unittest.TestCase):
+
+    def test_worker_health_in_heartbeat(self):
+        taskpool = SimulatedTaskPool('node_manager', host='127.0.0.1', port=0,
+                                     resource_manager=None)
+        listener = Heartbeats()
+        taskpool.add_listener(listener)
+        worker_heartbeat = heartbeat('i-1', program_state='PENDING', no_hb_task=False,
+                                     interval=3)
+        taskpool.process_heartbeat(worker_heartbeat, None)
+        taskpool.generate_heartbeat()
+        self.assertEqual({'i-1': [worker_heartbeat['time'], 'PENDING', 1.0, 2.0, 3]},
+                         listener.heartbeats[-1]['worker_health'])
+
+        taskpool.task_assignment['i-1'] = deque()
+        taskpool.task_processing['i-1'] = deque()
+        taskpool.remove_worker('i-1')
+        taskpool.generate_heartbeat()
+        self.assertEqual({}, listener.heartbeats[-1]['worker_health'])
+
+
+class TestInstanceManagerLiveness(unittest.TestCase):
+
+    def setUp(self):
+        self.now = [1000.0]
+        clock.set_clock(lambda: self.now[0])
+        self.instances = Instances()
+        self.instances.set_state('i-1', 'worker', InstanceState(InstanceState.RUNNING))
+
+    def tearDown(self):
+        clock.set_clock(time.time)
+
+    def test_update_worker_health(self):
+        self.instances.update_worker_health({'i-1': [995.0, 'PENDING', 1.0, 2.0, 3]}, interval=2)
+        self.assertEqual(995.0, self.instances.get_last_heartbeat('i-1'))
+        self.assertEqual(heartbeat_timeout(5), self.instances.get_heartbeat_timeout('i-1'))
+        self.assertEqual(995.0 + heartbeat_timeout(5), self.instances.heartbeat_deadline('i-1'))
+        self.assertIn('i-1', self.instances.charge_time)
+
+        # An older summary, e.g., of a node manager that lags behind, does not go back in time.
+        self.instances.update_worker_health({'i-1': [990.0, 'PENDING', 1.0, 2.0, 3]})
+        self.assertEqual(995.0, self.instances.get_last_heartbeat('i-1'))
+
+    def test_stale_entry_of_stopped_worker(self):
+        self.instances.update_worker_health({'i-1': [995.0, 'PENDING', 1.0, 2.0, 3]})
+        self.instances.set_state('i-1', 'worker', InstanceState(InstanceState.STOPPED))
+        self.instances.charge_time.pop('i-1')
+        self.instances.deadlines.remove('i-1')
+        # The node manager still reports the worker until it notices that it stopped.
+        self.instances.update_worker_health({'i-1': [998.0, 'PENDING', 1.0, 2.0, 3]})
+        self.assertNotIn('i-1', self.instances.charge_time)
+        self.assertNotIn('i-1', self.instances.deadlines)
+        self.assertEqual(995.0, self.instances.get_last_heartbeat('i-1'))
+
+    def test_unknown_worker(self):
+        self.instances.update_worker_health({'i-2': [995.0, 'PENDING', 1.0, 2.0]})
+        self.assertIsNone(self.instances.get_last_heartbeat('i-2'))
+
+
+@unittest.skipIf(WorkerMonitor is None, "The worker dependencies are not installed.")
+class TestDirectHeartbeat(unittest.TestCase):
+
+    def setUp(self):
+        self.settings = (config.HEARTBEAT_AGGREGATION, config.HEARTBEAT_FALLBACK_RATIO)
+        config.HEARTBEAT_AGGREGATION, config.HEARTBEAT_FALLBACK_RATIO = True, 3
+        self.core = SimpleNamespace(connection_lost=False)
+        self.monitor = WorkerMonitor('127.0.0.1', 0, self.core)
+
+    def tearDown(self):
+        config.HEARTBEAT_AGGREGATION, config.HEARTBEAT_FALLBACK_RATIO = self.settings
+
+    def send(self, **kwargs):
+        self.monitor.event(heartbeat('i-1', **kwargs))
+        return len(self.monitor.send_buffer.drain())
+
+    def test_fallback_ratio(self):
+        self.assertEqual([0, 0, 1, 0, 0, 1], [self.send() for _ in range(6)])
+
+    def test_node_manager_lost(self):
+        self.core.connection_lost = True
+        self.core.last_exception, self.core.last_trace = 'error', 'trace'
+        self.assertEqual(1, self.send())
+
+    def test_error(self):
+        self.assertEqual(1, self.send(program_state=str(ProgramState(ProgramState.ERROR))))
+        self.assertEqual(1, self.send(args={'exc': 'error'}))